@@ -3,11 +3,79 @@
 """
 import json
 import os
+import time
 import jwt
 import bcrypt
 import psycopg2
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -58,7 +126,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     # Подключение к БД
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -71,7 +139,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         if not result:
             cursor.close()
-            conn.close()
+            release_db_connection(conn)
             return {
                 'statusCode': 401,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -91,7 +159,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         if not password_check:
             cursor.close()
-            conn.close()
+            release_db_connection(conn)
             return {
                 'statusCode': 401,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -121,4 +189,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
@@ -3,9 +3,77 @@
 """
 import json
 import os
+import time
 import bcrypt
 import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
 
 CORS_HEADERS = {
     'Access-Control-Allow-Origin': '*',
@@ -34,7 +102,7 @@ def verify_admin(headers: dict) -> bool:
         username = payload.get('username', '')
         if not username:
             return False
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_db_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT role FROM admin_users WHERE username = %s", (username,))
@@ -42,7 +110,7 @@ def verify_admin(headers: dict) -> bool:
             return bool(row and row[0] == 'admin')
         finally:
             cursor.close()
-            conn.close()
+            release_db_connection(conn)
     except Exception:
         return False
 
@@ -66,7 +134,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if method == 'GET':
         if not verify_admin(headers):
             return {'statusCode': 403, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Forbidden'})}
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_db_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT id, username, role FROM admin_users ORDER BY id")
@@ -75,7 +143,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps(users)}
         finally:
             cursor.close()
-            conn.close()
+            release_db_connection(conn)
 
     # DELETE — удалить менеджера (только admin, нельзя удалить себя)
     if method == 'DELETE':
@@ -85,7 +153,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         user_id = body.get('id')
         if not user_id:
             return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'id обязателен'})}
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_db_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT role FROM admin_users WHERE id = %s", (user_id,))
@@ -99,7 +167,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'ok': True})}
         finally:
             cursor.close()
-            conn.close()
+            release_db_connection(conn)
 
     if method != 'POST':
         return {'statusCode': 405, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Method not allowed'})}
@@ -118,7 +186,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'username и password обязательны'})}
         if len(password) < 6:
             return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'Пароль минимум 6 символов'})}
-        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        conn = get_db_connection()
         cursor = conn.cursor()
         try:
             cursor.execute("SELECT id FROM admin_users WHERE username = %s", (username,))
@@ -131,7 +199,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             return {'statusCode': 201, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'ok': True, 'id': new_id})}
         finally:
             cursor.close()
-            conn.close()
+            release_db_connection(conn)
 
     # POST action=change_password — смена пароля (любой авторизованный пользователь)
     current_username = body_data.get('current_username', '')
@@ -146,7 +214,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if new_password and len(new_password) < 8:
         return {'statusCode': 400, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'error': 'New password must be at least 8 characters'})}
 
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn = get_db_connection()
     cursor = conn.cursor()
     try:
         cursor.execute("SELECT id, username, password_hash FROM admin_users WHERE username = %s", (current_username,))
@@ -168,4 +236,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return {'statusCode': 200, 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}, 'body': json.dumps({'success': True, 'new_username': update_username})}
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
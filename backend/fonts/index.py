@@ -1,15 +1,128 @@
+import gzip
 import json
 import os
+import time
 import base64
 import psycopg2
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional, Tuple
 
-def get_db_connection():
-    '''Подключение к PostgreSQL через DATABASE_URL'''
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
     dsn = os.environ.get('DATABASE_URL')
     if not dsn:
         raise Exception('DATABASE_URL not set')
-    return psycopg2.connect(dsn)
+    try:
+        conn = psycopg2.connect(dsn)
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(dsn)
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    '''br или gzip из Accept-Encoding (br — только если установлен brotli); q=0 отключает кодировку'''
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'accept-encoding'), '') or ''
+    accepted = set()
+    for part in value.split(','):
+        name, _, quality = part.partition(';')
+        quality = quality.strip()
+        try:
+            weight = float(quality[2:]) if quality.startswith('q=') else 1.0
+        except ValueError:
+            weight = 1.0
+        if weight > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''
+    Сжатие текстового тела от COMPRESS_MIN_BYTES под Accept-Encoding клиента; тело уходит в base64.
+    variants — сжатые формы этого же тела из кэша ответов, пополняются при первом сжатии.
+    '''
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return {**response, 'headers': {**response['headers'], 'Vary': 'Accept-Encoding'}}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        data = body.encode('utf-8')
+        packed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+        encoded = base64.b64encode(packed).decode('ascii')
+        if variants is not None:
+            variants[encoding] = encoded
+    headers = {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
 
 def handler(event: dict, context: Any) -> Dict[str, Any]:
     '''API для управления шрифтами в конструкторе'''
@@ -33,7 +146,7 @@ def handler(event: dict, context: Any) -> Dict[str, Any]:
     try:
         if method == 'GET':
             fonts = list_fonts()
-            return {
+            return compress_response(event, {
                 'statusCode': 200,
                 'headers': {
                     'Content-Type': 'application/json',
@@ -41,7 +154,7 @@ def handler(event: dict, context: Any) -> Dict[str, Any]:
                 },
                 'body': json.dumps(fonts),
                 'isBase64Encoded': False
-            }
+            })
         
         if method == 'POST':
             if not auth_token:
@@ -76,7 +189,7 @@ def handler(event: dict, context: Any) -> Dict[str, Any]:
             font_id = cur.fetchone()[0]
             conn.commit()
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             
             return {
                 'statusCode': 200,
@@ -117,7 +230,7 @@ def handler(event: dict, context: Any) -> Dict[str, Any]:
             cur.execute("DELETE FROM fonts WHERE filename = %s", (filename,))
             conn.commit()
             cur.close()
-            conn.close()
+            release_db_connection(conn)
             
             return {
                 'statusCode': 200,
@@ -159,7 +272,7 @@ def list_fonts():
         cur.execute("SELECT id, filename, display_name, font_data FROM fonts ORDER BY id")
         rows = cur.fetchall()
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         fonts = []
         for row in rows:
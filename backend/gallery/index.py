@@ -1,8 +1,218 @@
 """API для управления галереей изображений на главной странице сайта"""
 
+import base64
+import hashlib
+import gzip
 import json
 import os
+import time
+from collections import OrderedDict
 import psycopg2
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '64'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
+
+def get_catalog_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> Optional[str]:
+    '''ETag из счётчиков версий таблиц и параметров запроса, без чтения самих строк'''
+    cur.execute(
+        "SELECT table_name, version FROM catalog_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    rows = cur.fetchall()
+    if len(rows) != len(tables):
+        return None
+    stamp = ';'.join(f'{name}:{version}' for name, version in rows)
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    return '"' + hashlib.md5(f'{stamp}|{query}'.encode('utf-8')).hexdigest()[:20] + '"'
+
+def bump_catalog_version(cur, *tables: str) -> None:
+    '''Увеличение счётчиков версий в транзакции записи'''
+    cur.execute(
+        """
+        INSERT INTO catalog_versions (table_name) SELECT unnest(%s::text[])
+        ON CONFLICT (table_name) DO UPDATE SET version = catalog_versions.version + 1, updated_at = NOW()
+        """,
+        (list(tables),)
+    )
+
+def etag_matches(event: Dict[str, Any], etag: Optional[str]) -> bool:
+    if not etag:
+        return False
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), '') or ''
+    tags = [tag.strip().removeprefix('W/') for tag in value.split(',')]
+    return etag in tags or '*' in tags
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'body': ''
+    }
+
+def with_etag(response: Dict[str, Any], etag: Optional[str]) -> Dict[str, Any]:
+    if etag and response['statusCode'] == 200:
+        response['headers'] = {**response['headers'], 'ETag': etag, 'Cache-Control': 'no-cache'}
+    return response
+
+# Кэш готовых GET-ответов: ключ — раздел и нормализованные параметры, LRU по CACHE_MAX_ENTRIES.
+# Рядом с ответом хранятся его сжатые формы по кодировке (base64)
+_response_cache: 'OrderedDict[str, Tuple[float, Dict[str, Any], Dict[str, str]]]' = OrderedDict()
+_cache_stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    '''br или gzip из Accept-Encoding (br — только если установлен brotli); q=0 отключает кодировку'''
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'accept-encoding'), '') or ''
+    accepted = set()
+    for part in value.split(','):
+        name, _, quality = part.partition(';')
+        quality = quality.strip()
+        try:
+            weight = float(quality[2:]) if quality.startswith('q=') else 1.0
+        except ValueError:
+            weight = 1.0
+        if weight > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''
+    Сжатие текстового тела от COMPRESS_MIN_BYTES под Accept-Encoding клиента; тело уходит в base64.
+    variants — сжатые формы этого же тела из кэша ответов, пополняются при первом сжатии.
+    '''
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return {**response, 'headers': {**response['headers'], 'Vary': 'Accept-Encoding'}}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        data = body.encode('utf-8')
+        packed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+        encoded = base64.b64encode(packed).decode('ascii')
+        if variants is not None:
+            variants[encoding] = encoded
+    headers = {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def cache_key(scope: str, params: Dict[str, Any]) -> str:
+    return scope + '?' + '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+def cache_get(key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+    '''Ответ и его сжатые формы из кэша, если запись моложе CACHE_TTL; считает попадания и промахи'''
+    entry = _response_cache.get(key)
+    if entry and time.monotonic() - entry[0] <= CACHE_TTL:
+        _response_cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return entry[1], entry[2]
+    _response_cache.pop(key, None)
+    _cache_stats['misses'] += 1
+    return None
+
+def cache_put(key: str, response: Dict[str, Any]) -> Dict[str, str]:
+    '''Сохранение ответа; возвращает словарь для его сжатых форм (вне кэша — одноразовый)'''
+    variants: Dict[str, str] = {}
+    if response['statusCode'] == 200 and CACHE_MAX_ENTRIES > 0:
+        _response_cache[key] = (time.monotonic(), response, variants)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+    return variants
+
+def cache_invalidate(scope: str) -> None:
+    '''Сброс всех записей раздела; вызывается после commit в его таблицы'''
+    for key in [key for key in _response_cache if key.startswith(scope + '?')]:
+        del _response_cache[key]
+
+def with_cache_status(response: Dict[str, Any], hit: bool) -> Dict[str, Any]:
+    '''Копия ответа с X-Cache и накопленной статистикой попаданий этого инстанса'''
+    stats = f"hits={_cache_stats['hits']}; misses={_cache_stats['misses']}"
+    return {**response, 'headers': {**response['headers'], 'X-Cache': 'HIT' if hit else 'MISS', 'X-Cache-Stats': stats}}
+
+def cached_response(event: Dict[str, Any], response: Dict[str, Any], variants: Dict[str, str]) -> Dict[str, Any]:
+    etag = response['headers'].get('ETag')
+    if etag_matches(event, etag):
+        return not_modified_response(etag)
+    return compress_response(event, with_cache_status(response, True), variants)
 
 def handler(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
@@ -12,21 +222,30 @@ def handler(event: dict, context) -> dict:
         'Content-Type': 'application/json',
         'Access-Control-Allow-Origin': '*',
         'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-        'Access-Control-Allow-Headers': 'Content-Type'
+        'Access-Control-Allow-Headers': 'Content-Type, If-None-Match'
     }
     
     # OPTIONS request
     if method == 'OPTIONS':
         return {'statusCode': 200, 'headers': headers, 'body': ''}
     
-    # Подключение к БД
-    db_url = os.environ['DATABASE_URL']
+    # Галерея меняется редко: кэш отвечает без похода в базу
+    if method == 'GET':
+        cached = cache_get(cache_key('gallery', event.get('queryStringParameters') or {}))
+        if cached:
+            return cached_response(event, *cached)
     
+    # Соединение возвращается в пул в finally при любом выходе, в том числе при ранних 400
+    conn = cur = None
     try:
-        conn = psycopg2.connect(db_url)
+        conn = get_db_connection()
         cur = conn.cursor()
         
         if method == 'GET':
+            etag = get_catalog_etag(cur, ('gallery_items',), event.get('queryStringParameters') or {})
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+            
             # Получение всех элементов галереи
             cur.execute("""
                 SELECT item_id, type, url, title, description, display_order
@@ -46,14 +265,13 @@ def handler(event: dict, context) -> dict:
                     'display_order': row[5]
                 })
             
-            cur.close()
-            conn.close()
-            
-            return {
+            response = with_etag({
                 'statusCode': 200,
                 'headers': headers,
                 'body': json.dumps(items)
-            }
+            }, etag)
+            variants = cache_put(cache_key('gallery', event.get('queryStringParameters') or {}), response)
+            return compress_response(event, with_cache_status(response, False), variants)
         
         elif method == 'POST':
             # Добавление нового элемента
@@ -85,9 +303,9 @@ def handler(event: dict, context) -> dict:
                 RETURNING item_id
             """, (item_id, item_type, url, title, desc, display_order))
             
+            bump_catalog_version(cur, 'gallery_items')
             conn.commit()
-            cur.close()
-            conn.close()
+            cache_invalidate('gallery')
             
             return {
                 'statusCode': 201,
@@ -124,9 +342,9 @@ def handler(event: dict, context) -> dict:
                     item.get('display_order', 0)
                 ))
             
+            bump_catalog_version(cur, 'gallery_items')
             conn.commit()
-            cur.close()
-            conn.close()
+            cache_invalidate('gallery')
             
             return {
                 'statusCode': 200,
@@ -147,9 +365,9 @@ def handler(event: dict, context) -> dict:
                 }
             
             cur.execute("DELETE FROM gallery_items WHERE item_id = %s", (item_id,))
+            bump_catalog_version(cur, 'gallery_items')
             conn.commit()
-            cur.close()
-            conn.close()
+            cache_invalidate('gallery')
             
             return {
                 'statusCode': 200,
@@ -165,11 +383,14 @@ def handler(event: dict, context) -> dict:
             }
     
     except Exception as e:
-        if 'conn' in locals():
-            conn.close()
-        
         return {
             'statusCode': 500,
             'headers': headers,
             'body': json.dumps({'error': str(e)})
-        }
\ No newline at end of file
+        }
+    
+    finally:
+        if cur is not None:
+            cur.close()
+        if conn is not None:
+            release_db_connection(conn)
\ No newline at end of file
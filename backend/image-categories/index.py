@@ -1,11 +1,444 @@
 """
 Функция управления категориями изображений и изображениями для конструктора.
-Поддерживает теги для изображений.
+Поддерживает теги для изображений и спрайт-атласы превью категории (type=atlas).
 """
+import base64
+import hashlib
+import gzip
 import json
 import os
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from io import BytesIO
 import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '64'))
+
+# Спрайт-атласы: превью категории (клетка ATLAS_CELL, как у thumbnailUrl в конструкторе) упаковываются
+# полками в листы до ATLAS_SHEET_SIZE. Превью каждой картинки кэшируется в бакете по URL, лист — по
+# содержимому, карта координат — по подписи набора картинок, поэтому после добавления или удаления
+# картинки заново скачиваются только новые. Сборка ограничена ATLAS_BUILD_BUDGET секунд на запрос: не
+# успевшие превью и временные сбои origin попадают в pending, такая карта не сохраняется, и следующие запросы
+# докачивают остальное. Постоянно битые картинки (data:, 4xx, не картинка) — в missing: карта с ними
+# сохраняется и пересобирается не чаще раза в ATLAS_MISSING_RECHECK секунд
+S3_ENDPOINT = 'https://bucket.poehali.dev'
+S3_BUCKET = 'files'
+ATLAS_PREFIX = 'atlases/'
+ATLAS_VERSION = 1
+ATLAS_CELL = 160
+ATLAS_SHEET_SIZE = 2048
+ATLAS_PADDING = 2
+ATLAS_FETCH_WORKERS = 8
+ATLAS_FETCH_TIMEOUT = 10
+ATLAS_FETCH_MAX_BYTES = 20 * 1024 * 1024
+ATLAS_MANIFESTS_MAX = 64
+ATLAS_BUILD_BUDGET = float(os.environ.get('ATLAS_BUILD_BUDGET', '8'))
+ATLAS_MISSING_RECHECK = 24 * 3600
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+_s3: Dict[str, Any] = {}
+_atlas_manifests: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
+
+def get_catalog_etag(cur, tables: Tuple[str, ...], params: Dict[str, Any]) -> Optional[str]:
+    '''ETag из счётчиков версий таблиц и параметров запроса, без чтения самих строк'''
+    cur.execute(
+        "SELECT table_name, version FROM catalog_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    rows = cur.fetchall()
+    if len(rows) != len(tables):
+        return None
+    stamp = ';'.join(f'{name}:{version}' for name, version in rows)
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    return '"' + hashlib.md5(f'{stamp}|{query}'.encode('utf-8')).hexdigest()[:20] + '"'
+
+def bump_catalog_version(cur, *tables: str) -> None:
+    '''Увеличение счётчиков версий в транзакции записи'''
+    cur.execute(
+        """
+        INSERT INTO catalog_versions (table_name) SELECT unnest(%s::text[])
+        ON CONFLICT (table_name) DO UPDATE SET version = catalog_versions.version + 1, updated_at = NOW()
+        """,
+        (list(tables),)
+    )
+
+def etag_matches(event: Dict[str, Any], etag: Optional[str]) -> bool:
+    if not etag:
+        return False
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), '') or ''
+    tags = [tag.strip().removeprefix('W/') for tag in value.split(',')]
+    return etag in tags or '*' in tags
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def with_etag(response: Dict[str, Any], etag: Optional[str]) -> Dict[str, Any]:
+    if etag and response['statusCode'] == 200:
+        response['headers'] = {**response['headers'], 'ETag': etag, 'Cache-Control': 'no-cache'}
+    return response
+
+# Кэш готовых GET-ответов: ключ — раздел и нормализованные параметры, LRU по CACHE_MAX_ENTRIES.
+# Рядом с ответом хранятся его сжатые формы по кодировке (base64)
+_response_cache: 'OrderedDict[str, Tuple[float, Dict[str, Any], Dict[str, str]]]' = OrderedDict()
+_cache_stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    '''br или gzip из Accept-Encoding (br — только если установлен brotli); q=0 отключает кодировку'''
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'accept-encoding'), '') or ''
+    accepted = set()
+    for part in value.split(','):
+        name, _, quality = part.partition(';')
+        quality = quality.strip()
+        try:
+            weight = float(quality[2:]) if quality.startswith('q=') else 1.0
+        except ValueError:
+            weight = 1.0
+        if weight > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''
+    Сжатие текстового тела от COMPRESS_MIN_BYTES под Accept-Encoding клиента; тело уходит в base64.
+    variants — сжатые формы этого же тела из кэша ответов, пополняются при первом сжатии.
+    '''
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return {**response, 'headers': {**response['headers'], 'Vary': 'Accept-Encoding'}}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        data = body.encode('utf-8')
+        packed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+        encoded = base64.b64encode(packed).decode('ascii')
+        if variants is not None:
+            variants[encoding] = encoded
+    headers = {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def cache_key(scope: str, params: Dict[str, Any]) -> str:
+    return scope + '?' + '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+def cache_get(key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+    '''Ответ и его сжатые формы из кэша, если запись моложе CACHE_TTL; считает попадания и промахи'''
+    entry = _response_cache.get(key)
+    if entry and time.monotonic() - entry[0] <= CACHE_TTL:
+        _response_cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return entry[1], entry[2]
+    _response_cache.pop(key, None)
+    _cache_stats['misses'] += 1
+    return None
+
+def cache_put(key: str, response: Dict[str, Any]) -> Dict[str, str]:
+    '''Сохранение ответа; возвращает словарь для его сжатых форм (вне кэша — одноразовый)'''
+    variants: Dict[str, str] = {}
+    if response['statusCode'] == 200 and CACHE_MAX_ENTRIES > 0:
+        _response_cache[key] = (time.monotonic(), response, variants)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+    return variants
+
+def cache_invalidate(scope: str) -> None:
+    '''Сброс всех записей раздела; вызывается после commit в его таблицы'''
+    for key in [key for key in _response_cache if key.startswith(scope + '?')]:
+        del _response_cache[key]
+
+def with_cache_status(response: Dict[str, Any], hit: bool) -> Dict[str, Any]:
+    '''Копия ответа с X-Cache и накопленной статистикой попаданий этого инстанса'''
+    stats = f"hits={_cache_stats['hits']}; misses={_cache_stats['misses']}"
+    return {**response, 'headers': {**response['headers'], 'X-Cache': 'HIT' if hit else 'MISS', 'X-Cache-Stats': stats}}
+
+def cached_response(event: Dict[str, Any], response: Dict[str, Any], variants: Dict[str, str]) -> Dict[str, Any]:
+    etag = response['headers'].get('ETag')
+    if etag_matches(event, etag):
+        return not_modified_response(etag)
+    return compress_response(event, with_cache_status(response, True), variants)
+
+
+def atlas_available() -> bool:
+    return boto3 is not None and Image is not None and bool(os.environ.get('AWS_ACCESS_KEY_ID'))
+
+
+def s3_client():
+    if 'client' not in _s3:
+        _s3['client'] = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT,
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+        )
+    return _s3['client']
+
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID')}/bucket/{key}"
+
+
+def s3_read(key: str) -> Optional[bytes]:
+    try:
+        return s3_client().get_object(Bucket=S3_BUCKET, Key=key)['Body'].read()
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+def s3_write(key: str, data: bytes, content_type: str) -> None:
+    s3_client().put_object(Bucket=S3_BUCKET, Key=key, Body=data, ContentType=content_type,
+                           CacheControl='public, max-age=31536000, immutable')
+
+
+def atlas_tile(image_url: str) -> Optional[Any]:
+    '''
+    Превью картинки в клетке ATLAS_CELL (RGBA): из бакета или скачивается и уменьшается один раз.
+    None — картинку не получить никогда (не http, 4xx, слишком большая, не декодируется);
+    временные сбои (таймаут, сеть, 5xx, бакет) пробрасываются исключением
+    '''
+    key = f"{ATLAS_PREFIX}tiles/{hashlib.sha256(f'{image_url}|{ATLAS_CELL}'.encode('utf-8')).hexdigest()}.png"
+    cached = s3_read(key)
+    if cached is not None:
+        return Image.open(BytesIO(cached)).convert('RGBA')
+    if not image_url.startswith(('http://', 'https://')):
+        return None
+    try:
+        with urllib.request.urlopen(image_url, timeout=ATLAS_FETCH_TIMEOUT) as response:
+            data = response.read(ATLAS_FETCH_MAX_BYTES + 1)
+    except urllib.error.HTTPError as e:
+        if e.code in (408, 429) or e.code >= 500:
+            raise
+        print(f'Atlas tile for {image_url} failed: HTTP {e.code}')
+        return None
+    if len(data) > ATLAS_FETCH_MAX_BYTES:
+        return None
+    try:
+        img = Image.open(BytesIO(data))
+        if img.format == 'JPEG':
+            img.draft('RGB', (ATLAS_CELL, ATLAS_CELL))
+        img = ImageOps.exif_transpose(img).convert('RGBA')
+        img.thumbnail((ATLAS_CELL, ATLAS_CELL), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    except Exception as e:
+        print(f'Atlas tile for {image_url} failed: {e}')
+        return None
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    s3_write(key, buffer.getvalue(), 'image/png')
+    return img
+
+
+def pack_sprites(sizes: List[Tuple[int, int, int]], sheet_size: int = ATLAS_SHEET_SIZE,
+                 padding: int = ATLAS_PADDING) -> Tuple[Dict[int, Tuple[int, int, int]], List[Tuple[int, int]]]:
+    '''
+    Упаковка полками (First-Fit Decreasing Height): прямоугольники по убыванию высоты в первую полку, где хватает
+    ширины, иначе новая полка или новый лист. sizes — (id, w, h); результат — id -> (лист, x, y) и размеры листов,
+    обрезанные по занятой области. padding между спрайтами — чтобы при масштабировании не подмешивались соседи
+    '''
+    placements: Dict[int, Tuple[int, int, int]] = {}
+    sheets: List[Dict[str, Any]] = []
+    for item_id, width, height in sorted(sizes, key=lambda item: (-item[2], -item[1], item[0])):
+        w, h = width + padding, height + padding
+        target = None
+        for index, sheet in enumerate(sheets):
+            for shelf in sheet['shelves']:
+                if h <= shelf['height'] and shelf['x'] + w <= sheet_size:
+                    target = (index, shelf)
+                    break
+            if target is None and sheet['bottom'] + h <= sheet_size:
+                shelf = {'y': sheet['bottom'], 'height': h, 'x': 0}
+                sheet['shelves'].append(shelf)
+                sheet['bottom'] += h
+                target = (index, shelf)
+            if target:
+                break
+        if target is None:
+            sheets.append({'shelves': [{'y': 0, 'height': h, 'x': 0}], 'bottom': h, 'right': 0})
+            target = (len(sheets) - 1, sheets[-1]['shelves'][0])
+        index, shelf = target
+        placements[item_id] = (index, shelf['x'], shelf['y'])
+        shelf['x'] += w
+        sheets[index]['right'] = max(sheets[index]['right'], shelf['x'])
+    return placements, [(sheet['right'] - padding, sheet['bottom'] - padding) for sheet in sheets]
+
+
+def build_atlas(category_id: int, rows: List[Tuple[int, str]], signature: str) -> Dict[str, Any]:
+    '''
+    Листы и карта из превью, готовых за ATLAS_BUILD_BUDGET секунд. Не начатые загрузки отменяются, начатые
+    дописывают превью в бакет уже после ответа — их подхватит следующий запрос.
+    '''
+    pool = ThreadPoolExecutor(max_workers=ATLAS_FETCH_WORKERS)
+    futures = {row[0]: pool.submit(atlas_tile, row[1]) for row in rows}
+    wait(futures.values(), timeout=ATLAS_BUILD_BUDGET)
+    pool.shutdown(wait=False, cancel_futures=True)
+    tiles = {}
+    pending = []
+    for image_id, future in futures.items():
+        if not future.done() or future.cancelled():
+            pending.append(image_id)
+        elif future.exception() is not None:
+            print(f'Atlas tile for image {image_id} will be retried: {future.exception()}')
+            pending.append(image_id)
+        else:
+            tiles[image_id] = future.result()
+    ready = {image_id: tile for image_id, tile in tiles.items() if tile is not None}
+    placements, sheet_sizes = pack_sprites([(image_id, tile.width, tile.height) for image_id, tile in ready.items()])
+
+    canvases = [Image.new('RGBA', size, (0, 0, 0, 0)) for size in sheet_sizes]
+    sprites = {}
+    for image_id, (index, x, y) in placements.items():
+        tile = ready[image_id]
+        canvases[index].paste(tile, (x, y))
+        sprites[str(image_id)] = {'sheet': index, 'x': x, 'y': y, 'w': tile.width, 'h': tile.height}
+    sheets = []
+    for canvas in canvases:
+        buffer = BytesIO()
+        canvas.save(buffer, format='WEBP', quality=90, method=4)
+        data = buffer.getvalue()
+        key = f'{ATLAS_PREFIX}sheets/{hashlib.sha256(data).hexdigest()}.webp'
+        s3_write(key, data, 'image/webp')
+        sheets.append({'url': cdn_url(key), 'width': canvas.width, 'height': canvas.height})
+    return {
+        'category_id': category_id,
+        'signature': signature,
+        'cell': ATLAS_CELL,
+        'sheets': sheets,
+        'sprites': sprites,
+        'missing': sorted(image_id for image_id in tiles if image_id not in ready),
+        'pending': sorted(pending),
+        'built_at': int(time.time())
+    }
+
+
+def category_atlas_rows(cursor, category_id: int) -> List[Tuple[int, str]]:
+    cursor.execute("SELECT id, image_url FROM category_images WHERE category_id = %s ORDER BY id", (category_id,))
+    return [(row[0], row[1]) for row in cursor.fetchall() if row[1]]
+
+
+def category_atlas(category_id: int, rows: List[Tuple[int, str]]) -> Dict[str, Any]:
+    '''
+    Карта атласа категории: из памяти инстанса, из бакета или собирается заново при изменении набора картинок.
+    Карта с missing старше ATLAS_MISSING_RECHECK собирается заново: вдруг битые картинки починили на origin
+    '''
+    payload = json.dumps({'version': ATLAS_VERSION, 'cell': ATLAS_CELL, 'images': rows})
+    signature = hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    key = f'{ATLAS_PREFIX}category-{category_id}/{signature}.json'
+    manifest = _atlas_manifests.get(signature)
+    if manifest is None:
+        stored = s3_read(key)
+        manifest = json.loads(stored) if stored is not None else None
+    stale = manifest is not None and manifest['missing'] and time.time() - manifest.get('built_at', 0) > ATLAS_MISSING_RECHECK
+    if manifest is not None and not stale:
+        _atlas_manifests[signature] = manifest
+        _atlas_manifests.move_to_end(signature)
+        return manifest
+
+    manifest = build_atlas(category_id, rows, signature)
+    # Не уложились в бюджет или origin временно недоступен: карта не сохраняется, следующий запрос докачает
+    if manifest['pending']:
+        return manifest
+    s3_write(key, json.dumps(manifest).encode('utf-8'), 'application/json')
+    _atlas_manifests[signature] = manifest
+    while len(_atlas_manifests) > ATLAS_MANIFESTS_MAX:
+        _atlas_manifests.popitem(last=False)
+    return manifest
 
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -23,14 +456,20 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    # Список категорий почти не меняется: кэш отвечает без похода в базу
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('type', 'categories') == 'categories':
+        cached = cache_get(cache_key('categories', event.get('queryStringParameters') or {}))
+        if cached:
+            return cached_response(event, *cached)
+    
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     try:
@@ -39,6 +478,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         # GET - получение данных
         if method == 'GET':
+            tables = ('image_categories',) if query_type == 'categories' else ('category_images', 'image_categories')
+            etag = get_catalog_etag(cursor, tables, params)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
+            
             if query_type == 'categories':
                 # Получить все категории
                 cursor.execute("""
@@ -57,12 +501,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'created_at': row[5].isoformat() if row[5] else None
                     })
                 
-                return {
+                response = with_etag({
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'body': json.dumps(categories),
                     'isBase64Encoded': False
-                }
+                }, etag)
+                variants = cache_put(cache_key('categories', params), response)
+                return compress_response(event, with_cache_status(response, False), variants)
             
             elif query_type == 'images':
                 # Получить изображения (все или по категории, с фильтром по тегу)
@@ -118,12 +564,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'tags': list(row[7]) if row[7] else []
                     })
                 
-                return {
+                return compress_response(event, with_etag({
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
                     'body': json.dumps(images),
                     'isBase64Encoded': False
-                }
+                }, etag))
+            
+            elif query_type == 'atlas':
+                # Спрайт-атлас превью категории: один-два листа вместо запроса на каждую картинку
+                category_id = params.get('category_id')
+                if not category_id or not str(category_id).isdigit():
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'category_id is required'}),
+                        'isBase64Encoded': False
+                    }
+                if not atlas_available():
+                    return {
+                        'statusCode': 503,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Atlas storage is not configured'}),
+                        'isBase64Encoded': False
+                    }
+                rows = category_atlas_rows(cursor, int(category_id))
+                # Сборка качает превью дольше, чем нужен запрос к базе: соединение возвращается в пул сразу
+                # (повторный release в finally ничего не делает)
+                cursor.close()
+                release_db_connection(conn)
+                manifest = category_atlas(int(category_id), rows)
+                complete = not manifest.get('pending')
+                return compress_response(event, with_etag({
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps(manifest),
+                    'isBase64Encoded': False
+                }, etag if complete else None))
         
         # POST - создание
         elif method == 'POST':
@@ -151,7 +628,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 """, (name, slug, description, sort_order))
                 
                 category_id = cursor.fetchone()[0]
+                bump_catalog_version(cursor, 'image_categories')
                 conn.commit()
+                cache_invalidate('categories')
                 
                 return {
                     'statusCode': 201,
@@ -183,6 +662,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 """, (category_id, name, image_url, sort_order, tags))
                 
                 image_id = cursor.fetchone()[0]
+                bump_catalog_version(cursor, 'category_images')
                 conn.commit()
                 
                 return {
@@ -218,7 +698,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     WHERE id = %s
                 """, (name, slug, description, sort_order, category_id))
                 
+                bump_catalog_version(cursor, 'image_categories')
                 conn.commit()
+                cache_invalidate('categories')
                 
                 return {
                     'statusCode': 200,
@@ -250,6 +732,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     WHERE id = %s
                 """, (category_id, name, image_url, sort_order, tags, image_id))
                 
+                bump_catalog_version(cursor, 'category_images')
                 conn.commit()
                 
                 return {
@@ -274,7 +757,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 
                 cursor.execute("DELETE FROM category_images WHERE category_id = %s", (category_id,))
                 cursor.execute("DELETE FROM image_categories WHERE id = %s", (category_id,))
+                bump_catalog_version(cursor, 'image_categories', 'category_images')
                 conn.commit()
+                cache_invalidate('categories')
                 
                 return {
                     'statusCode': 200,
@@ -295,6 +780,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }
                 
                 cursor.execute("DELETE FROM category_images WHERE id = %s", (image_id,))
+                bump_catalog_version(cursor, 'category_images')
                 conn.commit()
                 
                 return {
@@ -313,4 +799,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
     finally:
         cursor.close()
-        conn.close()
\ No newline at end of file
+        release_db_connection(conn)
\ No newline at end of file
@@ -1,6 +1,384 @@
 import json
+import os
+import time
+import hashlib
+import shutil
+import socket
+import tempfile
+import urllib.error
+import urllib.parse
 import urllib.request
 import base64
+import io
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# Кэш изображений по хэшу нормализованного URL: local — каталог в /tmp, s3 — бакет files
+CACHE_BACKEND = os.environ.get('IMAGE_CACHE_BACKEND', 'local')
+CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', '/tmp/image-proxy-cache')
+CACHE_MAX_BYTES = int(os.environ.get('IMAGE_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+CACHE_FRESH_SECONDS = float(os.environ.get('IMAGE_CACHE_FRESH', '86400'))
+S3_ENDPOINT = 'https://bucket.poehali.dev'
+S3_BUCKET = 'files'
+S3_PREFIX = 'image-proxy-cache/'
+
+# Загрузка с origin: потоково, с лимитом размера и таймаутом на соединение и чтение
+FETCH_MAX_BYTES = int(os.environ.get('IMAGE_FETCH_MAX_BYTES', str(20 * 1024 * 1024)))
+FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', '10'))
+# Кратно 3, чтобы куски base64 склеивались без паддинга в середине
+CHUNK_SIZE = 3 * 64 * 1024
+SPOOL_MAX_BYTES = 1024 * 1024
+
+# Производные изображения (w, h, fit, format): каждая кэшируется под своим ключом
+MAX_DIMENSION = 4096
+FIT_MODES = ('contain', 'cover', 'fill')
+OUTPUT_FORMATS = {'webp': ('WEBP', 'image/webp'), 'png': ('PNG', 'image/png'), 'jpeg': ('JPEG', 'image/jpeg')}
+OUTPUT_QUALITY = 82
+
+# LRU-индекс локального кэша: ключ -> размер, от давно использованных к свежим
+_local_index: 'OrderedDict[str, int]' = OrderedDict()
+_local_state: Dict[str, Any] = {'loaded': False, 'bytes': 0}
+_cache_stats: Dict[str, int] = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0}
+_s3: Dict[str, Any] = {}
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+def normalize_url(url: str) -> str:
+    '''Схема и хост в нижнем регистре, без порта по умолчанию, фрагмента и с отсортированным query'''
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in (('http', 80), ('https', 443)):
+        host = f'{host}:{parts.port}'
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+def cache_key(url: str, transform: Optional[Dict[str, Any]] = None) -> str:
+    source = normalize_url(url)
+    if transform:
+        source += '#' + urllib.parse.urlencode(sorted(transform.items()))
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def _local_paths(key: str) -> Tuple[str, str]:
+    base = os.path.join(CACHE_DIR, key[:2], key)
+    return base + '.bin', base + '.json'
+
+
+def _load_local_index() -> None:
+    '''Индекс по файлам, оставшимся от прошлых вызовов; порядок LRU — по mtime'''
+    _local_state['loaded'] = True
+    entries = []
+    for root, _, files in os.walk(CACHE_DIR):
+        for name in files:
+            if name.endswith('.bin'):
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+    for _, key, size in sorted(entries):
+        _local_index[key] = size
+        _local_state['bytes'] += size
+
+
+def _local_evict() -> None:
+    while _local_state['bytes'] > CACHE_MAX_BYTES and _local_index:
+        key, size = _local_index.popitem(last=False)
+        _local_state['bytes'] -= size
+        for path in _local_paths(key):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _local_get(key: str) -> Optional[Tuple[BinaryIO, Dict[str, Any]]]:
+    if not _local_state['loaded']:
+        _load_local_index()
+    data_path, meta_path = _local_paths(key)
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        data = open(data_path, 'rb')
+    except (OSError, ValueError):
+        return None
+    if key in _local_index:
+        _local_index.move_to_end(key)
+    os.utime(data_path)
+    return data, meta
+
+
+def _local_put(key: str, data: BinaryIO, meta: Dict[str, Any]) -> None:
+    if not _local_state['loaded']:
+        _load_local_index()
+    data_path, meta_path = _local_paths(key)
+    os.makedirs(os.path.dirname(data_path), exist_ok=True)
+    # Запись через временный файл: параллельный вызов не увидит половину изображения
+    for path, payload in ((data_path, data), (meta_path, io.BytesIO(json.dumps(meta).encode('utf-8')))):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        payload.seek(0)
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(payload, f, CHUNK_SIZE)
+        os.replace(tmp_path, path)
+    size = os.path.getsize(data_path)
+    _local_state['bytes'] += size - _local_index.pop(key, 0)
+    _local_index[key] = size
+    _local_evict()
+
+
+def _s3_client():
+    if 'client' not in _s3:
+        _s3['client'] = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT,
+            aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+        )
+    return _s3['client']
+
+
+def _s3_get(key: str) -> Optional[Tuple[BinaryIO, Dict[str, Any]]]:
+    try:
+        obj = _s3_client().get_object(Bucket=S3_BUCKET, Key=S3_PREFIX + key)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+    meta = json.loads(base64.b64decode(obj.get('Metadata', {}).get('proxy-meta', '')) or b'{}')
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    shutil.copyfileobj(obj['Body'], data, CHUNK_SIZE)
+    data.seek(0)
+    return data, meta
+
+
+def _s3_put(key: str, data: BinaryIO, meta: Dict[str, Any]) -> None:
+    # Размер бакета ограничивается правилом lifecycle на префикс, а не LRU в функции
+    data.seek(0)
+    _s3_client().put_object(
+        Bucket=S3_BUCKET,
+        Key=S3_PREFIX + key,
+        Body=data,
+        ContentType=meta.get('content_type') or 'application/octet-stream',
+        Metadata={'proxy-meta': base64.b64encode(json.dumps(meta).encode('utf-8')).decode('ascii')}
+    )
+
+
+def cache_get(key: str) -> Optional[Tuple[BinaryIO, Dict[str, Any]]]:
+    if CACHE_BACKEND == 's3' and boto3 is not None:
+        return _s3_get(key)
+    return _local_get(key)
+
+
+def cache_put(key: str, data: BinaryIO, meta: Dict[str, Any]) -> None:
+    if CACHE_BACKEND == 's3' and boto3 is not None:
+        _s3_put(key, data, meta)
+    else:
+        _local_put(key, data, meta)
+
+
+def read_limited(response, limit: int) -> BinaryIO:
+    '''Тело ответа кусками во временный файл; ImageTooLarge, как только превышен лимит'''
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > limit:
+        raise ImageTooLarge(f'Content-Length {length} exceeds {limit} bytes')
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    size = 0
+    while True:
+        chunk = response.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > limit:
+            data.close()
+            raise ImageTooLarge(f'Image exceeds {limit} bytes')
+        data.write(chunk)
+    data.seek(0)
+    return data
+
+
+def encode_base64(data: BinaryIO) -> str:
+    '''base64 по кускам кратным 3: в памяти только результат, а не ещё и исходные байты'''
+    data.seek(0)
+    parts = []
+    while True:
+        chunk = data.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        parts.append(base64.b64encode(chunk).decode('ascii'))
+    return ''.join(parts)
+
+
+def fetch_image(url: str, meta: Optional[Dict[str, Any]] = None) -> Optional[Tuple[BinaryIO, Dict[str, Any]]]:
+    '''Загрузка с origin; при meta — условный запрос, None если origin ответил 304'''
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    req = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=FETCH_TIMEOUT) as response:
+            data = read_limited(response, FETCH_MAX_BYTES)
+            return data, {
+                'url': url,
+                'content_type': response.headers.get('Content-Type', 'image/jpeg'),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+            }
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and meta:
+            return None
+        raise
+
+
+def load_image(url: str) -> Tuple[BinaryIO, Dict[str, Any], str]:
+    '''Изображение из кэша или с origin; третий элемент — HIT, REVALIDATED, STALE или MISS'''
+    key = cache_key(url)
+    cached = cache_get(key)
+    if cached and time.time() - cached[1].get('fetched_at', 0) <= CACHE_FRESH_SECONDS:
+        _cache_stats['hits'] += 1
+        return cached[0], cached[1], 'HIT'
+
+    if cached:
+        # Устаревшая запись: проверяем у origin по ETag/Last-Modified
+        try:
+            fresh = fetch_image(url, cached[1])
+        except (urllib.error.URLError, OSError):
+            # Origin недоступен: отдаём устаревшую копию, проверим в следующий раз
+            _cache_stats['stale'] += 1
+            return cached[0], cached[1], 'STALE'
+        if fresh is None:
+            data, meta = cached[0], {**cached[1], 'fetched_at': time.time()}
+            cache_put(key, data, meta)
+            _cache_stats['revalidated'] += 1
+            return data, meta, 'REVALIDATED'
+        cached[0].close()
+    else:
+        fresh = fetch_image(url)
+
+    _cache_stats['misses'] += 1
+    cache_put(key, *fresh)
+    return fresh[0], fresh[1], 'MISS'
+
+
+def parse_transform(params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''w, h, fit, format из query; None, если преобразование не запрошено. ValueError на неверных значениях'''
+    transform: Dict[str, Any] = {}
+    for name in ('w', 'h'):
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        if not str(value).isdigit() or not 0 < int(value) <= MAX_DIMENSION:
+            raise ValueError(f'{name} must be an integer between 1 and {MAX_DIMENSION}')
+        transform[name] = int(value)
+    fit = params.get('fit') or 'contain'
+    if fit not in FIT_MODES:
+        raise ValueError(f'fit must be one of: {", ".join(FIT_MODES)}')
+    output = params.get('format')
+    if output:
+        output = output.lower().replace('jpg', 'jpeg')
+        if output not in OUTPUT_FORMATS:
+            raise ValueError(f'format must be one of: {", ".join(OUTPUT_FORMATS)}')
+        transform['format'] = output
+    if not transform:
+        return None
+    if 'w' in transform or 'h' in transform:
+        transform['fit'] = fit
+    return transform
+
+
+def target_size(width: int, height: int, transform: Dict[str, Any]) -> Tuple[int, int]:
+    '''Размер после масштабирования без кадрирования; изображение не увеличивается'''
+    w, h = transform.get('w'), transform.get('h')
+    if not w and not h:
+        return width, height
+    if w and h and transform['fit'] == 'fill':
+        return min(w, width), min(h, height)
+    ratios = [r for r in (w and w / width, h and h / height) if r]
+    scale = max(ratios) if transform['fit'] == 'cover' else min(ratios)
+    scale = min(scale, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def render_derivative(source: BinaryIO, transform: Dict[str, Any]) -> Tuple[BinaryIO, str]:
+    '''Масштабирование и перекодирование; JPEG декодируется сразу в уменьшенном виде через draft'''
+    img = Image.open(source)
+    output = transform.get('format') or {'JPEG': 'jpeg', 'WEBP': 'webp'}.get(img.format, 'png')
+    # Ориентация из EXIF 5-8 поворачивает кадр на 90°: размеры считаются уже после поворота
+    rotated = img.getexif().get(0x0112) in (5, 6, 7, 8)
+    size = target_size(*(img.size[::-1] if rotated else img.size), transform)
+    if img.format == 'JPEG' and size != img.size:
+        # DCT-масштабирование 1/2..1/8 при декодировании, не меньше нужного размера
+        img.draft('RGB' if img.mode != 'L' else 'L', size[::-1] if rotated else size)
+    img = ImageOps.exif_transpose(img)
+
+    if size != img.size:
+        # reducing_gap: сначала целочисленный reduce(), затем LANCZOS по уже небольшой картинке
+        img = img.resize(size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    w, h = transform.get('w'), transform.get('h')
+    if transform.get('fit') == 'cover' and w and h and (img.width > w or img.height > h):
+        left, top = max(0, (img.width - w) // 2), max(0, (img.height - h) // 2)
+        img = img.crop((left, top, left + min(w, img.width), top + min(h, img.height)))
+
+    pil_format, content_type = OUTPUT_FORMATS[output]
+    if pil_format == 'JPEG' and img.mode not in ('RGB', 'L'):
+        rgba = img.convert('RGBA')
+        img = Image.new('RGB', rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel('A'))
+    elif pil_format != 'JPEG' and img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        img = img.convert('RGBA')
+
+    data = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    if pil_format == 'PNG':
+        img.save(data, format=pil_format, optimize=True)
+    else:
+        img.save(data, format=pil_format, quality=OUTPUT_QUALITY)
+    data.seek(0)
+    return data, content_type
+
+
+def source_validator(meta: Dict[str, Any]) -> Optional[str]:
+    return meta.get('etag') or meta.get('last_modified')
+
+
+def load_derivative(url: str, transform: Dict[str, Any]) -> Tuple[BinaryIO, Dict[str, Any], str]:
+    '''Производное изображение из кэша; при устаревании перерисовывается, только если сменился исходник'''
+    key = cache_key(url, transform)
+    cached = cache_get(key)
+    if cached and time.time() - cached[1].get('fetched_at', 0) <= CACHE_FRESH_SECONDS:
+        _cache_stats['hits'] += 1
+        return cached[0], cached[1], 'HIT'
+
+    source, source_meta, _ = load_image(url)
+    with source:
+        validator = source_validator(source_meta)
+        if cached and validator and cached[1].get('source') == validator:
+            meta = {**cached[1], 'fetched_at': time.time()}
+            cache_put(key, cached[0], meta)
+            _cache_stats['revalidated'] += 1
+            return cached[0], meta, 'REVALIDATED'
+        if cached:
+            cached[0].close()
+        data, content_type = render_derivative(source, transform)
+
+    meta = {'url': url, 'content_type': content_type, 'source': validator, 'fetched_at': time.time()}
+    _cache_stats['misses'] += 1
+    cache_put(key, data, meta)
+    return data, meta, 'MISS'
+
 
 def handler(event: dict, context) -> dict:
     '''Прокси для изображений с CORS-заголовками для canvas'''
@@ -37,27 +415,53 @@ def handler(event: dict, context) -> dict:
         }
     
     try:
-        # Загружаем изображение
-        req = urllib.request.Request(image_url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req) as response:
-            image_data = response.read()
-            content_type = response.headers.get('Content-Type', 'image/jpeg')
+        transform = parse_transform(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    try:
+        # Повторные загрузки берутся из кэша, origin трогается только для устаревших записей
+        if transform and Image is not None:
+            image_data, meta, cache_status = load_derivative(image_url, transform)
+        else:
+            image_data, meta, cache_status = load_image(image_url)
+        with image_data:
+            body = encode_base64(image_data)
         
         # Возвращаем как base64
         return {
             'statusCode': 200,
             'headers': {
-                'Content-Type': content_type,
+                'Content-Type': meta.get('content_type') or 'image/jpeg',
                 'Access-Control-Allow-Origin': '*',
-                'Cache-Control': 'public, max-age=86400'
+                'Cache-Control': 'public, max-age=86400',
+                'X-Cache': cache_status,
+                'X-Cache-Stats': '; '.join(f'{name}={count}' for name, count in _cache_stats.items())
             },
-            'body': base64.b64encode(image_data).decode('utf-8'),
+            'body': body,
             'isBase64Encoded': True
         }
         
+    except ImageTooLarge as e:
+        return {
+            'statusCode': 413,
+            'headers': {'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f'Image too large: {str(e)}'})
+        }
     except Exception as e:
+        # urlopen заворачивает таймаут соединения в URLError, таймаут чтения приходит как есть
+        if isinstance(getattr(e, 'reason', e), socket.timeout):
+            return {
+                'statusCode': 504,
+                'headers': {'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': f'Image fetch timed out after {FETCH_TIMEOUT:g}s'})
+            }
         return {
             'statusCode': 500,
             'headers': {'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'error': f'Failed to fetch image: {str(e)}'})
-        }
+        }
\ No newline at end of file
@@ -5,15 +5,409 @@ Args: event - dict с httpMethod, body, queryStringParameters, pathParams
 Returns: HTTP response с данными памятников или результатом операции
 '''
 
+import base64
+import hashlib
+import gzip
 import json
 import os
-from typing import Dict, Any
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '64'))
+# Сколько вариантов списка колонок (fields=) готовить на одном соединении; дальше — без PREPARE
+DB_PREPARED_MAX_VARIANTS = int(os.environ.get('DB_PREPARED_MAX_VARIANTS', '16'))
+# Страница списка памятников: limit по умолчанию и потолок (больше — урезается до него)
+PAGE_LIMIT_DEFAULT = 50
+PAGE_LIMIT_MAX = 200
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+# Имена prepared statements, уже подготовленных на каждом соединении пула
+_db_prepared: Dict[int, Set[str]] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ.get('DATABASE_URL'), cursor_factory=RealDictCursor)
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    _db_prepared.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
 def get_db_connection():
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url, cursor_factory=RealDictCursor)
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        _db_prepared.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
+
+# Все запросы модуля: текст неизменен, значения передаются как $1..$n
+PREPARED_STATEMENTS: Dict[str, str] = {
+    'cross_by_id': "SELECT * FROM t_p78642605_single_page_website_.crosses WHERE id = $1",
+    'cross_list': "SELECT {columns} FROM t_p78642605_single_page_website_.crosses WHERE is_active = true ORDER BY display_order, name",
+    'cross_insert': """
+        INSERT INTO t_p78642605_single_page_website_.crosses (name, image_url, display_order, is_active)
+        VALUES ($1, $2, $3, true)
+        RETURNING *
+    """,
+    'cross_update': """
+        UPDATE t_p78642605_single_page_website_.crosses
+        SET name = $1, image_url = $2, display_order = $3, updated_at = NOW()
+        WHERE id = $4
+        RETURNING *
+    """,
+    'cross_delete': "DELETE FROM t_p78642605_single_page_website_.crosses WHERE id = $1 RETURNING id",
+    'flower_by_id': "SELECT * FROM t_p78642605_single_page_website_.flowers WHERE id = $1",
+    'flower_list': "SELECT {columns} FROM t_p78642605_single_page_website_.flowers WHERE is_active = true ORDER BY display_order, name",
+    'flower_insert': """
+        INSERT INTO t_p78642605_single_page_website_.flowers (name, image_url, display_order, is_active)
+        VALUES ($1, $2, $3, true)
+        RETURNING *
+    """,
+    'flower_update': """
+        UPDATE t_p78642605_single_page_website_.flowers
+        SET name = $1, image_url = $2, display_order = $3, updated_at = NOW()
+        WHERE id = $4
+        RETURNING *
+    """,
+    'flower_delete': "DELETE FROM t_p78642605_single_page_website_.flowers WHERE id = $1 RETURNING id",
+    'monument_by_id': "SELECT * FROM t_p78642605_single_page_website_.monuments WHERE id = $1",
+    'monument_list': "SELECT {columns} FROM t_p78642605_single_page_website_.monuments ORDER BY created_at DESC, id DESC",
+    'monument_page': """
+        SELECT {columns}
+        FROM t_p78642605_single_page_website_.monuments
+        ORDER BY created_at DESC, id DESC
+        LIMIT $1
+    """,
+    'monument_page_after': """
+        SELECT {columns}
+        FROM t_p78642605_single_page_website_.monuments
+        WHERE (created_at, id) < ($2, $3)
+        ORDER BY created_at DESC, id DESC
+        LIMIT $1
+    """,
+    'monument_insert': """
+        INSERT INTO t_p78642605_single_page_website_.monuments (title, image_url, price, size, category)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING *
+    """,
+    'monument_update': """
+        UPDATE t_p78642605_single_page_website_.monuments
+        SET title = $1, image_url = $2, price = $3, size = $4, category = $5,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = $6
+        RETURNING *
+    """,
+    'monument_delete': "DELETE FROM t_p78642605_single_page_website_.monuments WHERE id = $1 RETURNING id",
+}
+
+def execute_prepared(cursor, name: str, args: Tuple[Any, ...] = (), columns: Optional[str] = None) -> None:
+    '''
+    EXECUTE именованного запроса; PREPARE выполняется один раз на соединение.
+    columns подставляется в {columns} шаблона, каждый список колонок готовится под своим именем;
+    сверх DB_PREPARED_MAX_VARIANTS вариантов на соединение запрос выполняется без PREPARE.
+    '''
+    sql = PREPARED_STATEMENTS[name]
+    prepared = _db_prepared.setdefault(id(cursor.connection), set())
+    if columns is not None:
+        name = f"{name}_{hashlib.md5(columns.encode('utf-8')).hexdigest()[:10]}"
+        sql = sql.replace('{columns}', columns)
+        variants = sum(1 for known in prepared if known not in PREPARED_STATEMENTS)
+        if name not in prepared and variants >= DB_PREPARED_MAX_VARIANTS:
+            cursor.execute(re.sub(r'\$(\d+)', r'%(p\1)s', sql), {f'p{i}': value for i, value in enumerate(args, 1)})
+            return
+    if name not in prepared:
+        cursor.execute(f'PREPARE {name} AS {sql}')
+        prepared.add(name)
+    if args:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+    else:
+        cursor.execute(f'EXECUTE {name}')
+
+# Поля списков для fields= и пресеты; full (None) — все поля, как без fields
+MONUMENT_FIELDS = ('id', 'title', 'image_url', 'price', 'size', 'category', 'created_at', 'updated_at')
+ITEM_FIELDS = ('id', 'name', 'image_url', 'display_order', 'is_active', 'created_at', 'updated_at')
+FIELD_PRESETS: Dict[str, Dict[str, Optional[Tuple[str, ...]]]] = {
+    'monuments': {'card': ('id', 'title', 'image_url', 'price', 'category'), 'full': None},
+    'items': {'card': ('id', 'name', 'image_url', 'display_order'), 'full': None},
+}
+
+def select_fields(params: Dict[str, Any], available: Tuple[str, ...], presets: Dict[str, Any]) -> Optional[Tuple[str, ...]]:
+    '''Поля из fields=: пресет или имена через запятую; None — все поля, ValueError — неизвестные'''
+    value = (params.get('fields') or '').strip()
+    if not value:
+        return None
+    if value in presets:
+        return presets[value]
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(', '.join(unknown))
+    return fields
+
+def select_columns(fields: Optional[Tuple[str, ...]], all_columns: str, keyset: Tuple[str, ...] = ()) -> str:
+    '''
+    SELECT-список под запрошенные поля; колонки ключа пагинации выбираются всегда.
+    Колонки отсортированы: перестановки fields= дают один и тот же prepared statement.
+    '''
+    if fields is None:
+        return all_columns
+    return ', '.join(sorted({*fields, *keyset}))
+
+def narrow(rows: List[Dict[str, Any]], fields: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    if fields is None:
+        return rows
+    return [{field: row[field] for field in fields} for row in rows]
+
+def encode_cursor(key: List[Any]) -> str:
+    '''Непрозрачный cursor из ключа сортировки последней строки страницы'''
+    return base64.urlsafe_b64encode(dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(value: str, size: int) -> Optional[List[Any]]:
+    '''Ключ сортировки из cursor; None для первой страницы, ValueError для битого значения'''
+    if not value:
+        return None
+    key = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError('cursor')
+    return key
+
+def parse_int_param(params: Dict[str, Any], name: str, default: Optional[int] = None,
+                    minimum: int = -2**31) -> Optional[int]:
+    '''Целый параметр запроса в диапазоне int4 (как колонки в базе); ValueError с именем параметра'''
+    value = params.get(name)
+    if value is None or str(value).strip() == '':
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(name)
+    if not minimum <= number < 2**31:
+        raise ValueError(name)
+    return number
+
+def monument_cursor(value: str) -> Optional[List[Any]]:
+    '''cursor списка памятников: [created_at, id] с проверкой типов, чтобы битое значение не дошло до базы'''
+    try:
+        key = decode_cursor(value, 2)
+        if key is None:
+            return None
+        created_at, monument_id = key
+        if isinstance(monument_id, bool) or not isinstance(monument_id, int) or not -2**31 <= monument_id < 2**31:
+            raise ValueError
+        if created_at is not None:
+            if not isinstance(created_at, str):
+                raise ValueError
+            datetime.fromisoformat(created_at)
+    except ValueError:
+        raise ValueError('cursor')
+    return key
+
+
+def _json_default(value: Any) -> str:
+    '''Decimal, date/datetime и UUID из строк psycopg2 — их str(), как раньше с default=str'''
+    return str(value)
+
+def dumps(data: Any) -> str:
+    '''Компактный UTF-8 JSON ответа; orjson, если установлен, иначе stdlib с тем же результатом побайтно'''
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
+    return json.dumps(data, default=_json_default, ensure_ascii=False, separators=(',', ':'))
+
+def get_catalog_etag(cursor, table: str, params: Dict[str, Any]) -> Optional[str]:
+    '''ETag из счётчика версии таблицы и параметров запроса, без чтения самих строк'''
+    cursor.execute(
+        "SELECT version FROM t_p78642605_single_page_website_.catalog_versions WHERE table_name = %s",
+        (table,)
+    )
+    row = cursor.fetchone()
+    if not row:
+        return None
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    return '"' + hashlib.md5(f"{table}:{row['version']}|{query}".encode('utf-8')).hexdigest()[:20] + '"'
+
+def bump_catalog_version(cursor, table: str) -> None:
+    '''Увеличение счётчика версии в транзакции записи'''
+    cursor.execute(
+        """
+        INSERT INTO t_p78642605_single_page_website_.catalog_versions (table_name) VALUES (%s)
+        ON CONFLICT (table_name) DO UPDATE SET version = catalog_versions.version + 1, updated_at = NOW()
+        """,
+        (table,)
+    )
+
+def etag_matches(event: Dict[str, Any], etag: Optional[str]) -> bool:
+    if not etag:
+        return False
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), '') or ''
+    tags = [tag.strip().removeprefix('W/') for tag in value.split(',')]
+    return etag in tags or '*' in tags
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': ''
+    }
+
+def with_etag(response: Dict[str, Any], etag: Optional[str]) -> Dict[str, Any]:
+    if etag and response['statusCode'] == 200:
+        response['headers'] = {**response['headers'], 'ETag': etag, 'Cache-Control': 'no-cache'}
+    return response
+
+# Кэш готовых GET-ответов: ключ — раздел и нормализованные параметры, LRU по CACHE_MAX_ENTRIES.
+# Рядом с ответом хранятся его сжатые формы по кодировке (base64)
+_response_cache: 'OrderedDict[str, Tuple[float, Dict[str, Any], Dict[str, str]]]' = OrderedDict()
+_cache_stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    '''br или gzip из Accept-Encoding (br — только если установлен brotli); q=0 отключает кодировку'''
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'accept-encoding'), '') or ''
+    accepted = set()
+    for part in value.split(','):
+        name, _, quality = part.partition(';')
+        quality = quality.strip()
+        try:
+            weight = float(quality[2:]) if quality.startswith('q=') else 1.0
+        except ValueError:
+            weight = 1.0
+        if weight > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''
+    Сжатие текстового тела от COMPRESS_MIN_BYTES под Accept-Encoding клиента; тело уходит в base64.
+    variants — сжатые формы этого же тела из кэша ответов, пополняются при первом сжатии.
+    '''
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return {**response, 'headers': {**response['headers'], 'Vary': 'Accept-Encoding'}}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        data = body.encode('utf-8')
+        packed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+        encoded = base64.b64encode(packed).decode('ascii')
+        if variants is not None:
+            variants[encoding] = encoded
+    headers = {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def cache_key(scope: str, params: Dict[str, Any]) -> str:
+    return scope + '?' + '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+def cache_get(key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+    '''Ответ и его сжатые формы из кэша, если запись моложе CACHE_TTL; считает попадания и промахи'''
+    entry = _response_cache.get(key)
+    if entry and time.monotonic() - entry[0] <= CACHE_TTL:
+        _response_cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return entry[1], entry[2]
+    _response_cache.pop(key, None)
+    _cache_stats['misses'] += 1
+    return None
+
+def cache_put(key: str, response: Dict[str, Any]) -> Dict[str, str]:
+    '''Сохранение ответа; возвращает словарь для его сжатых форм (вне кэша — одноразовый)'''
+    variants: Dict[str, str] = {}
+    if response['statusCode'] == 200 and CACHE_MAX_ENTRIES > 0:
+        _response_cache[key] = (time.monotonic(), response, variants)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+    return variants
+
+def cache_invalidate(scope: str) -> None:
+    '''Сброс всех записей раздела; вызывается после commit в его таблицы'''
+    for key in [key for key in _response_cache if key.startswith(scope + '?')]:
+        del _response_cache[key]
+
+def with_cache_status(response: Dict[str, Any], hit: bool) -> Dict[str, Any]:
+    '''Копия ответа с X-Cache и накопленной статистикой попаданий этого инстанса'''
+    stats = f"hits={_cache_stats['hits']}; misses={_cache_stats['misses']}"
+    return {**response, 'headers': {**response['headers'], 'X-Cache': 'HIT' if hit else 'MISS', 'X-Cache-Stats': stats}}
+
+def cached_response(event: Dict[str, Any], response: Dict[str, Any], variants: Dict[str, str]) -> Dict[str, Any]:
+    etag = response['headers'].get('ETag')
+    if etag_matches(event, etag):
+        return not_modified_response(etag)
+    return compress_response(event, with_cache_status(response, True), variants)
 
 def handle_crosses(conn, cursor, method: str, event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
     '''Обработка запросов для крестов'''
@@ -22,8 +416,7 @@ def handle_crosses(conn, cursor, method: str, event: Dict[str, Any], headers: Di
     if method == 'GET':
         cross_id = params.get('id')
         if cross_id:
-            safe_id = cross_id.replace("'", "''")
-            cursor.execute(f"SELECT * FROM t_p78642605_single_page_website_.crosses WHERE id = '{safe_id}'")
+            execute_prepared(cursor, 'cross_by_id', (cross_id,))
             cross = cursor.fetchone()
             
             if not cross:
@@ -31,30 +424,40 @@ def handle_crosses(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                     'statusCode': 404,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Cross not found'})
+                    'body': dumps({'error': 'Cross not found'})
                 }
             
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps(dict(cross), default=str)
+                'body': dumps(dict(cross))
             }
         else:
-            cursor.execute("SELECT * FROM t_p78642605_single_page_website_.crosses WHERE is_active = true ORDER BY display_order, name")
+            try:
+                fields = select_fields(params, ITEM_FIELDS, FIELD_PRESETS['items'])
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': dumps({'error': f'Unknown fields: {e}'})
+                }
+            
+            execute_prepared(cursor, 'cross_list', columns=select_columns(fields, '*'))
             crosses = cursor.fetchall()
             
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps([dict(c) for c in crosses], default=str)
+                'body': dumps(narrow([dict(c) for c in crosses], fields))
             }
     
     elif method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
-        name = body_data.get('name', '').replace("'", "''")
-        image_url = body_data.get('image_url', '').replace("'", "''")
+        name = body_data.get('name', '')
+        image_url = body_data.get('image_url', '')
         display_order = body_data.get('display_order', 999)
         
         if not name or not image_url:
@@ -62,24 +465,20 @@ def handle_crosses(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                 'statusCode': 400,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Name and image_url are required'})
+                'body': dumps({'error': 'Name and image_url are required'})
             }
         
-        cursor.execute(
-            f"""
-            INSERT INTO t_p78642605_single_page_website_.crosses (name, image_url, display_order, is_active)
-            VALUES ('{name}', '{image_url}', {display_order}, true)
-            RETURNING *
-            """
-        )
+        execute_prepared(cursor, 'cross_insert', (name, image_url, display_order))
         new_cross = cursor.fetchone()
+        bump_catalog_version(cursor, 'crosses')
         conn.commit()
+        cache_invalidate('crosses')
         
         return {
             'statusCode': 201,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps(dict(new_cross), default=str)
+            'body': dumps(dict(new_cross))
         }
     
     elif method == 'PUT':
@@ -89,39 +488,33 @@ def handle_crosses(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                 'statusCode': 400,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Cross ID required'})
+                'body': dumps({'error': 'Cross ID required'})
             }
         
         body_data = json.loads(event.get('body', '{}'))
-        safe_id = cross_id.replace("'", "''")
-        name = body_data.get('name', '').replace("'", "''")
-        image_url = body_data.get('image_url', '').replace("'", "''")
+        name = body_data.get('name', '')
+        image_url = body_data.get('image_url', '')
         display_order = body_data.get('display_order', 999)
         
-        cursor.execute(
-            f"""
-            UPDATE t_p78642605_single_page_website_.crosses 
-            SET name = '{name}', image_url = '{image_url}', display_order = {display_order}, updated_at = NOW()
-            WHERE id = '{safe_id}'
-            RETURNING *
-            """
-        )
+        execute_prepared(cursor, 'cross_update', (name, image_url, display_order, cross_id))
         updated_cross = cursor.fetchone()
+        bump_catalog_version(cursor, 'crosses')
         conn.commit()
+        cache_invalidate('crosses')
         
         if not updated_cross:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Cross not found'})
+                'body': dumps({'error': 'Cross not found'})
             }
         
         return {
             'statusCode': 200,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps(dict(updated_cross), default=str)
+            'body': dumps(dict(updated_cross))
         }
     
     elif method == 'DELETE':
@@ -131,34 +524,35 @@ def handle_crosses(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                 'statusCode': 400,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Cross ID required'})
+                'body': dumps({'error': 'Cross ID required'})
             }
         
-        safe_id = cross_id.replace("'", "''")
-        cursor.execute(f"DELETE FROM t_p78642605_single_page_website_.crosses WHERE id = '{safe_id}' RETURNING id")
+        execute_prepared(cursor, 'cross_delete', (cross_id,))
         deleted = cursor.fetchone()
+        bump_catalog_version(cursor, 'crosses')
         conn.commit()
+        cache_invalidate('crosses')
         
         if not deleted:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Cross not found'})
+                'body': dumps({'error': 'Cross not found'})
             }
         
         return {
             'statusCode': 200,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps({'message': 'Cross deleted successfully'})
+            'body': dumps({'message': 'Cross deleted successfully'})
         }
     
     return {
         'statusCode': 405,
         'headers': headers,
         'isBase64Encoded': False,
-        'body': json.dumps({'error': 'Method not allowed'})
+        'body': dumps({'error': 'Method not allowed'})
     }
 
 def handle_flowers(conn, cursor, method: str, event: Dict[str, Any], headers: Dict[str, str]) -> Dict[str, Any]:
@@ -168,8 +562,7 @@ def handle_flowers(conn, cursor, method: str, event: Dict[str, Any], headers: Di
     if method == 'GET':
         flower_id = params.get('id')
         if flower_id:
-            safe_id = flower_id.replace("'", "''")
-            cursor.execute(f"SELECT * FROM t_p78642605_single_page_website_.flowers WHERE id = '{safe_id}'")
+            execute_prepared(cursor, 'flower_by_id', (flower_id,))
             flower = cursor.fetchone()
             
             if not flower:
@@ -177,30 +570,40 @@ def handle_flowers(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                     'statusCode': 404,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Flower not found'})
+                    'body': dumps({'error': 'Flower not found'})
                 }
             
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps(dict(flower), default=str)
+                'body': dumps(dict(flower))
             }
         else:
-            cursor.execute("SELECT * FROM t_p78642605_single_page_website_.flowers WHERE is_active = true ORDER BY display_order, name")
+            try:
+                fields = select_fields(params, ITEM_FIELDS, FIELD_PRESETS['items'])
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': dumps({'error': f'Unknown fields: {e}'})
+                }
+            
+            execute_prepared(cursor, 'flower_list', columns=select_columns(fields, '*'))
             flowers = cursor.fetchall()
             
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps([dict(f) for f in flowers], default=str)
+                'body': dumps(narrow([dict(f) for f in flowers], fields))
             }
     
     elif method == 'POST':
         body_data = json.loads(event.get('body', '{}'))
-        name = body_data.get('name', '').replace("'", "''")
-        image_url = body_data.get('image_url', '').replace("'", "''")
+        name = body_data.get('name', '')
+        image_url = body_data.get('image_url', '')
         display_order = body_data.get('display_order', 999)
         
         if not name or not image_url:
@@ -208,24 +611,20 @@ def handle_flowers(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                 'statusCode': 400,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Name and image_url are required'})
+                'body': dumps({'error': 'Name and image_url are required'})
             }
         
-        cursor.execute(
-            f"""
-            INSERT INTO t_p78642605_single_page_website_.flowers (name, image_url, display_order, is_active)
-            VALUES ('{name}', '{image_url}', {display_order}, true)
-            RETURNING *
-            """
-        )
+        execute_prepared(cursor, 'flower_insert', (name, image_url, display_order))
         new_flower = cursor.fetchone()
+        bump_catalog_version(cursor, 'flowers')
         conn.commit()
+        cache_invalidate('flowers')
         
         return {
             'statusCode': 201,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps(dict(new_flower), default=str)
+            'body': dumps(dict(new_flower))
         }
     
     elif method == 'PUT':
@@ -235,39 +634,33 @@ def handle_flowers(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                 'statusCode': 400,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Flower ID required'})
+                'body': dumps({'error': 'Flower ID required'})
             }
         
         body_data = json.loads(event.get('body', '{}'))
-        safe_id = flower_id.replace("'", "''")
-        name = body_data.get('name', '').replace("'", "''")
-        image_url = body_data.get('image_url', '').replace("'", "''")
+        name = body_data.get('name', '')
+        image_url = body_data.get('image_url', '')
         display_order = body_data.get('display_order', 999)
         
-        cursor.execute(
-            f"""
-            UPDATE t_p78642605_single_page_website_.flowers 
-            SET name = '{name}', image_url = '{image_url}', display_order = {display_order}, updated_at = NOW()
-            WHERE id = '{safe_id}'
-            RETURNING *
-            """
-        )
+        execute_prepared(cursor, 'flower_update', (name, image_url, display_order, flower_id))
         updated_flower = cursor.fetchone()
+        bump_catalog_version(cursor, 'flowers')
         conn.commit()
+        cache_invalidate('flowers')
         
         if not updated_flower:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Flower not found'})
+                'body': dumps({'error': 'Flower not found'})
             }
         
         return {
             'statusCode': 200,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps(dict(updated_flower), default=str)
+            'body': dumps(dict(updated_flower))
         }
     
     elif method == 'DELETE':
@@ -277,34 +670,35 @@ def handle_flowers(conn, cursor, method: str, event: Dict[str, Any], headers: Di
                 'statusCode': 400,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Flower ID required'})
+                'body': dumps({'error': 'Flower ID required'})
             }
         
-        safe_id = flower_id.replace("'", "''")
-        cursor.execute(f"DELETE FROM t_p78642605_single_page_website_.flowers WHERE id = '{safe_id}' RETURNING id")
+        execute_prepared(cursor, 'flower_delete', (flower_id,))
         deleted = cursor.fetchone()
+        bump_catalog_version(cursor, 'flowers')
         conn.commit()
+        cache_invalidate('flowers')
         
         if not deleted:
             return {
                 'statusCode': 404,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Flower not found'})
+                'body': dumps({'error': 'Flower not found'})
             }
         
         return {
             'statusCode': 200,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps({'message': 'Flower deleted successfully'})
+            'body': dumps({'message': 'Flower deleted successfully'})
         }
     
     return {
         'statusCode': 405,
         'headers': headers,
         'isBase64Encoded': False,
-        'body': json.dumps({'error': 'Method not allowed'})
+        'body': dumps({'error': 'Method not allowed'})
     }
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -316,7 +710,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Admin-Key, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'isBase64Encoded': False,
@@ -328,25 +722,47 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    # Кресты и цветы почти не меняются: кэш отвечает без похода в базу
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('type') in ('crosses', 'flowers'):
+        params = event['queryStringParameters']
+        cached = cache_get(cache_key(params['type'], params))
+        if cached:
+            return cached_response(event, *cached)
+    
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
         params = event.get('queryStringParameters', {})
         
-        if params.get('type') == 'crosses':
-            return handle_crosses(conn, cursor, method, event, headers)
+        etag = None
+        if method == 'GET':
+            table = params.get('type') if params.get('type') in ('crosses', 'flowers') else 'monuments'
+            etag = get_catalog_etag(cursor, table, params)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
         
-        if params.get('type') == 'flowers':
-            return handle_flowers(conn, cursor, method, event, headers)
+        if params.get('type') in ('crosses', 'flowers'):
+            handle = handle_crosses if params['type'] == 'crosses' else handle_flowers
+            response = with_etag(handle(conn, cursor, method, event, headers), etag)
+            if method != 'GET':
+                return response
+            variants = cache_put(cache_key(params['type'], params), response)
+            return compress_response(event, with_cache_status(response, False), variants)
         
         if method == 'GET':
-            monument_id = params.get('id')
+            # Нечисловой id — 400, а не 500 от ошибки приведения типа в базе
+            try:
+                monument_id = parse_int_param(params, 'id')
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': dumps({'error': f'Invalid {e}'})
+                }
             
-            if monument_id:
-                safe_id = monument_id.replace("'", "''")
-                cursor.execute(
-                    f"SELECT * FROM t_p78642605_single_page_website_.monuments WHERE id = '{safe_id}'"
-                )
+            if monument_id is not None:
+                execute_prepared(cursor, 'monument_by_id', (monument_id,))
                 monument = cursor.fetchone()
                 
                 if not monument:
@@ -354,61 +770,96 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'statusCode': 404,
                         'headers': headers,
                         'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Monument not found'})
+                        'body': dumps({'error': 'Monument not found'})
                     }
                 
-                return {
+                return compress_response(event, with_etag({
                     'statusCode': 200,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps(dict(monument))
+                    'body': dumps(dict(monument))
+                }, etag))
+            
+            try:
+                fields = select_fields(params, MONUMENT_FIELDS, FIELD_PRESETS['monuments'])
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': dumps({'error': f'Unknown fields: {e}'})
                 }
-            else:
-                cursor.execute(
-                    "SELECT id, title, image_url, price, size, category, created_at, updated_at FROM t_p78642605_single_page_website_.monuments ORDER BY created_at DESC"
-                )
+            columns = select_columns(fields, ', '.join(MONUMENT_FIELDS), ('created_at', 'id'))
+            
+            if 'cursor' not in params:
+                execute_prepared(cursor, 'monument_list', columns=columns)
                 monuments = cursor.fetchall()
                 
-                return {
+                return compress_response(event, with_etag({
                     'statusCode': 200,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps([dict(m) for m in monuments], default=str)
-                }
+                    'body': dumps(narrow([dict(m) for m in monuments], fields))
+                }, etag))
+            else:
+                # Постраничный список: ?cursor=&limit=N, дальше cursor из next_cursor
+                try:
+                    limit = min(parse_int_param(params, 'limit', PAGE_LIMIT_DEFAULT, minimum=1), PAGE_LIMIT_MAX)
+                    after = monument_cursor(params['cursor'])
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'isBase64Encoded': False,
+                        'body': dumps({'error': f'Invalid {e}'})
+                    }
+                
+                if after:
+                    execute_prepared(cursor, 'monument_page_after', (limit + 1, *after), columns)
+                else:
+                    execute_prepared(cursor, 'monument_page', (limit + 1,), columns)
+                monuments = [dict(m) for m in cursor.fetchall()]
+                
+                next_cursor = None
+                if len(monuments) > limit:
+                    monuments = monuments[:limit]
+                    next_cursor = encode_cursor([monuments[-1]['created_at'], monuments[-1]['id']])
+                
+                return compress_response(event, with_etag({
+                    'statusCode': 200,
+                    'headers': headers,
+                    'isBase64Encoded': False,
+                    'body': dumps({'items': narrow(monuments, fields), 'next_cursor': next_cursor})
+                }, etag))
         
         elif method == 'POST':
             body_data = json.loads(event.get('body', '{}'))
             
-            title = body_data.get('title', '').replace("'", "''")
-            image_url = body_data.get('image_url', '').replace("'", "''")
-            price = body_data.get('price', '').replace("'", "''")
-            size = body_data.get('size', '').replace("'", "''")
-            category = body_data.get('category', 'Вертикальные').replace("'", "''")
+            title = body_data.get('title', '')
+            image_url = body_data.get('image_url', '')
+            price = body_data.get('price', '')
+            size = body_data.get('size', '')
+            category = body_data.get('category', 'Вертикальные')
             
             if not all([title, image_url, price, size]):
                 return {
                     'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Missing required fields'})
+                    'body': dumps({'error': 'Missing required fields'})
                 }
             
-            cursor.execute(
-                f"""
-                INSERT INTO t_p78642605_single_page_website_.monuments (title, image_url, price, size, category)
-                VALUES ('{title}', '{image_url}', '{price}', '{size}', '{category}')
-                RETURNING *
-                """
-            )
+            execute_prepared(cursor, 'monument_insert', (title, image_url, price, size, category))
             
             new_monument = cursor.fetchone()
+            bump_catalog_version(cursor, 'monuments')
             conn.commit()
             
             return {
                 'statusCode': 201,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps(dict(new_monument), default=str)
+                'body': dumps(dict(new_monument))
             }
         
         elif method == 'PUT':
@@ -419,29 +870,21 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Monument ID required'})
+                    'body': dumps({'error': 'Monument ID required'})
                 }
             
             body_data = json.loads(event.get('body', '{}'))
             
-            safe_id = monument_id.replace("'", "''")
-            title = body_data.get('title', '').replace("'", "''")
-            image_url = body_data.get('image_url', '').replace("'", "''")
-            price = body_data.get('price', '').replace("'", "''")
-            size = body_data.get('size', '').replace("'", "''")
-            category = body_data.get('category', 'Вертикальные').replace("'", "''")
+            title = body_data.get('title', '')
+            image_url = body_data.get('image_url', '')
+            price = body_data.get('price', '')
+            size = body_data.get('size', '')
+            category = body_data.get('category', 'Вертикальные')
             
-            cursor.execute(
-                f"""
-                UPDATE t_p78642605_single_page_website_.monuments 
-                SET title = '{title}', image_url = '{image_url}', price = '{price}', size = '{size}', category = '{category}',
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = '{safe_id}'
-                RETURNING *
-                """
-            )
+            execute_prepared(cursor, 'monument_update', (title, image_url, price, size, category, monument_id))
             
             updated_monument = cursor.fetchone()
+            bump_catalog_version(cursor, 'monuments')
             conn.commit()
             
             if not updated_monument:
@@ -449,14 +892,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'statusCode': 404,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Monument not found'})
+                    'body': dumps({'error': 'Monument not found'})
                 }
             
             return {
                 'statusCode': 200,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps(dict(updated_monument), default=str)
+                'body': dumps(dict(updated_monument))
             }
         
         elif method == 'DELETE':
@@ -470,16 +913,14 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'statusCode': 400,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Monument ID required'})
+                    'body': dumps({'error': 'Monument ID required'})
                 }
             
-            safe_id = monument_id.replace("'", "''")
-            print(f"Executing DELETE query for ID: {safe_id}")
-            cursor.execute(
-                f"DELETE FROM t_p78642605_single_page_website_.monuments WHERE id = '{safe_id}' RETURNING id"
-            )
+            print(f"Executing DELETE query for ID: {monument_id}")
+            execute_prepared(cursor, 'monument_delete', (monument_id,))
             
             deleted = cursor.fetchone()
+            bump_catalog_version(cursor, 'monuments')
             conn.commit()
             
             print(f"Delete result: {deleted}")
@@ -490,7 +931,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'statusCode': 404,
                     'headers': headers,
                     'isBase64Encoded': False,
-                    'body': json.dumps({'error': 'Monument not found'})
+                    'body': dumps({'error': 'Monument not found'})
                 }
             
             print(f"Monument {monument_id} successfully deleted")
@@ -498,7 +939,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'statusCode': 200,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'message': 'Monument deleted successfully'})
+                'body': dumps({'message': 'Monument deleted successfully'})
             }
         
         else:
@@ -506,7 +947,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'statusCode': 405,
                 'headers': headers,
                 'isBase64Encoded': False,
-                'body': json.dumps({'error': 'Method not allowed'})
+                'body': dumps({'error': 'Method not allowed'})
             }
     
     except Exception as e:
@@ -514,11 +955,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 500,
             'headers': headers,
             'isBase64Encoded': False,
-            'body': json.dumps({'error': str(e)})
+            'body': dumps({'error': str(e)})
         }
     
     finally:
         if 'cursor' in locals():
             cursor.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            release_db_connection(conn)
\ No newline at end of file
@@ -1,16 +1,438 @@
 import json
 import base64
+import hashlib
+import math
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
 from io import BytesIO
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 from PIL import Image
 import requests
 import numpy as np
 
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+# Результаты кэшируются в бакете по ключу (URL исходника, режим с версией, параметры)
+MAX_SIZE = 1200
+# Обработка полосами по TILE_ROWS строк; full_resolution — без уменьшения, полосы сразу в PNG
+TILE_ROWS = 256
+PNG_COMPRESS_LEVEL = 6
+S3_ENDPOINT = 'https://bucket.poehali.dev'
+S3_BUCKET = 'files'
+RESULT_PREFIX = 'processed/'
+RESULT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DOWNLOAD_TIMEOUT = 10
+
+# Пакетный режим: items — список запросов; загрузки в потоках, обработка в процессах по числу ядер
+BATCH_MAX_ITEMS = 32
+BATCH_DOWNLOAD_WORKERS = 8
+BATCH_DEADLINE = 25.0
+
+# Ключи, уже найденные в бакете этим экземпляром функции: повтор без HEAD-запроса
+KNOWN_RESULTS_MAX = 1024
+_known_results: 'OrderedDict[str, bool]' = OrderedDict()
+_s3: Dict[str, Any] = {}
+_pools: Dict[str, Optional[Executor]] = {}
+
+
+def result_key(image_url: str, algorithm: str, params: Dict[str, Any]) -> str:
+    payload = json.dumps({'source': image_url.strip(), 'algorithm': algorithm, 'params': params},
+                         sort_keys=True)
+    return f'{RESULT_PREFIX}{hashlib.sha256(payload.encode("utf-8")).hexdigest()}.png'
+
+
+def s3_client():
+    '''Клиент бакета или None, если boto3 или ключи недоступны (тогда только data URL)'''
+    if boto3 is None or not os.environ.get('AWS_ACCESS_KEY_ID') or not os.environ.get('AWS_SECRET_ACCESS_KEY'):
+        return None
+    if 'client' not in _s3:
+        _s3['client'] = boto3.client(
+            's3',
+            endpoint_url=S3_ENDPOINT,
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+    return _s3['client']
+
+
+def result_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+
+def remember_result(key: str) -> None:
+    _known_results[key] = True
+    _known_results.move_to_end(key)
+    while len(_known_results) > KNOWN_RESULTS_MAX:
+        _known_results.popitem(last=False)
+
+
+def find_result(client, key: str) -> bool:
+    if key in _known_results:
+        _known_results.move_to_end(key)
+        return True
+    try:
+        client.head_object(Bucket=S3_BUCKET, Key=key)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    remember_result(key)
+    return True
+
+
+def load_result(client, key: str) -> bytes:
+    return client.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read()
+
+
+def store_result(client, key: str, png: bytes) -> None:
+    client.put_object(
+        Bucket=S3_BUCKET,
+        Key=key,
+        Body=png,
+        ContentType='image/png',
+        CacheControl=RESULT_CACHE_CONTROL
+    )
+    remember_result(key)
+
+
+def to_data_url(png: bytes) -> str:
+    return f'data:image/png;base64,{base64.b64encode(png).decode("utf-8")}'
+
+
+# Режимы наложения: name -> (функция, версия, параметры). Функция получает полосу RGBA uint8 и
+# значения параметров, возвращает новую полосу RGBA uint8. Версия входит в ключ кэша результатов:
+# при изменении формул режима её нужно поднять, иначе отдадутся старые результаты
+BLEND_MODES: Dict[str, Tuple[Callable[..., np.ndarray], int, Dict[str, Tuple[str, Any, Any, Any]]]] = {}
+DEFAULT_MODE = 'screen'
+# Яркость 0.299/0.587/0.114 в целых с суммой весов 256 и округлением
+LUMA_WEIGHTS = (77, 150, 29)
+_levels = np.arange(256, dtype=np.float32) / 255.0
+PARAM_KINDS = {'float': 'a number', 'int': 'an integer', 'bool': 'true or false', 'color': 'a hex color like #ffffff'}
+
+
+def blend_mode(name: str, version: int, **params: Tuple[str, Any, Any, Any]):
+    '''Регистрация режима; параметры — (тип float|int|bool|color, по умолчанию, минимум, максимум)'''
+    def register(func: Callable[..., np.ndarray]) -> Callable[..., np.ndarray]:
+        BLEND_MODES[name] = (func, version, params)
+        return func
+    return register
+
+
+def parse_color(value: Any) -> Tuple[int, int, int]:
+    text = str(value).lstrip('#')
+    if len(text) == 3:
+        text = ''.join(c * 2 for c in text)
+    if len(text) != 6:
+        raise ValueError(f'invalid color: {value}')
+    return int(text[0:2], 16), int(text[2:4], 16), int(text[4:6], 16)
+
+
+def parse_mode(item: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    '''mode и params из запроса: значения приведены к типам и дополнены умолчаниями; ValueError на ошибках'''
+    mode = item.get('mode') or DEFAULT_MODE
+    if mode not in BLEND_MODES:
+        raise ValueError(f'unknown mode: {mode}; available: {", ".join(sorted(BLEND_MODES))}')
+    raw = item.get('params') or {}
+    if not isinstance(raw, dict):
+        raise ValueError('params must be an object')
+    spec = BLEND_MODES[mode][2]
+    unknown = set(raw) - set(spec)
+    if unknown:
+        raise ValueError(f'unknown params for {mode}: {", ".join(sorted(unknown))}')
+    
+    values: Dict[str, Any] = {}
+    for name, (kind, default, low, high) in spec.items():
+        value = raw.get(name, default)
+        try:
+            if kind == 'color':
+                values[name] = '#%02x%02x%02x' % parse_color(value)
+                continue
+            if kind == 'bool':
+                if not isinstance(value, bool):
+                    raise ValueError
+                values[name] = value
+                continue
+            value = int(value) if kind == 'int' else float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{mode}.{name} must be {PARAM_KINDS[kind]}')
+        if not low <= value <= high:
+            raise ValueError(f'{mode}.{name} must be between {low} and {high}')
+        values[name] = value
+    return mode, values
+
+
+def luminance8(pixels: np.ndarray) -> np.ndarray:
+    '''Яркость 0..255 в uint16 без перехода во float'''
+    luminance = np.full(pixels.shape[:2], 128, dtype=np.uint16)
+    term = np.empty_like(luminance)
+    for channel, weight in enumerate(LUMA_WEIGHTS):
+        np.multiply(pixels[:, :, channel], weight, out=term, dtype=np.uint16)
+        luminance += term
+    luminance >>= 8
+    return luminance
+
+
+@lru_cache(maxsize=32)
+def curve_lut(gamma: float, scale: float = 1.0, invert: bool = False) -> np.ndarray:
+    '''Таблица scale * x ** gamma (или (1 - x) ** gamma) для 256 уровней'''
+    levels = 1 - _levels if invert else _levels
+    return (np.power(levels, gamma) * scale * 255).astype(np.uint8)
+
+
+@lru_cache(maxsize=32)
+def screen_lut(strength: float) -> np.ndarray:
+    return ((1 - (1 - _levels) * (1 - strength)) * 255).astype(np.uint8)
+
+
+@blend_mode('screen', version=2, strength=('float', 0.5, 0.0, 1.0), gamma=('float', 0.7, 0.1, 5.0))
+def screen_blend(pixels: np.ndarray, strength: float = 0.5, gamma: float = 0.7) -> np.ndarray:
+    '''"Экран": цвета осветляются на strength, альфа = яркость ** gamma — чёрный фон исчезает.
+    Альфа отличается от расчёта во float не более чем на 3 уровня, только в самых тёмных тонах'''
+    out = np.empty_like(pixels)
+    lut = screen_lut(strength)
+    for channel in range(3):
+        np.take(lut, pixels[:, :, channel], out=out[:, :, channel], mode='clip')
+    np.take(curve_lut(gamma), luminance8(pixels), out=out[:, :, 3], mode='clip')
+    return out
+
+
+@blend_mode('multiply', version=1, strength=('float', 1.0, 0.0, 1.0), gamma=('float', 1.0, 0.1, 5.0))
+def multiply_blend(pixels: np.ndarray, strength: float = 1.0, gamma: float = 1.0) -> np.ndarray:
+    '''"Умножение": цвета без изменений, альфа = strength * (1 - яркость) ** gamma — белый фон исчезает'''
+    out = np.empty_like(pixels)
+    out[:, :, :3] = pixels[:, :, :3]
+    np.take(curve_lut(gamma, strength, True), luminance8(pixels), out=out[:, :, 3], mode='clip')
+    np.minimum(out[:, :, 3], pixels[:, :, 3], out=out[:, :, 3])
+    return out
+
+
+@blend_mode('chroma_key', version=1, color=('color', '#ffffff', None, None),
+            tolerance=('int', 40, 0, 441), softness=('int', 20, 0, 441))
+def chroma_key_blend(pixels: np.ndarray, color: str = '#ffffff', tolerance: int = 40, softness: int = 20) -> np.ndarray:
+    '''Удаление фона цвета color: прозрачно ближе tolerance по RGB, плавный край шириной softness'''
+    distance = np.zeros(pixels.shape[:2], dtype=np.int32)
+    for channel, key in enumerate(parse_color(color)):
+        diff = pixels[:, :, channel].astype(np.int32)
+        diff -= key
+        diff *= diff
+        distance += diff
+    out = pixels.copy()
+    if softness:
+        # Альфа растёт от 0 на tolerance до исходной на tolerance + softness
+        ramp = np.sqrt(distance, dtype=np.float32)
+        ramp -= tolerance
+        np.clip(ramp, 0, softness, out=ramp)
+        ramp *= out[:, :, 3]
+        ramp /= softness
+        out[:, :, 3] = ramp
+    else:
+        out[:, :, 3][distance <= tolerance * tolerance] = 0
+    return out
+
+
+@blend_mode('threshold', version=1, level=('int', 128, 0, 255), invert=('bool', False, None, None),
+            color=('color', '#ffffff', None, None))
+def threshold_blend(pixels: np.ndarray, level: int = 128, invert: bool = False, color: str = '#ffffff') -> np.ndarray:
+    '''Штриховой рисунок: пиксели темнее level (светлее при invert) — цветом color, остальное прозрачно'''
+    out = np.empty_like(pixels)
+    out[:, :, :3] = parse_color(color)
+    luminance = luminance8(pixels)
+    ink = luminance >= level if invert else luminance < level
+    np.multiply(ink, pixels[:, :, 3], out=out[:, :, 3], dtype=np.uint8, casting='unsafe')
+    return out
+
+
+def apply_mode(pixels: np.ndarray, mode: str, params: Dict[str, Any]) -> np.ndarray:
+    return BLEND_MODES[mode][0](pixels, **params)
+
+
+def blend_tiles(img: Image.Image, mode: str, params: Dict[str, Any]) -> Iterator[np.ndarray]:
+    '''Полосы результата сверху вниз: в памяти одновременно только одна полоса RGBA'''
+    for top in range(0, img.height, TILE_ROWS):
+        strip = img.crop((0, top, img.width, min(img.height, top + TILE_ROWS)))
+        if strip.mode != 'RGBA':
+            strip = strip.convert('RGBA')
+        yield apply_mode(np.asarray(strip), mode, params)
+
+
+def write_png_chunk(buffer: BytesIO, kind: bytes, data: bytes) -> None:
+    buffer.write(struct.pack('>I', len(data)) + kind)
+    buffer.write(data)
+    buffer.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+
+def encode_png(width: int, height: int, strips: Iterator[np.ndarray]) -> bytes:
+    '''RGBA PNG из полос: каждая фильтруется (Sub), сжимается и пишется отдельным IDAT'''
+    buffer = BytesIO()
+    buffer.write(b'\x89PNG\r\n\x1a\n')
+    write_png_chunk(buffer, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+    compressor = zlib.compressobj(PNG_COMPRESS_LEVEL)
+    for strip in strips:
+        rows = strip.reshape(strip.shape[0], width * 4)
+        # Фильтр Sub: разность с пикселем слева по модулю 256
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:5] = rows[:, :4]
+        np.subtract(rows[:, 4:], rows[:, :-4], out=filtered[:, 5:])
+        data = compressor.compress(filtered)
+        if data:
+            write_png_chunk(buffer, b'IDAT', data)
+    write_png_chunk(buffer, b'IDAT', compressor.flush())
+    write_png_chunk(buffer, b'IEND', b'')
+    return buffer.getvalue()
+
+
+def render(source: bytes, max_size: Optional[int], mode: str = DEFAULT_MODE, params: Optional[Dict[str, Any]] = None) -> bytes:
+    '''Общий конвейер режимов: декодирование, уменьшение, режим по полосам, PNG; max_size=None — исходное разрешение'''
+    # Открываем изображение
+    img = Image.open(BytesIO(source))
+    
+    # Уменьшаем размер для ускорения обработки. thumbnail с reducing_gap сам вызывает draft:
+    # JPEG декодируется в 1/2..1/8 размера, но не меньше 2×max_size, что сохраняет качество LANCZOS
+    if max_size and (img.width > max_size or img.height > max_size):
+        img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    
+    # Обработка полосами в uint8 прямо в PNG-поток
+    return encode_png(img.width, img.height, blend_tiles(img, mode, params or {}))
+
+
+def process_item(item: Dict[str, Any], client, transform: Callable[..., bytes]) -> Tuple[Dict[str, Any], str]:
+    '''Один запрос: ответ и статус кэша HIT/MISS. transform — render напрямую или через пул процессов'''
+    image_url = item.get('image_url')
+    if not image_url:
+        raise ValueError('image_url is required')
+    mode, params = parse_mode(item)
+    
+    # inline: true — вернуть ещё и data URL (по умолчанию только ссылка на CDN)
+    inline = bool(item.get('inline'))
+    # full_resolution: true — без уменьшения до MAX_SIZE
+    max_size = None if item.get('full_resolution') else MAX_SIZE
+    key = result_key(image_url, f'{mode}-v{BLEND_MODES[mode][1]}', {'max_size': max_size, **params})
+    
+    if client is not None and find_result(client, key):
+        payload: Dict[str, Any] = {'url': result_url(key)}
+        if inline:
+            payload['processed_image'] = to_data_url(load_result(client, key))
+        return payload, 'HIT'
+    
+    # Скачиваем изображение
+    response = requests.get(image_url, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    
+    png = transform(response.content, max_size, mode, params)
+    
+    payload = {}
+    if client is not None:
+        store_result(client, key, png)
+        payload['url'] = result_url(key)
+    if inline or client is None:
+        payload['processed_image'] = to_data_url(png)
+    return payload, 'MISS'
+
+
+def available_cores() -> int:
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def transform_pool() -> Optional[Executor]:
+    '''
+    Пул процессов по числу ядер, общий для вызовов; None, если процессы недоступны в окружении.
+    Вызывать до запуска потоков загрузки: с fork все процессы пула создаются на первой задаче,
+    и fork из процесса с живыми потоками может унаследовать чужую захваченную блокировку
+    '''
+    if 'transform' not in _pools:
+        pool = None
+        # Задачи передаются в процессы по имени модуля: без него в sys.modules pickle не сработает
+        if sys.modules.get(render.__module__) is not None and available_cores() > 1:
+            try:
+                pool = ProcessPoolExecutor(max_workers=available_cores())
+                # Пустая задача сразу запускает все процессы, пока других потоков нет
+                pool.submit(os.getpid).result()
+            except (OSError, NotImplementedError, ImportError, BrokenProcessPool):
+                pool = None
+        _pools['transform'] = pool
+    return _pools['transform']
+
+
+def parse_deadline(value: Any) -> float:
+    '''deadline пакета в секундах: по умолчанию и не больше BATCH_DEADLINE; ValueError для нечисла и <= 0'''
+    if value is None:
+        return BATCH_DEADLINE
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError
+    deadline = float(value)
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise ValueError
+    return min(deadline, BATCH_DEADLINE)
+
+
+def process_batch(items: List[Dict[str, Any]], deadline: float) -> List[Dict[str, Any]]:
+    '''
+    Ответы по порядку items; не уложившиеся в deadline (секунды) получают ошибку.
+    После дедлайна задачи в очереди пула отменяются, но уже начатый в процессе render
+    не прерывается и досчитывается, занимая ядро под следующие запросы.
+    '''
+    started = time.monotonic()
+    client = s3_client()
+    # Пул создаётся до потоков загрузки, см. transform_pool
+    pool = transform_pool()
+    
+    def transform(*args: Any) -> bytes:
+        # Загрузка могла закончиться уже после дедлайна: такую задачу в пул не отправляем
+        remaining = started + deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError
+        if pool is None:
+            return render(*args)
+        future = pool.submit(render, *args)
+        try:
+            return future.result(timeout=remaining)
+        except TimeoutError:
+            future.cancel()
+            raise
+    
+    def run(item: Dict[str, Any]) -> Dict[str, Any]:
+        payload, cache_status = process_item(item, client, transform)
+        return {**payload, 'cached': cache_status == 'HIT'}
+    
+    downloads = ThreadPoolExecutor(max_workers=min(BATCH_DOWNLOAD_WORKERS, len(items)))
+    futures = [downloads.submit(run, item) for item in items]
+    wait(futures, timeout=deadline)
+    # Не дожидаемся зависших загрузок: ответ уходит к дедлайну
+    downloads.shutdown(wait=False, cancel_futures=True)
+    
+    results = []
+    for future in futures:
+        if future.cancelled() or not future.done() or isinstance(future.exception(), TimeoutError):
+            results.append({'error': f'deadline of {deadline:g}s exceeded'})
+        elif future.exception() is not None:
+            results.append({'error': str(future.exception())})
+        else:
+            results.append(future.result())
+    return results
+
+
 def handler(event, context):
     '''
-    Обрабатывает изображение в режиме "Экран" - убирает чёрный фон
-    Args: event - dict с httpMethod, body (JSON с image_url)
+    Обрабатывает изображение в одном из режимов BLEND_MODES (по умолчанию "Экран" - убирает чёрный фон)
+    Args: event - dict с httpMethod, body (JSON с image_url, mode, params, inline, full_resolution
+          или items — список таких объектов и deadline в секундах для пакета)
           context - объект с request_id
-    Returns: HTTP response с обработанным изображением в base64
+    Returns: HTTP response со ссылкой на обработанное изображение (url),
+             data URL в processed_image — только при inline: true или без бакета;
+             для пакета — results в порядке items, у каждого url или error
     '''
     method = event.get('httpMethod', 'GET')
     
@@ -37,9 +459,34 @@ def handler(event, context):
     
     try:
         body_data = json.loads(event.get('body', '{}'))
-        image_url = body_data.get('image_url')
         
-        if not image_url:
+        if 'items' in body_data:
+            items = body_data.get('items')
+            if not isinstance(items, list) or not items or len(items) > BATCH_MAX_ITEMS:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': f'items must be a list of 1 to {BATCH_MAX_ITEMS} objects'}),
+                    'isBase64Encoded': False
+                }
+            try:
+                deadline = parse_deadline(body_data.get('deadline'))
+            except ValueError:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': f'deadline must be a number of seconds in (0, {BATCH_DEADLINE:g}]'}),
+                    'isBase64Encoded': False
+                }
+            results = process_batch([item if isinstance(item, dict) else {} for item in items], deadline)
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'results': results}),
+                'isBase64Encoded': False
+            }
+        
+        if not body_data.get('image_url'):
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -47,59 +494,21 @@ def handler(event, context):
                 'isBase64Encoded': False
             }
         
-        # Скачиваем изображение
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        
-        # Открываем изображение
-        img = Image.open(BytesIO(response.content))
-        
-        # Уменьшаем размер для ускорения обработки
-        max_size = 1200
-        if img.width > max_size or img.height > max_size:
-            img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-        
-        # Конвертируем в RGBA если нужно
-        if img.mode != 'RGBA':
-            img = img.convert('RGBA')
-        
-        # Конвертируем в numpy array для быстрой обработки
-        img_array = np.array(img, dtype=np.float32) / 255.0
-        
-        # Разделяем каналы
-        r, g, b, a = img_array[:, :, 0], img_array[:, :, 1], img_array[:, :, 2], img_array[:, :, 3]
-        
-        # Вычисляем яркость
-        luminance = 0.299 * r + 0.587 * g + 0.114 * b
-        
-        # Применяем screen blend mode (векторная операция)
-        screen_r = 1 - (1 - r) * 0.5
-        screen_g = 1 - (1 - g) * 0.5
-        screen_b = 1 - (1 - b) * 0.5
-        
-        # Новый альфа-канал на основе яркости
-        new_a = np.power(luminance, 0.7)
-        
-        # Собираем обратно
-        result = np.stack([screen_r, screen_g, screen_b, new_a], axis=2)
-        result = (result * 255).astype(np.uint8)
-        
-        # Создаем новое изображение
-        img = Image.fromarray(result, 'RGBA')
-        
-        # Сохраняем в буфер
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
-        # Конвертируем в base64
-        img_base64 = base64.b64encode(buffer.read()).decode('utf-8')
-        data_url = f'data:image/png;base64,{img_base64}'
+        try:
+            parse_mode(body_data)
+        except ValueError as e:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
         
+        payload, cache_status = process_item(body_data, s3_client(), render)
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'processed_image': data_url}),
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'X-Cache': cache_status},
+            'body': json.dumps(payload),
             'isBase64Encoded': False
         }
         
@@ -1,12 +1,439 @@
+import base64
+import hashlib
+import gzip
 import json
 import os
-from typing import Dict, Any, Optional, List
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Set, Tuple
 import psycopg2
 from psycopg2.extras import RealDictCursor
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+CACHE_TTL = float(os.environ.get('CACHE_TTL', '60'))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', '64'))
+# Сколько вариантов списка колонок (fields=) готовить на одном соединении; дальше — без PREPARE
+DB_PREPARED_MAX_VARIANTS = int(os.environ.get('DB_PREPARED_MAX_VARIANTS', '16'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+# Имена prepared statements, уже подготовленных на каждом соединении пула
+_db_prepared: Dict[int, Set[str]] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    _db_prepared.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
 def get_db_connection():
-    '''Создание подключения к базе данных'''
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        _db_prepared.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
+
+# Все запросы модуля: текст неизменен, значения передаются как $1..$n.
+# Необязательные фильтры списка — NULL/false, чтобы план был один на все комбинации.
+PREPARED_STATEMENTS: Dict[str, str] = {
+    'category_by_id': "SELECT * FROM categories WHERE id = $1 AND is_active = true",
+    'category_list': "SELECT * FROM categories WHERE is_active = true ORDER BY display_order, name",
+    'category_insert': """
+        INSERT INTO categories (name, slug, description, is_active, display_order)
+        VALUES ($1, $2, $3, true, 999)
+        RETURNING *
+    """,
+    'category_update': """
+        UPDATE categories
+        SET name = $1, slug = $2, description = $3, updated_at = NOW()
+        WHERE id = $4
+        RETURNING *
+    """,
+    'category_deactivate': "UPDATE categories SET is_active = false WHERE id = $1",
+    'product_by_id': """
+        SELECT p.*, c.name as category_name, c.slug as category_slug
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id = $1
+    """,
+    'product_by_slug': """
+        SELECT p.*, c.name as category_name, c.slug as category_slug
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.slug = $1
+    """,
+    'product_by_ids': """
+        SELECT {columns}
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.id = ANY($1::int[])
+    """,
+    'product_by_slugs': """
+        SELECT {columns}
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE p.slug = ANY($1::text[])
+    """,
+    'product_list': """
+        SELECT {columns}
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE ($1::int IS NULL OR p.category_id = $1)
+          AND ($2::text IS NULL OR c.slug = $2)
+          AND (NOT $3::boolean OR p.in_stock = true)
+          AND (NOT $4::boolean OR p.is_featured = true)
+        ORDER BY p.display_order, p.created_at DESC, p.id DESC
+        LIMIT $5
+    """,
+    'product_list_after': """
+        SELECT {columns}
+        FROM products p
+        LEFT JOIN categories c ON p.category_id = c.id
+        WHERE ($1::int IS NULL OR p.category_id = $1)
+          AND ($2::text IS NULL OR c.slug = $2)
+          AND (NOT $3::boolean OR p.in_stock = true)
+          AND (NOT $4::boolean OR p.is_featured = true)
+          AND (p.display_order > $6 OR (p.display_order = $6 AND (p.created_at, p.id) < ($7, $8)))
+        ORDER BY p.display_order, p.created_at DESC, p.id DESC
+        LIMIT $5
+    """,
+    'product_insert': """
+        INSERT INTO products
+        (name, slug, description, price, old_price, image_url, material, size, sku, polish,
+         category_id, in_stock, is_featured, is_price_from, display_order)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, 999)
+        RETURNING *
+    """,
+    'product_update': """
+        UPDATE products
+        SET name = $1, slug = $2, description = $3,
+            price = $4, old_price = $5, image_url = $6,
+            material = $7, size = $8, sku = $9, polish = $10,
+            category_id = $11,
+            in_stock = $12, is_featured = $13, is_price_from = $14, updated_at = NOW()
+        WHERE id = $15
+        RETURNING *
+    """,
+    'product_delete': "DELETE FROM products WHERE id = $1",
+}
+
+def execute_prepared(cursor, name: str, args: Tuple[Any, ...] = (), columns: Optional[str] = None) -> None:
+    '''
+    EXECUTE именованного запроса; PREPARE выполняется один раз на соединение.
+    columns подставляется в {columns} шаблона, каждый список колонок готовится под своим именем;
+    сверх DB_PREPARED_MAX_VARIANTS вариантов на соединение запрос выполняется без PREPARE.
+    '''
+    sql = PREPARED_STATEMENTS[name]
+    prepared = _db_prepared.setdefault(id(cursor.connection), set())
+    if columns is not None:
+        name = f"{name}_{hashlib.md5(columns.encode('utf-8')).hexdigest()[:10]}"
+        sql = sql.replace('{columns}', columns)
+        variants = sum(1 for known in prepared if known not in PREPARED_STATEMENTS)
+        if name not in prepared and variants >= DB_PREPARED_MAX_VARIANTS:
+            cursor.execute(re.sub(r'\$(\d+)', r'%(p\1)s', sql), {f'p{i}': value for i, value in enumerate(args, 1)})
+            return
+    if name not in prepared:
+        cursor.execute(f'PREPARE {name} AS {sql}')
+        prepared.add(name)
+    if args:
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(args))})", args)
+    else:
+        cursor.execute(f'EXECUTE {name}')
+
+# Поля списка товаров для fields= и их выражения в SELECT
+PRODUCT_FIELDS: Dict[str, str] = {
+    **{name: f'p.{name}' for name in (
+        'id', 'category_id', 'name', 'slug', 'description', 'price', 'old_price', 'is_price_from',
+        'image_url', 'gallery_urls', 'in_stock', 'is_featured', 'display_order', 'material', 'size',
+        'weight', 'color', 'sku', 'polish', 'metadata', 'created_at', 'updated_at'
+    )},
+    'category_name': 'c.name as category_name',
+    'category_slug': 'c.slug as category_slug',
+}
+PRODUCT_ALL_COLUMNS = 'p.*, c.name as category_name, c.slug as category_slug'
+# Колонки ключа пагинации выбираются всегда, в JSON попадают только запрошенные
+PRODUCT_KEYSET_FIELDS = ('display_order', 'created_at', 'id')
+
+# Пресеты fields=: card — карточка каталога, full — все поля (как без fields)
+FIELD_PRESETS: Dict[str, Optional[List[str]]] = {
+    'card': ['id', 'slug', 'name', 'price', 'old_price', 'is_price_from', 'image_url',
+             'in_stock', 'is_featured', 'category_name', 'category_slug'],
+    'full': None,
+}
+
+def select_fields(params: Dict[str, Any], available: Dict[str, str]) -> Optional[List[str]]:
+    '''Поля из fields=: пресет или имена через запятую; None — все поля, ValueError — неизвестные'''
+    value = (params.get('fields') or '').strip()
+    if not value:
+        return None
+    if value in FIELD_PRESETS:
+        return FIELD_PRESETS[value]
+    fields = list(dict.fromkeys(field.strip() for field in value.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise ValueError(', '.join(unknown))
+    return fields
+
+def select_columns(fields: Optional[List[str]], required: Tuple[str, ...] = ()) -> str:
+    '''
+    SELECT-список под запрошенные поля плюс обязательные (ключ пагинации, ключ выборки).
+    Колонки идут в порядке PRODUCT_FIELDS: перестановки fields= дают один и тот же prepared statement.
+    '''
+    if fields is None:
+        return PRODUCT_ALL_COLUMNS
+    wanted = {*fields, *required}
+    return ', '.join(expr for field, expr in PRODUCT_FIELDS.items() if field in wanted)
+
+def encode_cursor(key: List[Any]) -> str:
+    '''Непрозрачный cursor из ключа сортировки последней строки страницы'''
+    return base64.urlsafe_b64encode(dumps(key).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(value: str, size: int) -> Optional[List[Any]]:
+    '''Ключ сортировки из cursor; None для первой страницы, ValueError для битого значения'''
+    if not value:
+        return None
+    key = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+    if not isinstance(key, list) or len(key) != size:
+        raise ValueError('cursor')
+    return key
+
+def parse_int_param(params: Dict[str, Any], name: str, default: Optional[int] = None,
+                    minimum: int = -2**31) -> Optional[int]:
+    '''Целый параметр запроса в диапазоне int4 (как колонки в базе); ValueError с именем параметра'''
+    value = params.get(name)
+    if value is None or str(value).strip() == '':
+        return default
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise ValueError(name)
+    if not minimum <= number < 2**31:
+        raise ValueError(name)
+    return number
+
+def product_cursor(value: str) -> Optional[List[Any]]:
+    '''cursor списка товаров: [display_order, created_at, id] с проверкой типов, чтобы битое значение не дошло до базы'''
+    try:
+        key = decode_cursor(value, 3)
+        if key is None:
+            return None
+        display_order, created_at, product_id = key
+        for number in (display_order, product_id):
+            if number is not None and (isinstance(number, bool) or not isinstance(number, int) or not -2**31 <= number < 2**31):
+                raise ValueError
+        if product_id is None or (created_at is not None and not isinstance(created_at, str)):
+            raise ValueError
+        if created_at is not None:
+            datetime.fromisoformat(created_at)
+    except ValueError:
+        raise ValueError('cursor')
+    return key
+
+
+def _json_default(value: Any) -> str:
+    '''Decimal, date/datetime и UUID из строк psycopg2 — их str(), как раньше с default=str'''
+    return str(value)
+
+def dumps(data: Any) -> str:
+    '''Компактный UTF-8 JSON ответа; orjson, если установлен, иначе stdlib с тем же результатом побайтно'''
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATETIME).decode('utf-8')
+    return json.dumps(data, default=_json_default, ensure_ascii=False, separators=(',', ':'))
+
+def get_catalog_etag(conn, tables: Tuple[str, ...], params: Dict[str, Any]) -> Optional[str]:
+    '''ETag из счётчиков версий таблиц и параметров запроса, без чтения самих строк'''
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT table_name, version FROM catalog_versions WHERE table_name = ANY(%s) ORDER BY table_name",
+        (list(tables),)
+    )
+    rows = cursor.fetchall()
+    if len(rows) != len(tables):
+        return None
+    stamp = ';'.join(f'{name}:{version}' for name, version in rows)
+    query = '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+    return '"' + hashlib.md5(f'{stamp}|{query}'.encode('utf-8')).hexdigest()[:20] + '"'
+
+def bump_catalog_version(conn, *tables: str) -> None:
+    '''Увеличение счётчиков версий в транзакции записи'''
+    conn.cursor().execute(
+        """
+        INSERT INTO catalog_versions (table_name) SELECT unnest(%s::text[])
+        ON CONFLICT (table_name) DO UPDATE SET version = catalog_versions.version + 1, updated_at = NOW()
+        """,
+        (list(tables),)
+    )
+
+def etag_matches(event: Dict[str, Any], etag: Optional[str]) -> bool:
+    if not etag:
+        return False
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'if-none-match'), '') or ''
+    tags = [tag.strip().removeprefix('W/') for tag in value.split(',')]
+    return etag in tags or '*' in tags
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {'ETag': etag, 'Cache-Control': 'no-cache', 'Access-Control-Allow-Origin': '*'},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def with_etag(response: Dict[str, Any], etag: Optional[str]) -> Dict[str, Any]:
+    if etag and response['statusCode'] == 200:
+        response['headers'] = {**response['headers'], 'ETag': etag, 'Cache-Control': 'no-cache'}
+    return response
+
+# Кэш готовых GET-ответов: ключ — раздел и нормализованные параметры, LRU по CACHE_MAX_ENTRIES.
+# Рядом с ответом хранятся его сжатые формы по кодировке (base64)
+_response_cache: 'OrderedDict[str, Tuple[float, Dict[str, Any], Dict[str, str]]]' = OrderedDict()
+_cache_stats: Dict[str, int] = {'hits': 0, 'misses': 0}
+
+def accepted_encoding(event: Dict[str, Any]) -> Optional[str]:
+    '''br или gzip из Accept-Encoding (br — только если установлен brotli); q=0 отключает кодировку'''
+    headers = event.get('headers') or {}
+    value = next((v for k, v in headers.items() if k.lower() == 'accept-encoding'), '') or ''
+    accepted = set()
+    for part in value.split(','):
+        name, _, quality = part.partition(';')
+        quality = quality.strip()
+        try:
+            weight = float(quality[2:]) if quality.startswith('q=') else 1.0
+        except ValueError:
+            weight = 1.0
+        if weight > 0:
+            accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any], variants: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    '''
+    Сжатие текстового тела от COMPRESS_MIN_BYTES под Accept-Encoding клиента; тело уходит в base64.
+    variants — сжатые формы этого же тела из кэша ответов, пополняются при первом сжатии.
+    '''
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = accepted_encoding(event)
+    if not encoding:
+        return {**response, 'headers': {**response['headers'], 'Vary': 'Accept-Encoding'}}
+    encoded = variants.get(encoding) if variants is not None else None
+    if encoded is None:
+        data = body.encode('utf-8')
+        packed = brotli.compress(data, quality=5) if encoding == 'br' else gzip.compress(data, compresslevel=6)
+        encoded = base64.b64encode(packed).decode('ascii')
+        if variants is not None:
+            variants[encoding] = encoded
+    headers = {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    return {**response, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+def cache_key(scope: str, params: Dict[str, Any]) -> str:
+    return scope + '?' + '&'.join(f'{key}={value}' for key, value in sorted(params.items()))
+
+def cache_get(key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, str]]]:
+    '''Ответ и его сжатые формы из кэша, если запись моложе CACHE_TTL; считает попадания и промахи'''
+    entry = _response_cache.get(key)
+    if entry and time.monotonic() - entry[0] <= CACHE_TTL:
+        _response_cache.move_to_end(key)
+        _cache_stats['hits'] += 1
+        return entry[1], entry[2]
+    _response_cache.pop(key, None)
+    _cache_stats['misses'] += 1
+    return None
+
+def cache_put(key: str, response: Dict[str, Any]) -> Dict[str, str]:
+    '''Сохранение ответа; возвращает словарь для его сжатых форм (вне кэша — одноразовый)'''
+    variants: Dict[str, str] = {}
+    if response['statusCode'] == 200 and CACHE_MAX_ENTRIES > 0:
+        _response_cache[key] = (time.monotonic(), response, variants)
+        _response_cache.move_to_end(key)
+        while len(_response_cache) > CACHE_MAX_ENTRIES:
+            _response_cache.popitem(last=False)
+    return variants
+
+def cache_invalidate(scope: str) -> None:
+    '''Сброс всех записей раздела; вызывается после commit в его таблицы'''
+    for key in [key for key in _response_cache if key.startswith(scope + '?')]:
+        del _response_cache[key]
+
+def with_cache_status(response: Dict[str, Any], hit: bool) -> Dict[str, Any]:
+    '''Копия ответа с X-Cache и накопленной статистикой попаданий этого инстанса'''
+    stats = f"hits={_cache_stats['hits']}; misses={_cache_stats['misses']}"
+    return {**response, 'headers': {**response['headers'], 'X-Cache': 'HIT' if hit else 'MISS', 'X-Cache-Stats': stats}}
+
+def cached_response(event: Dict[str, Any], response: Dict[str, Any], variants: Dict[str, str]) -> Dict[str, Any]:
+    etag = response['headers'].get('ETag')
+    if etag_matches(event, etag):
+        return not_modified_response(etag)
+    return compress_response(event, with_cache_status(response, True), variants)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -14,6 +441,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     
     GET /products - получить все товары (с фильтрами)
     GET /products?id=1 - получить товар по ID
+    GET /products?ids=1,2,3 или ?slugs=a,b - товары списком в порядке запроса и missing
+    GET /products?cursor=&limit=20 - страница товаров и next_cursor для следующей
+    GET /products?fields=card - только поля карточки (или fields=id,name,price)
     POST /products - создать товар
     PUT /products?id=1 - обновить товар
     DELETE /products?id=1 - удалить товар
@@ -32,7 +462,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -45,16 +475,39 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if event.get('body'):
         body = json.loads(event['body'])
     
+    is_category = 'categories' in path or params.get('type') == 'categories'
+    
+    # Категории меняются редко: кэш отвечает без похода в базу
+    if method == 'GET' and is_category:
+        cached = cache_get(cache_key('categories', params))
+        if cached:
+            return cached_response(event, *cached)
+    
+    # id — целое в диапазоне int4: иначе 400 до похода в базу, а не 500 от ошибки приведения типа
+    try:
+        record_id = parse_int_param(params, 'id')
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dumps({'error': 'id must be an integer'}),
+            'isBase64Encoded': False
+        }
+    
     conn = get_db_connection()
     
     try:
-        is_category = 'categories' in path or params.get('type') == 'categories'
-        
         if method == 'GET':
+            tables = ('categories',) if is_category else ('categories', 'products')
+            etag = get_catalog_etag(conn, tables, params)
+            if etag_matches(event, etag):
+                return not_modified_response(etag)
             if is_category:
-                return get_categories(conn, params)
+                response = with_etag(get_categories(conn, params), etag)
+                variants = cache_put(cache_key('categories', params), response)
+                return compress_response(event, with_cache_status(response, False), variants)
             else:
-                return get_products(conn, params)
+                return compress_response(event, with_etag(get_products(conn, params), etag))
         
         elif method == 'POST':
             if is_category:
@@ -64,60 +517,59 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         elif method == 'PUT':
             if is_category:
-                return update_category(conn, params.get('id'), body)
+                return update_category(conn, record_id, body)
             else:
-                return update_product(conn, params.get('id'), body)
+                return update_product(conn, record_id, body)
         
         elif method == 'DELETE':
             if is_category:
-                return delete_category(conn, params.get('id'))
+                return delete_category(conn, record_id)
             else:
-                return delete_product(conn, params.get('id'))
+                return delete_product(conn, record_id)
         
         return {
             'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'}),
+            'body': dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
     
     finally:
-        conn.close()
+        release_db_connection(conn)
 
 def get_categories(conn, params: Dict[str, Any]) -> Dict[str, Any]:
     '''Получение категорий'''
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    if params.get('id'):
-        query = f"SELECT * FROM categories WHERE id = {params['id']} AND is_active = true"
-        cursor.execute(query)
+    # id уже проверен в handler
+    category_id = parse_int_param(params, 'id')
+    if category_id is not None:
+        execute_prepared(cursor, 'category_by_id', (category_id,))
         category = cursor.fetchone()
         
         if not category:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Category not found'}),
+                'body': dumps({'error': 'Category not found'}),
                 'isBase64Encoded': False
             }
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(dict(category), default=str),
+            'body': dumps(dict(category)),
             'isBase64Encoded': False
         }
     
     # Все категории
-    cursor.execute(
-        "SELECT * FROM categories WHERE is_active = true ORDER BY display_order, name"
-    )
+    execute_prepared(cursor, 'category_list')
     categories = [dict(row) for row in cursor.fetchall()]
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(categories, default=str),
+        'body': dumps(categories),
         'isBase64Encoded': False
     }
 
@@ -125,97 +577,135 @@ def get_products(conn, params: Dict[str, Any]) -> Dict[str, Any]:
     '''Получение товаров'''
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    # Получение одного товара по ID
-    if params.get('id'):
-        query = f"""
-            SELECT p.*, c.name as category_name, c.slug as category_slug
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            WHERE p.id = {params['id']}
-        """
-        cursor.execute(query)
+    try:
+        fields = select_fields(params, PRODUCT_FIELDS)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dumps({'error': f'Unknown fields: {e}'}),
+            'isBase64Encoded': False
+        }
+    
+    # Пакетная выборка для корзины: ids=1,2,3 или slugs=a,b,c одним запросом
+    if params.get('ids') or params.get('slugs'):
+        return get_products_batch(cursor, params, fields)
+    
+    # Получение одного товара по ID (id уже проверен в handler)
+    product_id = parse_int_param(params, 'id')
+    if product_id is not None:
+        execute_prepared(cursor, 'product_by_id', (product_id,))
         product = cursor.fetchone()
         
         if not product:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Product not found'}),
+                'body': dumps({'error': 'Product not found'}),
                 'isBase64Encoded': False
             }
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(dict(product), default=str),
+            'body': dumps(dict(product)),
             'isBase64Encoded': False
         }
     
     # Получение одного товара по slug
     if params.get('slug'):
-        slug_escaped = params['slug'].replace("'", "''")
-        query = f"""
-            SELECT p.*, c.name as category_name, c.slug as category_slug
-            FROM products p
-            LEFT JOIN categories c ON p.category_id = c.id
-            WHERE p.slug = '{slug_escaped}'
-        """
-        cursor.execute(query)
+        execute_prepared(cursor, 'product_by_slug', (params['slug'],))
         product = cursor.fetchone()
         
         if not product:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Product not found'}),
+                'body': dumps({'error': 'Product not found'}),
                 'isBase64Encoded': False
             }
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(dict(product), default=str),
+            'body': dumps(dict(product)),
             'isBase64Encoded': False
         }
     
-    # Построение запроса с фильтрами
-    query = """
-        SELECT p.*, c.name as category_name, c.slug as category_slug
-        FROM products p
-        LEFT JOIN categories c ON p.category_id = c.id
-        WHERE 1=1
-    """
+    columns = select_columns(fields, PRODUCT_KEYSET_FIELDS)
     
-    # Фильтр по категории
-    if params.get('category_id'):
-        query += f" AND p.category_id = {params['category_id']}"
-    
-    if params.get('category_slug'):
-        slug_escaped = params['category_slug'].replace("'", "''")
-        query += f" AND c.slug = '{slug_escaped}'"
+    # Параметр cursor включает постраничный ответ {items, next_cursor}; без него — прежний массив
+    paginate = 'cursor' in params
+    # Некорректные limit, cursor и category_id — 400, а не ошибка базы с 500
+    try:
+        limit = parse_int_param(params, 'limit', 100, minimum=1)
+        category_id = parse_int_param(params, 'category_id')
+        after = product_cursor(params.get('cursor') or '')
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': dumps({'error': f'Invalid {e}'}),
+            'isBase64Encoded': False
+        }
     
-    # Фильтр по наличию
-    if params.get('in_stock') == 'true':
-        query += " AND p.in_stock = true"
+    # Список с фильтрами: отсутствующий фильтр передаётся как NULL/false
+    filters = (
+        category_id,
+        params.get('category_slug') or None,
+        params.get('in_stock') == 'true',
+        params.get('featured') == 'true',
+        limit + 1 if paginate else limit,
+    )
+    if after:
+        execute_prepared(cursor, 'product_list_after', (*filters, *after), columns)
+    else:
+        execute_prepared(cursor, 'product_list', filters, columns)
+    products = [dict(row) for row in cursor.fetchall()]
     
-    # Фильтр по избранным
-    if params.get('featured') == 'true':
-        query += " AND p.is_featured = true"
+    next_cursor = None
+    if paginate and len(products) > limit:
+        products = products[:limit]
+        last = products[-1]
+        next_cursor = encode_cursor([last['display_order'], last['created_at'], last['id']])
+    if fields is not None:
+        products = [{field: row[field] for field in fields} for row in products]
     
-    # Сортировка
-    query += " ORDER BY p.display_order, p.created_at DESC"
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': dumps({'items': products, 'next_cursor': next_cursor} if paginate else products),
+        'isBase64Encoded': False
+    }
+
+def get_products_batch(cursor, params: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    '''Товары по списку id или slug в порядке запроса; ненайденные ключи — в missing'''
+    by_ids = bool(params.get('ids'))
+    keys = list(dict.fromkeys(key.strip() for key in (params.get('ids') or params.get('slugs')).split(',') if key.strip()))
+    if by_ids:
+        try:
+            keys = list(dict.fromkeys(int(key) for key in keys))
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': dumps({'error': 'ids must be integers'}),
+                'isBase64Encoded': False
+            }
     
-    # Лимит
-    limit = params.get('limit', '100')
-    query += f" LIMIT {limit}"
+    key_field = 'id' if by_ids else 'slug'
+    columns = select_columns(fields, (key_field,))
+    execute_prepared(cursor, 'product_by_ids' if by_ids else 'product_by_slugs', (keys,), columns)
+    found = {row[key_field]: dict(row) for row in cursor.fetchall()}
     
-    cursor.execute(query)
-    products = [dict(row) for row in cursor.fetchall()]
+    products = [found[key] for key in keys if key in found]
+    if fields is not None:
+        products = [{field: row[field] for field in fields} for row in products]
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(products, default=str),
+        'body': dumps({'items': products, 'missing': [key for key in keys if key not in found]}),
         'isBase64Encoded': False
     }
 
@@ -223,94 +713,88 @@ def create_category(conn, data: Dict[str, Any]) -> Dict[str, Any]:
     '''Создание категории'''
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    name = data.get('name', '').replace("'", "''")
-    slug = data.get('slug', '').replace("'", "''")
-    description = data.get('description', '').replace("'", "''")
+    name = data.get('name', '')
+    slug = data.get('slug', '')
+    description = data.get('description', '')
     
     if not name or not slug:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Name and slug are required'}),
+            'body': dumps({'error': 'Name and slug are required'}),
             'isBase64Encoded': False
         }
     
-    query = f"""
-        INSERT INTO categories (name, slug, description, is_active, display_order)
-        VALUES ('{name}', '{slug}', '{description}', true, 999)
-        RETURNING *
-    """
-    cursor.execute(query)
+    execute_prepared(cursor, 'category_insert', (name, slug, description))
+    bump_catalog_version(conn, 'categories')
     conn.commit()
+    cache_invalidate('categories')
     category = cursor.fetchone()
     
     return {
         'statusCode': 201,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(dict(category), default=str),
+        'body': dumps(dict(category)),
         'isBase64Encoded': False
     }
 
-def update_category(conn, category_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+def update_category(conn, category_id: Optional[int], data: Dict[str, Any]) -> Dict[str, Any]:
     '''Обновление категории'''
-    if not category_id:
+    if category_id is None:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Category ID is required'}),
+            'body': dumps({'error': 'Category ID is required'}),
             'isBase64Encoded': False
         }
     
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
-    name = data.get('name', '').replace("'", "''")
-    slug = data.get('slug', '').replace("'", "''")
-    description = data.get('description', '').replace("'", "''")
+    name = data.get('name', '')
+    slug = data.get('slug', '')
+    description = data.get('description', '')
     
-    query = f"""
-        UPDATE categories 
-        SET name = '{name}', slug = '{slug}', description = '{description}', updated_at = NOW()
-        WHERE id = {category_id}
-        RETURNING *
-    """
-    cursor.execute(query)
+    execute_prepared(cursor, 'category_update', (name, slug, description, category_id))
+    bump_catalog_version(conn, 'categories')
     conn.commit()
+    cache_invalidate('categories')
     category = cursor.fetchone()
     
     if not category:
         return {
             'statusCode': 404,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Category not found'}),
+            'body': dumps({'error': 'Category not found'}),
             'isBase64Encoded': False
         }
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps(dict(category), default=str),
+        'body': dumps(dict(category)),
         'isBase64Encoded': False
     }
 
-def delete_category(conn, category_id: str) -> Dict[str, Any]:
+def delete_category(conn, category_id: Optional[int]) -> Dict[str, Any]:
     '''Удаление категории (soft delete)'''
-    if not category_id:
+    if category_id is None:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Category ID is required'}),
+            'body': dumps({'error': 'Category ID is required'}),
             'isBase64Encoded': False
         }
     
     cursor = conn.cursor()
-    query = f"UPDATE categories SET is_active = false WHERE id = {category_id}"
-    cursor.execute(query)
+    execute_prepared(cursor, 'category_deactivate', (category_id,))
+    bump_catalog_version(conn, 'categories')
     conn.commit()
+    cache_invalidate('categories')
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True}),
+        'body': dumps({'success': True}),
         'isBase64Encoded': False
     }
 
@@ -319,16 +803,10 @@ def create_product(conn, data: Dict[str, Any]) -> Dict[str, Any]:
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        name = data.get('name', '').replace("'", "''")
-        slug = data.get('slug', '').replace("'", "''")
-        description = data.get('description', '').replace("'", "''")
+        name = data.get('name', '')
+        slug = data.get('slug', '')
+        description = data.get('description', '')
         price = data.get('price', 0)
-        old_price = data.get('old_price')
-        image_url = data.get('image_url', '').replace("'", "''")
-        material = data.get('material', '').replace("'", "''")
-        size = data.get('size', '').replace("'", "''")
-        sku = data.get('sku', '').replace("'", "''")
-        polish = data.get('polish', '').replace("'", "''")
         category_id = data.get('category_id')
         in_stock = data.get('in_stock', True)
         is_featured = data.get('is_featured', False)
@@ -338,43 +816,36 @@ def create_product(conn, data: Dict[str, Any]) -> Dict[str, Any]:
             return {
                 'statusCode': 400,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Name and slug are required'}),
+                'body': dumps({'error': 'Name and slug are required'}),
                 'isBase64Encoded': False
             }
         
-        old_price_str = f"'{old_price}'" if old_price and old_price != '' else 'NULL'
-        image_url_str = f"'{image_url}'" if image_url and image_url != '' else 'NULL'
-        material_str = f"'{material}'" if material and material != '' else 'NULL'
-        size_str = f"'{size}'" if size and size != '' else 'NULL'
-        sku_str = f"'{sku}'" if sku and sku != '' else 'NULL'
-        polish_str = f"'{polish}'" if polish and polish != '' else 'NULL'
+        # Пустые строки в необязательных полях сохраняются как NULL
+        old_price = data.get('old_price') or None
+        image_url = data.get('image_url') or None
+        material = data.get('material') or None
+        size = data.get('size') or None
+        sku = data.get('sku') or None
+        polish = data.get('polish') or None
         
         # Обработка category_id: может быть строкой, числом или пустым значением
-        if category_id and str(category_id).strip() != '':
-            try:
-                category_id_str = str(int(category_id))
-            except (ValueError, TypeError):
-                category_id_str = 'NULL'
-        else:
-            category_id_str = 'NULL'
+        try:
+            category_id = int(category_id) if category_id and str(category_id).strip() != '' else None
+        except (ValueError, TypeError):
+            category_id = None
         
-        query = f"""
-            INSERT INTO products 
-            (name, slug, description, price, old_price, image_url, material, size, sku, polish,
-             category_id, in_stock, is_featured, is_price_from, display_order)
-            VALUES 
-            ('{name}', '{slug}', '{description}', '{price}', {old_price_str}, {image_url_str}, 
-             {material_str}, {size_str}, {sku_str}, {polish_str}, {category_id_str}, {in_stock}, {is_featured}, {is_price_from}, 999)
-            RETURNING *
-        """
-        cursor.execute(query)
+        execute_prepared(cursor, 'product_insert', (
+            name, slug, description, price, old_price, image_url, material, size, sku, polish,
+            category_id, in_stock, is_featured, is_price_from
+        ))
+        bump_catalog_version(conn, 'products')
         conn.commit()
         product = cursor.fetchone()
         
         return {
             'statusCode': 201,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(dict(product), default=str),
+            'body': dumps(dict(product)),
             'isBase64Encoded': False
         }
     except Exception as e:
@@ -382,65 +853,51 @@ def create_product(conn, data: Dict[str, Any]) -> Dict[str, Any]:
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Failed to create product: {str(e)}'}),
+            'body': dumps({'error': f'Failed to create product: {str(e)}'}),
             'isBase64Encoded': False
         }
 
-def update_product(conn, product_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+def update_product(conn, product_id: Optional[int], data: Dict[str, Any]) -> Dict[str, Any]:
     '''Обновление товара'''
-    if not product_id:
+    if product_id is None:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Product ID is required'}),
+            'body': dumps({'error': 'Product ID is required'}),
             'isBase64Encoded': False
         }
     
     cursor = conn.cursor(cursor_factory=RealDictCursor)
     
     try:
-        name = data.get('name', '').replace("'", "''")
-        slug = data.get('slug', '').replace("'", "''")
-        description = data.get('description', '').replace("'", "''")
+        name = data.get('name', '')
+        slug = data.get('slug', '')
+        description = data.get('description', '')
         price = data.get('price', 0)
-        old_price = data.get('old_price')
-        image_url = data.get('image_url', '').replace("'", "''")
-        material = data.get('material', '').replace("'", "''")
-        size = data.get('size', '').replace("'", "''")
-        sku = data.get('sku', '').replace("'", "''")
-        polish = data.get('polish', '').replace("'", "''")
         category_id = data.get('category_id')
         in_stock = data.get('in_stock', True)
         is_featured = data.get('is_featured', False)
         is_price_from = data.get('is_price_from', False)
         
-        old_price_str = f"'{old_price}'" if old_price and old_price != '' else 'NULL'
-        image_url_str = f"'{image_url}'" if image_url and image_url != '' else 'NULL'
-        material_str = f"'{material}'" if material and material != '' else 'NULL'
-        size_str = f"'{size}'" if size and size != '' else 'NULL'
-        sku_str = f"'{sku}'" if sku and sku != '' else 'NULL'
-        polish_str = f"'{polish}'" if polish and polish != '' else 'NULL'
+        # Пустые строки в необязательных полях сохраняются как NULL
+        old_price = data.get('old_price') or None
+        image_url = data.get('image_url') or None
+        material = data.get('material') or None
+        size = data.get('size') or None
+        sku = data.get('sku') or None
+        polish = data.get('polish') or None
         
         # Обработка category_id: может быть строкой, числом или пустым значением
-        if category_id and str(category_id).strip() != '':
-            try:
-                category_id_str = str(int(category_id))
-            except (ValueError, TypeError):
-                category_id_str = 'NULL'
-        else:
-            category_id_str = 'NULL'
+        try:
+            category_id = int(category_id) if category_id and str(category_id).strip() != '' else None
+        except (ValueError, TypeError):
+            category_id = None
         
-        query = f"""
-            UPDATE products 
-            SET name = '{name}', slug = '{slug}', description = '{description}',
-                price = '{price}', old_price = {old_price_str}, image_url = {image_url_str},
-                material = {material_str}, size = {size_str}, sku = {sku_str}, polish = {polish_str},
-                category_id = {category_id_str},
-                in_stock = {in_stock}, is_featured = {is_featured}, is_price_from = {is_price_from}, updated_at = NOW()
-            WHERE id = {product_id}
-            RETURNING *
-        """
-        cursor.execute(query)
+        execute_prepared(cursor, 'product_update', (
+            name, slug, description, price, old_price, image_url, material, size, sku, polish,
+            category_id, in_stock, is_featured, is_price_from, product_id
+        ))
+        bump_catalog_version(conn, 'products')
         conn.commit()
         product = cursor.fetchone()
         
@@ -448,14 +905,14 @@ def update_product(conn, product_id: str, data: Dict[str, Any]) -> Dict[str, Any
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Product not found'}),
+                'body': dumps({'error': 'Product not found'}),
                 'isBase64Encoded': False
             }
         
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(dict(product), default=str),
+            'body': dumps(dict(product)),
             'isBase64Encoded': False
         }
     except Exception as e:
@@ -463,28 +920,28 @@ def update_product(conn, product_id: str, data: Dict[str, Any]) -> Dict[str, Any
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': f'Failed to update product: {str(e)}'}),
+            'body': dumps({'error': f'Failed to update product: {str(e)}'}),
             'isBase64Encoded': False
         }
 
-def delete_product(conn, product_id: str) -> Dict[str, Any]:
+def delete_product(conn, product_id: Optional[int]) -> Dict[str, Any]:
     '''Удаление товара'''
-    if not product_id:
+    if product_id is None:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Product ID is required'}),
+            'body': dumps({'error': 'Product ID is required'}),
             'isBase64Encoded': False
         }
     
     cursor = conn.cursor()
-    query = f"DELETE FROM products WHERE id = {product_id}"
-    cursor.execute(query)
+    execute_prepared(cursor, 'product_delete', (product_id,))
+    bump_catalog_version(conn, 'products')
     conn.commit()
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'success': True}),
+        'body': dumps({'success': True}),
         'isBase64Encoded': False
     }
\ No newline at end of file
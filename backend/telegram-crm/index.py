@@ -1,7 +1,76 @@
 import json
 import os
+import time
 import psycopg2
 from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
 
 def handler(event: dict, context) -> dict:
     '''CRM-бот для сохранения обращений клиентов в базу данных'''
@@ -75,8 +144,7 @@ def handler(event: dict, context) -> dict:
                     username = match.group(1)
                     
                     # Находим telegram_id клиента по username
-                    db_url = os.environ.get('DATABASE_URL')
-                    conn = psycopg2.connect(db_url)
+                    conn = get_db_connection()
                     cur = conn.cursor()
                     schema = 't_p78642605_single_page_website_'
                     
@@ -86,7 +154,7 @@ def handler(event: dict, context) -> dict:
                     )
                     result = cur.fetchone()
                     cur.close()
-                    conn.close()
+                    release_db_connection(conn)
                     
                     if result:
                         client_telegram_id = result[0]
@@ -117,8 +185,7 @@ def handler(event: dict, context) -> dict:
         full_name = message['from'].get('first_name', '') + ' ' + message['from'].get('last_name', '')
         full_name = full_name.strip()
         
-        db_url = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(db_url)
+        conn = get_db_connection()
         cur = conn.cursor()
         schema = 't_p78642605_single_page_website_'
         
@@ -148,7 +215,7 @@ def handler(event: dict, context) -> dict:
         
         conn.commit()
         cur.close()
-        conn.close()
+        release_db_connection(conn)
         
         import urllib.request
         import urllib.parse
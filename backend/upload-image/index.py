@@ -1,17 +1,773 @@
 '''
 Business: Загрузка изображений на CDN сервер
 Args: event - dict с httpMethod, body (base64 encoded image)
+      или body с action: create (выдать presigned POST в бакет) / finalize (проверить и зарегистрировать)
+      Файлы хранятся по SHA-256 содержимого: повторная загрузка тех же байт возвращает уже лежащий объект
+      GET ?key=uploads/... отдаёт файл из локального хранилища (с поддержкой Range)
+      action: near_duplicates — похожие изображения из индекса перцептивных хешей (image_hashes)
       context - object с request_id
 Returns: HTTP response с URL загруженного изображения
 '''
 
 import json
 import base64
+import hashlib
+import re
+import shutil
+import tempfile
+import time
 import uuid
 import os
-from typing import Dict, Any
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from typing import BinaryIO, Dict, Any, List, Optional, Tuple, Union
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import psycopg2
+except ImportError:
+    psycopg2 = None
+
+S3_ENDPOINT = 'https://bucket.poehali.dev'
+S3_BUCKET = 'files'
+# Хранилище: s3 — бакет files за CDN (по умолчанию, если заданы ключи), local — каталог на диске, файлы отдаёт
+# GET этой же функции. local включается только явно (UPLOAD_STORAGE=local) и с постоянным UPLOAD_LOCAL_DIR:
+# /tmp инстанса пропадает при холодном старте, а URL уже сохранены в таблицах. Без настройки — 503
+STORAGE_BACKEND = os.environ.get('UPLOAD_STORAGE', '')
+LOCAL_STORAGE_DIR = os.environ.get('UPLOAD_LOCAL_DIR', '')
+LOCAL_PUBLIC_URL = os.environ.get('UPLOAD_PUBLIC_URL', 'https://functions.poehali.dev/131d63b7-bef6-496a-a392-c04e347cd6aa')
+# Прямая загрузка: файл уходит presigned POST-ом в бакет (лимит размера — в условии политики),
+# во временный ключ uploads/incoming/; finalize читает его потоком для хеша и производных
+UPLOAD_PREFIX = 'uploads/'
+UPLOAD_INCOMING_PREFIX = 'uploads/incoming/'
+UPLOAD_URL_EXPIRES = 900
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+UPLOAD_READ_CHUNK = 1024 * 1024
+# Больше этого загруженный файл в finalize лежит во временном файле на диске, а не в памяти
+UPLOAD_SPOOL_BYTES = 4 * 1024 * 1024
+# Брошенные сессии (POST без finalize) удаляются не раньше двух сроков подписи, проверка — не чаще раза в 10 минут
+UPLOAD_SWEEP_INTERVAL = 600
+UPLOAD_CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'heic': 'image/heic'
+}
+# Производные после загрузки: имя:максимальная сторона:формат, через запятую (UPLOAD_DERIVATIVES).
+# Ключ производной выводится из ключа оригинала: uploads/<id>.jpg -> uploads/<id>@thumb.webp
+DEFAULT_DERIVATIVES = 'thumb:320:webp,medium:1024:webp,thumb_avif:320:avif,medium_avif:1024:avif'
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'avif': ('AVIF', 'image/avif', {'quality': 60}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 82, 'optimize': True}),
+    'png': ('PNG', 'image/png', {'optimize': True})
+}
+DERIVATIVE_WORKERS = 4
+DERIVATIVE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+FILE_ID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+CONTENT_ID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+SERVED_KEY_PATTERN = re.compile(r'^uploads/[0-9a-f]{64}(@[a-z0-9_]+)?\.[a-z0-9]+$')
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Индекс дедупликации: сам бакет (ключ — хеш содержимого) плюс память тёплого процесса,
+# чтобы повторы не стоили даже HEAD
+KNOWN_UPLOADS_MAX = 1024
+CONTENT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Индекс почти-дубликатов: dHash ищется по 8 байтовым полосам (см. V0034), pHash — для сверки
+HASH_BANDS = 8
+HASH_MASK = (1 << 64) - 1
+NEAR_DUPLICATE_DISTANCE = int(os.environ.get('IMAGE_NEAR_DUPLICATE_DISTANCE', '6'))
+NEAR_DUPLICATE_LIMIT = 20
+
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '2'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '300'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+_s3: Dict[str, Any] = {}
+_last_sweep: Dict[str, float] = {}
+# Пул живёт на уровне модуля и переживает тёплые вызовы функции
+_db_pool: List[Tuple[Any, float]] = []
+_db_created_at: Dict[int, float] = {}
+_known_uploads: 'OrderedDict[str, int]' = OrderedDict()
+_dedup_stats: Dict[str, int] = {'stored': 0, 'duplicates': 0, 'bytes_saved': 0}
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    '''Первый и последний байт из Range: bytes=a-b, a- или -n; None — заголовка нет или он не разобран.
+    ValueError — диапазон за пределами файла (416)'''
+    match = RANGE_PATTERN.match((header or '').strip())
+    if not match or not (match.group(1) or match.group(2)):
+        return None
+    if not match.group(1):
+        start, end = max(0, size - int(match.group(2))), size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if start >= size or start > end:
+        raise ValueError(f'Range not satisfiable for {size} bytes')
+    return start, end
+
+
+def content_type_for(key: str) -> str:
+    extension = key.rsplit('.', 1)[-1]
+    if extension in UPLOAD_CONTENT_TYPES:
+        return UPLOAD_CONTENT_TYPES[extension]
+    return DERIVATIVE_FORMATS[extension][1] if extension in DERIVATIVE_FORMATS else 'application/octet-stream'
+
+
+class LocalStorage:
+    '''Каталог на диске с тем подмножеством методов boto3-клиента S3, которым пользуется функция,
+    поэтому загрузка, дедупликация и производные не различают бэкенды. Bucket игнорируется'''
+    
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+    
+    def _path(self, key: str) -> str:
+        path = os.path.realpath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Invalid key: {key}')
+        return path
+    
+    def _stat(self, key: str, operation: str) -> os.stat_result:
+        try:
+            return os.stat(self._path(key))
+        except FileNotFoundError:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': key}}, operation)
+    
+    def _write(self, key: str, source: Any) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Запись через временный файл: параллельный GET не увидит половину изображения
+        tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'wb') as f:
+            if isinstance(source, (bytes, bytearray)):
+                f.write(source)
+            else:
+                shutil.copyfileobj(source, f)
+        os.replace(tmp_path, path)
+    
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kwargs) -> Dict[str, Any]:
+        self._write(Key, Body)
+        return {}
+    
+    def head_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        stat = self._stat(Key, 'HeadObject')
+        return {'ContentLength': stat.st_size, 'ContentType': content_type_for(Key), 'LastModified': stat.st_mtime}
+    
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        size = self._stat(Key, 'GetObject').st_size
+        start, end = parse_range(Range, size) or (0, size - 1)
+        with open(self._path(Key), 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start + 1)
+        return {'Body': BytesIO(data), 'ContentLength': len(data), 'ContentType': content_type_for(Key),
+                'ContentRange': f'bytes {start}-{end}/{size}'}
+    
+    def copy_object(self, Bucket: str, Key: str, CopySource: Dict[str, str], **kwargs) -> Dict[str, Any]:
+        self._stat(CopySource['Key'], 'CopyObject')
+        with open(self._path(CopySource['Key']), 'rb') as source:
+            self._write(Key, source)
+        return {}
+    
+    def delete_object(self, Bucket: str, Key: str, **kwargs) -> Dict[str, Any]:
+        try:
+            os.remove(self._path(Key))
+        except FileNotFoundError:
+            pass
+        return {}
+    
+    def list_objects_v2(self, Bucket: str, Prefix: str = '', StartAfter: str = '', **kwargs) -> Dict[str, Any]:
+        keys = []
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                key = os.path.relpath(os.path.join(root, name), self.root).replace(os.sep, '/')
+                if key.startswith(Prefix) and key > StartAfter and not name.endswith('.tmp'):
+                    keys.append(key)
+        return {'Contents': [{'Key': key} for key in sorted(keys)], 'IsTruncated': False}
+
+
+def storage_backend() -> Optional[str]:
+    '''s3 или local по настройкам; None — хранилище не настроено, а не выбор наугад'''
+    if STORAGE_BACKEND == 'local':
+        return 'local' if LOCAL_STORAGE_DIR else None
+    if STORAGE_BACKEND in ('', 's3') and os.environ.get('AWS_ACCESS_KEY_ID') and os.environ.get('AWS_SECRET_ACCESS_KEY'):
+        return 's3'
+    return None
+
+
+def s3_client():
+    '''Клиент выбранного хранилища, один на тёплый процесс: boto3 для s3 или LocalStorage'''
+    backend = storage_backend()
+    if backend is None:
+        raise RuntimeError('Upload storage is not configured')
+    if backend not in _s3:
+        if backend == 'local':
+            _s3[backend] = LocalStorage(LOCAL_STORAGE_DIR)
+        else:
+            _s3[backend] = boto3.client(
+                's3',
+                endpoint_url=S3_ENDPOINT,
+                aws_access_key_id=os.environ.get('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.environ.get('AWS_SECRET_ACCESS_KEY')
+            )
+    return _s3[backend]
+
+
+def _open_db_connection():
+    '''Новое подключение; при сетевом сбое одна повторная попытка'''
+    try:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    except psycopg2.OperationalError:
+        time.sleep(0.1)
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    _db_created_at[id(conn)] = time.monotonic()
+    return conn
+
+
+def _discard_db_connection(conn) -> None:
+    _db_created_at.pop(id(conn), None)
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def get_db_connection():
+    '''Соединение из пула (с проверкой возраста и живости) или новое'''
+    now = time.monotonic()
+    while _db_pool:
+        conn, released_at = _db_pool.pop()
+        if conn.closed or now - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE:
+            _discard_db_connection(conn)
+            continue
+        if now - released_at > DB_POOL_PING_AFTER:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+            except psycopg2.Error:
+                _discard_db_connection(conn)
+                continue
+        return conn
+    return _open_db_connection()
+
+
+def release_db_connection(conn) -> None:
+    '''Возврат соединения в пул; сломанные и устаревшие закрываются'''
+    if any(pooled is conn for pooled, _ in _db_pool):
+        return
+    if conn.closed:
+        _db_created_at.pop(id(conn), None)
+        return
+    try:
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+    except psycopg2.Error:
+        _discard_db_connection(conn)
+        return
+    expired = time.monotonic() - _db_created_at.get(id(conn), 0) > DB_POOL_MAX_AGE
+    if expired or len(_db_pool) >= DB_POOL_SIZE:
+        _discard_db_connection(conn)
+        return
+    _db_pool.append((conn, time.monotonic()))
+
+
+# Картинка для хешей и производных: байты (base64-загрузка) или файл (спул finalize)
+ImageSource = Union[bytes, BinaryIO]
+
+
+def open_image(source: ImageSource):
+    '''Image.open для байтов или файла; файл перематывается, чтобы его могли прочитать несколько потребителей'''
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(BytesIO(source))
+    source.seek(0)
+    return Image.open(source)
+
+
+def hash_index_available() -> bool:
+    return psycopg2 is not None and Image is not None and bool(os.environ.get('DATABASE_URL'))
+
+
+@lru_cache(maxsize=1)
+def dct_matrix(size: int = 32):
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+
+def perceptual_hashes(data: ImageSource) -> Dict[str, Any]:
+    '''dHash (разности соседних пикселей 9×8) и pHash (младшие 8×8 коэффициентов DCT 32×32 против медианы)
+    по яркости картинки без учёта размера и сжатия; pHash — только при numpy'''
+    img = open_image(data)
+    width, height = img.size
+    if img.getexif().get(0x0112) in (5, 6, 7, 8):
+        width, height = height, width
+    if img.format == 'JPEG':
+        img.draft('L', (64, 64))
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info:
+        # Прозрачный фон (кресты, цветы) сводится к белому, иначе хеш зависит от цвета невидимых пикселей
+        flat = Image.new('RGBA', img.size, (255, 255, 255, 255))
+        flat.alpha_composite(img.convert('RGBA'))
+        img = flat
+    gray = img.convert('L')
+    
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    dhash = 0
+    for row in range(8):
+        for col in range(8):
+            dhash = (dhash << 1) | (pixels[row * 9 + col + 1] > pixels[row * 9 + col])
+    
+    phash = None
+    if np is not None:
+        matrix = dct_matrix()
+        luma = np.asarray(gray.resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+        low = (matrix @ luma @ matrix.T)[:8, :8].flatten()
+        phash = 0
+        for bit in low > np.median(low[1:]):
+            phash = (phash << 1) | int(bit)
+    return {'dhash': dhash, 'phash': phash, 'width': width, 'height': height}
+
+
+def to_signed64(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hash_bands(dhash: int) -> List[int]:
+    return [(i << 8) | ((dhash >> (8 * i)) & 0xFF) for i in range(HASH_BANDS)]
+
+
+def hamming(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None or b is None:
+        return None
+    return bin((a ^ b) & HASH_MASK).count('1')
+
+
+def store_hashes(cur, url: str, hashes: Dict[str, Any]) -> None:
+    cur.execute(
+        """
+        INSERT INTO image_hashes (url, dhash, phash, bands, width, height) VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (url) DO UPDATE SET dhash = EXCLUDED.dhash, phash = EXCLUDED.phash, bands = EXCLUDED.bands,
+            width = EXCLUDED.width, height = EXCLUDED.height
+        """,
+        (url, to_signed64(hashes['dhash']), None if hashes['phash'] is None else to_signed64(hashes['phash']),
+         hash_bands(hashes['dhash']), hashes['width'], hashes['height'])
+    )
+
+
+def find_near_duplicates(cur, hashes: Dict[str, Any], max_distance: int = NEAR_DUPLICATE_DISTANCE,
+                         exclude_url: Optional[str] = None, limit: int = NEAR_DUPLICATE_LIMIT) -> List[Dict[str, Any]]:
+    '''Кандидаты по совпадающей полосе dHash из GIN-индекса, точное расстояние Хэмминга — здесь'''
+    cur.execute(
+        "SELECT url, dhash, phash, width, height FROM image_hashes WHERE bands && %s::integer[]",
+        (hash_bands(hashes['dhash']),)
+    )
+    found = []
+    for url, dhash, phash, width, height in cur.fetchall():
+        distance = hamming(hashes['dhash'], dhash)
+        if url == exclude_url or distance > max_distance:
+            continue
+        found.append({'url': url, 'distance': distance, 'phash_distance': hamming(hashes['phash'], phash),
+                      'width': width, 'height': height})
+    found.sort(key=lambda item: (item['distance'], item['url']))
+    return found[:limit]
+
+
+def near_duplicate_pairs(cur, max_distance: int = NEAR_DUPLICATE_DISTANCE, limit: int = 100) -> List[Dict[str, Any]]:
+    '''Все пары почти-дубликатов индекса, от самых похожих'''
+    cur.execute(
+        """
+        SELECT a.url, a.dhash, a.phash, b.url, b.dhash, b.phash
+        FROM image_hashes a JOIN image_hashes b ON a.url < b.url AND a.bands && b.bands
+        """
+    )
+    pairs = []
+    for url_a, dhash_a, phash_a, url_b, dhash_b, phash_b in cur.fetchall():
+        distance = hamming(dhash_a, dhash_b)
+        if distance <= max_distance:
+            pairs.append({'urls': [url_a, url_b], 'distance': distance, 'phash_distance': hamming(phash_a, phash_b)})
+    pairs.sort(key=lambda item: (item['distance'], item['urls']))
+    return pairs[:limit]
+
+
+def register_image(url: str, data: ImageSource) -> List[Dict[str, Any]]:
+    '''Хеши новой загрузки в индекс; ответ — уже известные похожие изображения, чтобы предупредить админа.
+    Без БД, Pillow или при ошибке индекс просто пропускается'''
+    if not hash_index_available():
+        return []
+    try:
+        hashes = perceptual_hashes(data)
+        conn = get_db_connection()
+        try:
+            with conn.cursor() as cur:
+                near = find_near_duplicates(cur, hashes, exclude_url=url)
+                store_hashes(cur, url, hashes)
+            conn.commit()
+        finally:
+            release_db_connection(conn)
+    except Exception as e:
+        print(f"Perceptual hash for {url} failed: {e}")
+        return []
+    return near
+
+
+def near_duplicates_query(body_data: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+    '''Админский запрос: похожие на url или все пары индекса; порог — max_distance (не больше 7 из 64 бит)'''
+    max_distance = min(int(body_data.get('max_distance', NEAR_DUPLICATE_DISTANCE)), HASH_BANDS - 1)
+    limit = min(int(body_data.get('limit', 100)), 500)
+    url = body_data.get('url')
+    conn = get_db_connection()
+    try:
+        with conn.cursor() as cur:
+            if not url:
+                return 200, {'pairs': near_duplicate_pairs(cur, max_distance, limit)}
+            cur.execute("SELECT dhash, phash FROM image_hashes WHERE url = %s", (url,))
+            row = cur.fetchone()
+            if not row:
+                return 404, {'error': 'Image is not indexed'}
+            hashes = {'dhash': row[0] & HASH_MASK, 'phash': None if row[1] is None else row[1] & HASH_MASK}
+            return 200, {'url': url, 'near_duplicates': find_near_duplicates(cur, hashes, max_distance, url, limit)}
+    finally:
+        release_db_connection(conn)
+
+
+def content_key(digest: str, extension: str) -> str:
+    return f"{UPLOAD_PREFIX}{digest}.{'jpg' if extension == 'jpeg' else extension}"
+
+
+def remember_upload(key: str, size: int) -> None:
+    _known_uploads[key] = size
+    _known_uploads.move_to_end(key)
+    while len(_known_uploads) > KNOWN_UPLOADS_MAX:
+        _known_uploads.popitem(last=False)
+
+
+def find_upload(client, key: str) -> Optional[int]:
+    '''Размер уже сохранённого объекта с таким ключом или None'''
+    if key in _known_uploads:
+        _known_uploads.move_to_end(key)
+        return _known_uploads[key]
+    try:
+        size = client.head_object(Bucket=S3_BUCKET, Key=key).get('ContentLength', 0)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    remember_upload(key, size)
+    return size
+
+
+def record_duplicate(key: str, size: int) -> None:
+    _dedup_stats['duplicates'] += 1
+    _dedup_stats['bytes_saved'] += size
+    print(f"Duplicate upload {key}: {size} bytes saved, {_dedup_stats['bytes_saved']} total")
+
+
+def dedup_stats() -> str:
+    return '; '.join(f'{name}={count}' for name, count in _dedup_stats.items())
+
+
+def store_upload(client, data: bytes, extension: str) -> Tuple[str, bool]:
+    '''Сохранение по хешу содержимого; (ключ, True), если такой файл уже был и put_object не нужен'''
+    key = content_key(hashlib.sha256(data).hexdigest(), extension)
+    if find_upload(client, key) is not None:
+        record_duplicate(key, len(data))
+        return key, True
+    client.put_object(
+        Bucket=S3_BUCKET,
+        Key=key,
+        Body=data,
+        ContentType=UPLOAD_CONTENT_TYPES.get(extension, 'image/jpeg'),
+        CacheControl=CONTENT_CACHE_CONTROL
+    )
+    remember_upload(key, len(data))
+    _dedup_stats['stored'] += 1
+    return key, False
+
+
+def public_url(key: str) -> str:
+    if storage_backend() == 'local':
+        return f'{LOCAL_PUBLIC_URL}?key={key}'
+    return f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID')}/bucket/{key}"
+
+
+def object_exists(client, key: str) -> bool:
+    try:
+        client.head_object(Bucket=S3_BUCKET, Key=key)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+    return True
+
+
+def derivative_specs() -> List[Tuple[str, int, str]]:
+    '''Набор производных из UPLOAD_DERIVATIVES; форматы, которые Pillow не умеет сохранять (AVIF без плагина), пропускаются'''
+    if Image is None:
+        return []
+    specs = []
+    for item in os.environ.get('UPLOAD_DERIVATIVES', DEFAULT_DERIVATIVES).split(','):
+        name, size, fmt = item.strip().split(':')
+        Image.init()
+        if fmt in DERIVATIVE_FORMATS and DERIVATIVE_FORMATS[fmt][0] in Image.SAVE:
+            specs.append((name, int(size), fmt))
+    return specs
+
+
+def derivative_key(key: str, name: str, fmt: str) -> str:
+    return f"{key.rsplit('.', 1)[0]}@{name}.{fmt}"
+
+
+def generate_derivatives(client, key: str, data: Optional[ImageSource] = None) -> Dict[str, Dict[str, Any]]:
+    '''Производные оригинала key в пуле потоков. Уже существующие не пересоздаются, поэтому вызов
+    идемпотентен и годится для догрузки старых объектов; data=None — оригинал читается из бакета'''
+    results: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for name, size, fmt in derivative_specs():
+        target = derivative_key(key, name, fmt)
+        if object_exists(client, target):
+            results[name] = {'url': public_url(target), 'format': fmt, 'max_size': size}
+        else:
+            missing.append((name, target, size, fmt))
+    if not missing:
+        return results
+    
+    if data is None:
+        data = client.get_object(Bucket=S3_BUCKET, Key=key)['Body'].read()
+    img = open_image(data)
+    largest = max(size for _, _, size, _ in missing)
+    if img.format == 'JPEG':
+        img.draft('RGB', (largest, largest))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+    img.load()
+    
+    def render(name: str, target: str, size: int, fmt: str) -> Tuple[str, Dict[str, Any]]:
+        scale = min(1.0, size / max(img.width, img.height))
+        variant = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))),
+                             Image.Resampling.LANCZOS, reducing_gap=2.0)
+        pil_format, content_type, options = DERIVATIVE_FORMATS[fmt]
+        if pil_format == 'JPEG' and variant.mode == 'RGBA':
+            variant = variant.convert('RGB')
+        buffer = BytesIO()
+        variant.save(buffer, format=pil_format, **options)
+        client.put_object(
+            Bucket=S3_BUCKET,
+            Key=target,
+            Body=buffer.getvalue(),
+            ContentType=content_type,
+            CacheControl=DERIVATIVE_CACHE_CONTROL
+        )
+        return name, {'url': public_url(target), 'format': fmt, 'max_size': size,
+                      'width': variant.width, 'height': variant.height}
+    
+    with ThreadPoolExecutor(max_workers=min(DERIVATIVE_WORKERS, len(missing))) as pool:
+        for name, info in pool.map(lambda job: render(*job), missing):
+            results[name] = info
+    return {name: results[name] for name, _, _ in derivative_specs() if name in results}
+
+
+def safe_derivatives(client, key: str, data: Optional[ImageSource] = None) -> Dict[str, Dict[str, Any]]:
+    '''Ошибка производных (например, HEIC без декодера) не отменяет саму загрузку'''
+    try:
+        return generate_derivatives(client, key, data)
+    except Exception as e:
+        print(f"Derivatives for {key} failed: {e}")
+        return {}
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    '''Формат по первым байтам файла: расширение загрузки должно ему соответствовать'''
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'heic'
+    return None
+
+
+def upload_key(file_id: str, extension: str) -> str:
+    return f'{UPLOAD_INCOMING_PREFIX}{file_id}.{extension}'
+
+
+def sweep_incoming(client) -> int:
+    '''Удаление брошенных сессий: объекты uploads/incoming/, которые никто не финализировал за два срока подписи.
+    Не чаще раза в UPLOAD_SWEEP_INTERVAL на инстанс и одна страница листинга за раз; ошибка не мешает загрузке'''
+    now = time.monotonic()
+    if 'incoming' in _last_sweep and now - _last_sweep['incoming'] < UPLOAD_SWEEP_INTERVAL:
+        return 0
+    _last_sweep['incoming'] = now
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=2 * UPLOAD_URL_EXPIRES)
+    removed = 0
+    try:
+        page = client.list_objects_v2(Bucket=S3_BUCKET, Prefix=UPLOAD_INCOMING_PREFIX, MaxKeys=1000)
+        for item in page.get('Contents', []):
+            if item['LastModified'] < cutoff:
+                client.delete_object(Bucket=S3_BUCKET, Key=item['Key'])
+                removed += 1
+    except Exception as e:
+        print(f"Sweep of {UPLOAD_INCOMING_PREFIX} failed: {e}")
+    if removed:
+        print(f"Removed {removed} abandoned uploads")
+    return removed
+
+
+def create_upload(extension: str, digest: str = '', derivatives: bool = True) -> Tuple[int, Dict[str, Any]]:
+    '''Новая сессия загрузки: file_id и presigned POST на ключ в бакете; размер больше MAX_UPLOAD_BYTES
+    бакет отклонит сам (content-length-range). Если клиент прислал sha256 уже сохранённого файла,
+    сразу отдаётся готовый объект (exists) без загрузки'''
+    if extension not in UPLOAD_CONTENT_TYPES:
+        return 400, {'error': f'Unsupported extension: {extension}'}
+    client = s3_client()
+    if CONTENT_ID_PATTERN.match(digest):
+        key = content_key(digest, extension)
+        size = find_upload(client, key)
+        if size is not None:
+            record_duplicate(key, size)
+            payload = {'exists': True, 'url': public_url(key), 'file_id': digest, 'size': size}
+            if derivatives:
+                payload['derivatives'] = safe_derivatives(client, key)
+            return 200, payload
+    sweep_incoming(client)
+    file_id = str(uuid.uuid4())
+    content_type = UPLOAD_CONTENT_TYPES[extension]
+    post = client.generate_presigned_post(
+        Bucket=S3_BUCKET,
+        Key=upload_key(file_id, extension),
+        Fields={'Content-Type': content_type},
+        Conditions=[{'Content-Type': content_type}, ['content-length-range', 1, MAX_UPLOAD_BYTES]],
+        ExpiresIn=UPLOAD_URL_EXPIRES
+    )
+    return 200, {
+        'file_id': file_id,
+        'upload_url': post['url'],
+        'method': 'POST',
+        'fields': post['fields'],
+        'expires_in': UPLOAD_URL_EXPIRES,
+        'max_bytes': MAX_UPLOAD_BYTES
+    }
+
+
+def finalize_upload(file_id: str, extension: str, derivatives: bool = True) -> Tuple[int, Dict[str, Any]]:
+    '''Проверка загруженного объекта: размер и сигнатура формата; неподходящий объект удаляется.
+    Прошедший проверку файл переносится на ключ по хешу содержимого, дубликат — просто удаляется.
+    Объект читается потоком кусками по UPLOAD_READ_CHUNK: хеш считается на лету, байты для производных
+    и перцептивного хеша копятся во временном файле (на диске сверх UPLOAD_SPOOL_BYTES), а не в памяти'''
+    if not FILE_ID_PATTERN.match(file_id or '') or extension not in UPLOAD_CONTENT_TYPES:
+        return 400, {'error': 'Invalid file_id or extension'}
+    client = s3_client()
+    key = upload_key(file_id, extension)
+    try:
+        head = client.head_object(Bucket=S3_BUCKET, Key=key)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return 404, {'error': 'Upload not found'}
+        raise
+    
+    size = head.get('ContentLength', 0)
+    if size > MAX_UPLOAD_BYTES:
+        client.delete_object(Bucket=S3_BUCKET, Key=key)
+        return 413, {'error': f'File exceeds {MAX_UPLOAD_BYTES} bytes'}
+    
+    signature = client.get_object(Bucket=S3_BUCKET, Key=key, Range='bytes=0-15')['Body'].read(16)
+    if sniff_image(signature) != UPLOAD_CONTENT_TYPES[extension].split('/')[1]:
+        client.delete_object(Bucket=S3_BUCKET, Key=key)
+        return 415, {'error': 'File content does not match its extension'}
+    
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES) as spool:
+        hasher = hashlib.sha256()
+        body = client.get_object(Bucket=S3_BUCKET, Key=key)['Body']
+        for chunk in iter(lambda: body.read(UPLOAD_READ_CHUNK), b''):
+            hasher.update(chunk)
+            spool.write(chunk)
+        return store_finalized(client, key, extension, hasher.hexdigest(), size, spool, derivatives)
+
+
+def store_finalized(client, key: str, extension: str, digest: str, size: int, data: ImageSource,
+                    derivatives: bool) -> Tuple[int, Dict[str, Any]]:
+    '''Перенос проверенной загрузки на ключ по хешу, регистрация в индексе хешей и производные'''
+    target = content_key(digest, extension)
+    duplicate = find_upload(client, target) is not None
+    if duplicate:
+        record_duplicate(target, size)
+    else:
+        client.copy_object(
+            Bucket=S3_BUCKET,
+            Key=target,
+            CopySource={'Bucket': S3_BUCKET, 'Key': key},
+            ContentType=UPLOAD_CONTENT_TYPES[extension],
+            CacheControl=CONTENT_CACHE_CONTROL,
+            MetadataDirective='REPLACE'
+        )
+        remember_upload(target, size)
+        _dedup_stats['stored'] += 1
+    client.delete_object(Bucket=S3_BUCKET, Key=key)
+    
+    print(f"Finalized upload {key} as {target}: {size} bytes")
+    payload = {'url': public_url(target), 'file_id': digest, 'size': size, 'deduplicated': duplicate,
+               'near_duplicates': register_image(public_url(target), data)}
+    if derivatives:
+        payload['derivatives'] = safe_derivatives(client, target, data)
+    return 200, payload
+
+
+def serve_local(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''Файл из локального хранилища: ключи неизменяемы (хеш содержимого), поэтому кэшируются надолго;
+    Range отдаёт часть файла (206), If-None-Match — 304'''
+    cors = {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'Content-Range, Accept-Ranges, ETag'}
+    key = (event.get('queryStringParameters') or {}).get('key', '')
+    if not SERVED_KEY_PATTERN.match(key) or storage_backend() != 'local':
+        return {'statusCode': 404, 'headers': cors, 'body': json.dumps({'error': 'Not found'})}
+    client = s3_client()
+    try:
+        size = client.head_object(Bucket=S3_BUCKET, Key=key)['ContentLength']
+    except ClientError:
+        return {'statusCode': 404, 'headers': cors, 'body': json.dumps({'error': 'Not found'})}
+    
+    request_headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    etag = f'"{key.rsplit("/", 1)[-1]}-{size:x}"'
+    cors = {**cors, 'ETag': etag, 'Cache-Control': CONTENT_CACHE_CONTROL, 'Accept-Ranges': 'bytes'}
+    if etag in [tag.strip().removeprefix('W/') for tag in request_headers.get('if-none-match', '').split(',')]:
+        return {'statusCode': 304, 'headers': cors, 'body': ''}
+    try:
+        byte_range = parse_range(request_headers.get('range', ''), size)
+    except ValueError:
+        return {'statusCode': 416, 'headers': {**cors, 'Content-Range': f'bytes */{size}'}, 'body': ''}
+    
+    obj = client.get_object(Bucket=S3_BUCKET, Key=key, Range=f'bytes={byte_range[0]}-{byte_range[1]}' if byte_range else None)
+    response_headers = {**cors, 'Content-Type': obj['ContentType']}
+    if byte_range:
+        response_headers['Content-Range'] = obj['ContentRange']
+    return {
+        'statusCode': 206 if byte_range else 200,
+        'headers': response_headers,
+        'body': base64.b64encode(obj['Body'].read()).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
@@ -21,8 +777,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, Range, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -33,6 +789,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    if method == 'GET':
+        return serve_local(event)
+    
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -43,8 +802,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     try:
         body_data = json.loads(event.get('body', '{}'))
         
+        action = body_data.get('action')
+        if action == 'near_duplicates':
+            if not hash_index_available():
+                return {
+                    'statusCode': 503,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Image hash index is not configured'})
+                }
+            status, payload = near_duplicates_query(body_data)
+            return {
+                'statusCode': status,
+                'headers': headers,
+                'body': json.dumps(payload)
+            }
+        
+        if action in ('create', 'finalize'):
+            if storage_backend() != 's3':
+                # Presigned PUT есть только у бакета: клиент откатывается на загрузку base64 в теле запроса
+                return {
+                    'statusCode': 503,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Direct uploads are not configured'})
+                }
+            extension = str(body_data.get('extension', 'jpg')).lower()
+            derivatives = bool(body_data.get('derivatives', True))
+            if action == 'create':
+                status, payload = create_upload(extension, str(body_data.get('sha256', '')).lower(), derivatives)
+            else:
+                status, payload = finalize_upload(str(body_data.get('file_id', '')), extension, derivatives)
+            return {
+                'statusCode': status,
+                'headers': {**headers, 'X-Dedup-Stats': dedup_stats()},
+                'body': json.dumps(payload)
+            }
+        
         image_base64 = body_data.get('image')
-        file_extension = body_data.get('extension', 'jpg')
+        file_extension = str(body_data.get('extension', 'jpg')).lower()
         
         print(f"Received upload request with extension: {file_extension}")
         
@@ -56,65 +850,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'No image provided'})
             }
         
-        original_image = image_base64
+        if file_extension not in UPLOAD_CONTENT_TYPES:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Unsupported extension: {file_extension}'})
+            }
+        
         if ',' in image_base64:
             image_base64 = image_base64.split(',')[1]
         
-        s3_access_key = os.environ.get('AWS_ACCESS_KEY_ID')
-        s3_secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+        if storage_backend() is None:
+            return {
+                'statusCode': 503,
+                'headers': headers,
+                'body': json.dumps({'error': 'Upload storage is not configured'})
+            }
+        print(f"Storage backend: {storage_backend()}")
         
-        print(f"S3 keys available: {bool(s3_access_key and s3_secret_key)}")
+        image_data = base64.b64decode(image_base64)
         
-        if s3_access_key and s3_secret_key:
-            image_data = base64.b64decode(image_base64)
-            
-            file_id = str(uuid.uuid4())
-            file_name = f"{file_id}.{file_extension}"
-            
-            s3_client = boto3.client(
-                's3',
-                endpoint_url='https://bucket.poehali.dev',
-                aws_access_key_id=s3_access_key,
-                aws_secret_access_key=s3_secret_key
-            )
-            
-            bucket_name = 'files'
-            
-            content_type_map = {
-                'jpg': 'image/jpeg',
-                'jpeg': 'image/jpeg',
-                'png': 'image/png',
-                'gif': 'image/gif',
-                'webp': 'image/webp'
-            }
-            
-            s3_client.put_object(
-                Bucket=bucket_name,
-                Key=file_name,
-                Body=image_data,
-                ContentType=content_type_map.get(file_extension, 'image/jpeg')
-            )
-            
-            image_url = f'https://cdn.poehali.dev/projects/{s3_access_key}/bucket/{file_name}'
-        else:
-            file_id = str(uuid.uuid4())
-            content_type_map = {
-                'jpg': 'image/jpeg',
-                'jpeg': 'image/jpeg',
-                'png': 'image/png',
-                'gif': 'image/gif',
-                'webp': 'image/webp',
-                'heic': 'image/heic'
-            }
-            mime_type = content_type_map.get(file_extension, 'image/jpeg')
-            image_url = f'data:{mime_type};base64,{image_base64}'
+        client = s3_client()
+        file_name, deduplicated = store_upload(client, image_data, file_extension)
+        file_id = file_name[len(UPLOAD_PREFIX):].rsplit('.', 1)[0]
+        
+        image_url = public_url(file_name)
+        derivatives = safe_derivatives(client, file_name, image_data) if body_data.get('derivatives', True) else {}
+        near_duplicates = register_image(image_url, image_data)
         
         return {
             'statusCode': 200,
-            'headers': headers,
+            'headers': {**headers, 'X-Dedup-Stats': dedup_stats()},
             'body': json.dumps({
                 'url': image_url,
-                'file_id': file_id
+                'file_id': file_id,
+                'deduplicated': deduplicated,
+                'near_duplicates': near_duplicates,
+                'derivatives': derivatives
             })
         }
     
@@ -0,0 +1,17 @@
+-- Счётчики изменений каталога: по ним строится ETag для условных GET
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 1,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+INSERT INTO catalog_versions (table_name) VALUES
+('monuments'),
+('crosses'),
+('flowers'),
+('products'),
+('categories'),
+('gallery_items'),
+('image_categories'),
+('category_images')
+ON CONFLICT (table_name) DO NOTHING;
@@ -0,0 +1,12 @@
+-- Keyset-пагинация каталога: ключи сортировки не должны быть NULL, индексы повторяют ORDER BY списков
+UPDATE products SET display_order = 0 WHERE display_order IS NULL;
+UPDATE products SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE products ALTER COLUMN display_order SET NOT NULL;
+ALTER TABLE products ALTER COLUMN created_at SET NOT NULL;
+
+UPDATE monuments SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE monuments ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_products_keyset ON products(display_order, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_category_keyset ON products(category_id, display_order, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_monuments_keyset ON monuments(created_at DESC, id DESC);
@@ -0,0 +1,14 @@
+-- Перцептивные хеши изображений для поиска почти-дубликатов (одна картинка в разных размерах).
+-- bands — 8 байт dHash вида позиция*256 + байт: у хешей с расстоянием Хэмминга до 7 хотя бы один байт
+-- совпадает, поэтому кандидаты находятся пересечением массивов по GIN-индексу, а расстояние считает функция
+CREATE TABLE IF NOT EXISTS image_hashes (
+    url TEXT PRIMARY KEY,
+    dhash BIGINT NOT NULL,
+    phash BIGINT,
+    bands INTEGER[] NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_hashes_bands ON image_hashes USING GIN (bands);
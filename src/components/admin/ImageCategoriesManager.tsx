@@ -21,9 +21,9 @@ import {
   SelectTrigger,
   SelectValue,
 } from '@/components/ui/select';
+import { nearDuplicateWarning, uploadImageFile } from '@/lib/upload';
 
 const API_URL = 'https://functions.poehali.dev/dee0114f-9dc3-4783-87b7-346a133d7c73';
-const UPLOAD_URL = 'https://functions.poehali.dev/131d63b7-bef6-496a-a392-c04e347cd6aa';
 
 interface Category {
   id: number;
@@ -187,27 +187,13 @@ export function ImageCategoriesManager() {
 
     setUploading(true);
     try {
-      const reader = new FileReader();
-      reader.onload = async (event) => {
-        const base64 = event.target?.result as string;
-
-        const response = await fetch(UPLOAD_URL, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ image: base64, filename: file.name })
-        });
-
-        if (response.ok) {
-          const data = await response.json();
-          setImageForm(prev => ({ ...prev, image_url: data.url }));
-          toast({ title: 'Успех', description: 'Изображение загружено' });
-        }
-        setUploading(false);
-      };
-      reader.readAsDataURL(file);
+      const data = await uploadImageFile(file);
+      setImageForm(prev => ({ ...prev, image_url: data.url }));
+      toast({ title: 'Успех', description: nearDuplicateWarning(data) ?? 'Изображение загружено' });
     } catch (error) {
       console.error('Upload error:', error);
       toast({ title: 'Ошибка', description: 'Не удалось загрузить изображение', variant: 'destructive' });
+    } finally {
       setUploading(false);
     }
   };
@@ -81,6 +81,39 @@ const DESKTOP_TOOLS = [
   { key: 'epitaph' as DesktopToolPanel, icon: 'Quote', label: 'Эпитафия' },
 ];
 
+const IMAGE_PROXY_URL = 'https://functions.poehali.dev/a333157a-6afc-488c-a133-697f8cff0e15';
+
+// Превью в палитре: уменьшенная копия через image-proxy, на холст добавляется оригинал
+const thumbnailUrl = (url: string, size = 160) =>
+  url.startsWith('data:') ? url : `${IMAGE_PROXY_URL}?url=${encodeURIComponent(url)}&w=${size}&h=${size}&format=webp`;
+
+// Спрайт-атлас категории из image-categories: все превью категории в одном-двух листах
+interface CategoryAtlas {
+  sheets: Array<{ url: string; width: number; height: number }>;
+  sprites: Record<string, { sheet: number; x: number; y: number; w: number; h: number }>;
+}
+
+const SPRITE_BOX = 74;
+
+const AtlasSprite = ({ atlas, id, alt }: { atlas: CategoryAtlas; id: number; alt: string }) => {
+  const sprite = atlas.sprites[id];
+  const sheet = atlas.sheets[sprite.sheet];
+  const scale = Math.min(1, SPRITE_BOX / Math.max(sprite.w, sprite.h));
+  return (
+    <div
+      role="img"
+      aria-label={alt}
+      style={{
+        width: sprite.w * scale,
+        height: sprite.h * scale,
+        backgroundImage: `url(${sheet.url})`,
+        backgroundPosition: `-${sprite.x * scale}px -${sprite.y * scale}px`,
+        backgroundSize: `${sheet.width * scale}px ${sheet.height * scale}px`,
+      }}
+    />
+  );
+};
+
 export const ConstructorLibrary = ({
   defaultTab = 'catalog',
   monumentImage,
@@ -127,6 +160,8 @@ export const ConstructorLibrary = ({
   const [categoryImages, setCategoryImages] = useState<Array<{id: number, category_id: number, name: string, image_url: string, category_name: string}>>([]);
   const [selectedImageCategory, setSelectedImageCategory] = useState<number | null>(null);
   const [isLoadingImages, setIsLoadingImages] = useState(false);
+  // 'loading' — атлас ещё грузится (превью не запрашиваются), null — атласа нет
+  const [atlases, setAtlases] = useState<Record<number, CategoryAtlas | 'loading' | null>>({});
   const [customText, setCustomText] = useState('');
   const [customTextFont, setCustomTextFont] = useState('');
   const [selectedDatePreset, setSelectedDatePreset] = useState<'inline' | 'stacked' | 'offset'>('inline');
@@ -150,6 +185,11 @@ export const ConstructorLibrary = ({
     setActiveTab(defaultTab);
   }, [defaultTab]);
 
+  useEffect(() => {
+    if (selectedImageCategory === null || selectedImageCategory in atlases) return;
+    loadCategoryAtlas(selectedImageCategory);
+  }, [selectedImageCategory]);
+
   const loadImageCategories = async () => {
     try {
       const response = await fetch('https://functions.poehali.dev/dee0114f-9dc3-4783-87b7-346a133d7c73?type=categories');
@@ -184,6 +224,26 @@ export const ConstructorLibrary = ({
     }
   };
 
+  // Без атласа (нет бакета, ошибка) превью грузятся по одному через thumbnailUrl
+  const loadCategoryAtlas = async (categoryId: number) => {
+    setAtlases(prev => ({ ...prev, [categoryId]: 'loading' }));
+    let atlas: CategoryAtlas | null = null;
+    try {
+      const response = await fetch(`https://functions.poehali.dev/dee0114f-9dc3-4783-87b7-346a133d7c73?type=atlas&category_id=${categoryId}`);
+      if (response.ok) atlas = await response.json();
+    } catch (error) {
+      console.error('Error loading category atlas:', error);
+    }
+    setAtlases(prev => ({ ...prev, [categoryId]: atlas }));
+  };
+
+  const renderPreview = (image: { id: number; category_id: number; name: string; image_url: string }) => {
+    const atlas = atlases[image.category_id];
+    if (atlas === 'loading') return null;
+    if (atlas?.sprites[image.id]) return <AtlasSprite atlas={atlas} id={image.id} alt={image.name} />;
+    return <img src={thumbnailUrl(image.image_url)} alt={image.name} className="max-w-full max-h-full object-contain" />;
+  };
+
   const loadCategoryImages = async (categoryId: number) => {
     setIsLoadingImages(true);
     try {
@@ -530,7 +590,7 @@ export const ConstructorLibrary = ({
                           <button key={cross.id} onClick={() => addImageElement(cross.image_url, 'cross')}
                             className="aspect-square rounded border border-white/10 hover:border-primary transition-all p-2 bg-white/5 hover:bg-primary/10 flex flex-col">
                             <div className="flex-1 flex items-center justify-center">
-                              <img src={cross.image_url} alt={cross.name} className="w-full h-full object-contain" />
+                              <img src={thumbnailUrl(cross.image_url)} alt={cross.name} className="w-full h-full object-contain" />
                             </div>
                             <div className="text-[9px] text-center mt-1 text-white/40 truncate">{cross.name}</div>
                           </button>
@@ -556,7 +616,7 @@ export const ConstructorLibrary = ({
                           <button key={flower.id} onClick={() => addImageElement(flower.image_url, 'flower')}
                             className="aspect-square rounded border border-white/10 hover:border-primary transition-all p-2 bg-white/5 hover:bg-primary/10 flex flex-col">
                             <div className="flex-1 flex items-center justify-center">
-                              <img src={flower.image_url} alt={flower.name} className="w-full h-full object-contain" />
+                              <img src={thumbnailUrl(flower.image_url)} alt={flower.name} className="w-full h-full object-contain" />
                             </div>
                             <div className="text-[9px] text-center mt-1 text-white/40 truncate">{flower.name}</div>
                           </button>
@@ -613,7 +673,7 @@ export const ConstructorLibrary = ({
                                       monumentImage === product.image_url ? 'border-primary ring-2 ring-primary/20' : 'border-border hover:border-primary/50'
                                     }`}
                                   >
-                                    <img src={product.image_url!} alt={product.name} className="w-full h-full object-contain p-2" />
+                                    <img src={thumbnailUrl(product.image_url!, 320)} alt={product.name} className="w-full h-full object-contain p-2" />
                                     <div className="absolute bottom-0 left-0 right-0 bg-gradient-to-t from-black/90 to-transparent text-white text-xs p-2 text-center">
                                       <div className="font-medium">{product.name}</div>
                                     </div>
@@ -679,7 +739,7 @@ export const ConstructorLibrary = ({
                               className="rounded border-2 border-white/10 hover:border-primary transition-all bg-black/40 hover:bg-primary/5 overflow-hidden flex flex-col"
                             >
                               <div className="flex items-center justify-center p-2" style={{ height: '90px' }}>
-                                <img src={image.image_url} alt={image.name} className="max-w-full max-h-full object-contain" />
+                                {renderPreview(image)}
                               </div>
                               <div className="bg-black/60 text-white text-[9px] px-1 py-1 text-center truncate w-full">
                                 {image.name}
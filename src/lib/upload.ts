@@ -0,0 +1,77 @@
+const UPLOAD_URL = 'https://functions.poehali.dev/131d63b7-bef6-496a-a392-c04e347cd6aa';
+
+export interface NearDuplicate {
+  url: string;
+  distance: number;
+  width?: number;
+  height?: number;
+}
+
+export interface UploadedImage {
+  url: string;
+  file_id: string;
+  near_duplicates?: NearDuplicate[];
+}
+
+// Текст предупреждения, если функция нашла в индексе ту же картинку (например, в другом размере)
+export const nearDuplicateWarning = (image: UploadedImage) => {
+  const count = image.near_duplicates?.length ?? 0;
+  return count ? `Похожее изображение уже загружено (${count}): ${image.near_duplicates![0].url}` : undefined;
+};
+
+const readAsDataURL = (file: File) =>
+  new Promise<string>((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onload = () => resolve(reader.result as string);
+    reader.onerror = () => reject(new Error('Не удалось прочитать файл'));
+    reader.readAsDataURL(file);
+  });
+
+// Хеш содержимого: функция хранит файлы по SHA-256 и для уже загруженного сразу отдаёт готовую ссылку
+const sha256Hex = async (file: File) => {
+  if (!globalThis.crypto?.subtle) return undefined;
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+};
+
+const postJson = async (body: Record<string, unknown>) => {
+  const response = await fetch(UPLOAD_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body),
+  });
+  return { ok: response.ok, data: await response.json() };
+};
+
+// Файл уходит presigned POST-ом прямо в бакет, функция только выдаёт форму и проверяет результат.
+// Если прямая загрузка недоступна (нет бакета, CORS, сеть) — прежний путь через base64 в JSON
+export async function uploadImageFile(file: File): Promise<UploadedImage> {
+  const extension = file.name.split('.').pop()?.toLowerCase() || 'jpg';
+
+  try {
+    const session = await postJson({ action: 'create', extension, sha256: await sha256Hex(file) });
+    if (session.ok && session.data.exists) return session.data;
+    if (session.ok) {
+      if (file.size > session.data.max_bytes) {
+        throw new Error(`Файл больше ${Math.round(session.data.max_bytes / 1024 / 1024)} МБ`);
+      }
+      // Поля политики идут до файла: S3 проверяет подпись и content-length-range по ним
+      const form = new FormData();
+      Object.entries(session.data.fields as Record<string, string>).forEach(([name, value]) => form.append(name, value));
+      form.append('file', file);
+      const post = await fetch(session.data.upload_url, { method: 'POST', body: form });
+      if (post.ok) {
+        const result = await postJson({ action: 'finalize', file_id: session.data.file_id, extension });
+        if (result.ok) return result.data;
+        throw new Error(result.data.error || 'Не удалось загрузить изображение');
+      }
+    }
+  } catch (error) {
+    // Сетевой сбой или CORS: fetch бросает TypeError, текст сообщения у браузеров разный
+    if (!(error instanceof TypeError)) throw error;
+  }
+
+  const legacy = await postJson({ image: await readAsDataURL(file), extension });
+  if (!legacy.data.url) throw new Error(legacy.data.error || 'Не удалось загрузить изображение');
+  return legacy.data;
+}
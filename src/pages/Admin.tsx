@@ -10,6 +10,7 @@ import { Progress } from '@/components/ui/progress';
 import { useToast } from '@/hooks/use-toast';
 import Icon from '@/components/ui/icon';
 import { ImageCategoriesManager } from '@/components/admin/ImageCategoriesManager';
+import { nearDuplicateWarning, uploadImageFile } from '@/lib/upload';
 
 const useAuth = () => {
   const navigate = useNavigate();
@@ -306,7 +307,6 @@ export default function Admin() {
   const filterCategories = ["Все", ...categories_list];
 
   const API_URL = "https://functions.poehali.dev/92a4ea52-a3a0-4502-9181-ceeb714f2ad6";
-  const UPLOAD_URL = "https://functions.poehali.dev/131d63b7-bef6-496a-a392-c04e347cd6aa";
   const PRODUCTS_API = "https://functions.poehali.dev/119b2e99-2f11-4608-9043-9aae1bf8500d";
   const FONTS_API = "https://functions.poehali.dev/c1b3f505-db44-492c-8db4-231760a9bb95";
   const GALLERY_API = "https://functions.poehali.dev/16b2bcd1-9c80-4d3e-96c6-0aaaac12c483";
@@ -901,94 +901,43 @@ export default function Admin() {
     if (target === 'flower') setUploadingFlower(true);
 
     try {
-      const reader = new FileReader();
-      
-      reader.onload = async () => {
-        try {
-          const base64String = reader.result as string;
-          const extension = file.name.split('.').pop()?.toLowerCase() || 'jpg';
-          
-          const response = await fetch(UPLOAD_URL, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-              image: base64String,
-              extension: extension
-            }),
-          });
-
-          const data = await response.json();
-          console.log('Upload response:', data);
-
-          if (data.url) {
-            if (target === 'monument') {
-              setMonumentForm({ ...monumentForm, image_url: data.url });
-            } else if (target === 'gallery') {
-              setGalleryForm({ ...galleryForm, url: data.url });
-            } else if (target === 'product') {
-              setProductForm({ ...productForm, image_url: data.url });
-            } else if (target === 'cross') {
-              const fileName = file.name.replace(/\.[^/.]+$/, '');
-              setCrossForm({ 
-                ...crossForm, 
-                image_url: data.url,
-                name: crossForm.name || fileName
-              });
-            } else if (target === 'flower') {
-              const fileName = file.name.replace(/\.[^/.]+$/, '');
-              setFlowerForm({ 
-                ...flowerForm, 
-                image_url: data.url,
-                name: flowerForm.name || fileName
-              });
-            }
-            
-            toast({
-              title: '✅ Успешно',
-              description: 'Изображение загружено'
-            });
-          } else {
-            toast({
-              title: '❌ Ошибка',
-              description: data.error || 'Не удалось загрузить изображение',
-              variant: 'destructive'
-            });
-          }
-        } catch (error) {
-          console.error('Upload error:', error);
-          toast({
-            title: '❌ Ошибка',
-            description: 'Не удалось загрузить изображение',
-            variant: 'destructive'
-          });
-        } finally {
-          if (target === 'monument') setUploading(false);
-          if (target === 'gallery') setUploadingGallery(false);
-          if (target === 'cross') setUploadingCross(false);
-          if (target === 'flower') setUploadingFlower(false);
-        }
-      };
-      
-      reader.onerror = () => {
-        toast({
-          title: '❌ Ошибка',
-          description: 'Не удалось прочитать файл',
-          variant: 'destructive'
+      const data = await uploadImageFile(file);
+      console.log('Upload response:', data);
+
+      if (target === 'monument') {
+        setMonumentForm({ ...monumentForm, image_url: data.url });
+      } else if (target === 'gallery') {
+        setGalleryForm({ ...galleryForm, url: data.url });
+      } else if (target === 'product') {
+        setProductForm({ ...productForm, image_url: data.url });
+      } else if (target === 'cross') {
+        const fileName = file.name.replace(/\.[^/.]+$/, '');
+        setCrossForm({ 
+          ...crossForm, 
+          image_url: data.url,
+          name: crossForm.name || fileName
         });
-        if (target === 'monument') setUploading(false);
-        if (target === 'gallery') setUploadingGallery(false);
-        if (target === 'cross') setUploadingCross(false);
-        if (target === 'flower') setUploadingFlower(false);
-      };
+      } else if (target === 'flower') {
+        const fileName = file.name.replace(/\.[^/.]+$/, '');
+        setFlowerForm({ 
+          ...flowerForm, 
+          image_url: data.url,
+          name: flowerForm.name || fileName
+        });
+      }
       
-      reader.readAsDataURL(file);
+      toast({
+        title: '✅ Успешно',
+        description: nearDuplicateWarning(data) ?? 'Изображение загружено'
+      });
     } catch (error) {
       console.error('Upload error:', error);
       toast({
         title: '❌ Ошибка',
-        description: 'Не удалось загрузить изображение',
+        description: error instanceof Error ? error.message : 'Не удалось загрузить изображение',
         variant: 'destructive'
       });
+    } finally {
       if (target === 'monument') setUploading(false);
       if (target === 'gallery') setUploadingGallery(false);
       if (target === 'cross') setUploadingCross(false);
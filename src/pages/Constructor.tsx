@@ -651,7 +651,8 @@ const Constructor = () => {
       
       const result = await response.json();
 
-      return result.processed_image;
+      // Результат кэшируется на CDN: ссылка вместо многомегабайтного data URL
+      return result.url || result.processed_image;
     } catch (error) {
       console.error('❌ Ошибка обработки через бэкенд:', error);
       return imageData;
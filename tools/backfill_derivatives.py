@@ -0,0 +1,74 @@
+"""
+Догрузка производных (превью, medium, WebP/AVIF) для уже лежащих в бакете изображений.
+Использует generate_derivatives из upload-image: существующие производные пропускаются,
+поэтому повторный запуск безопасен. Для продолжения после обрыва — --start-after с последним
+выведенным ключом.
+Запуск: AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=... python tools/backfill_derivatives.py --prefix uploads/
+С UPLOAD_STORAGE=local и UPLOAD_LOCAL_DIR обходится локальное хранилище.
+"""
+import argparse
+from typing import Iterator, Optional
+
+from harness import load_function
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif')
+# Служебные префиксы других функций и незавершённые загрузки: там лежат не оригиналы
+SKIP_PREFIXES = ('processed/', 'image-proxy-cache/', 'uploads/incoming/')
+
+
+def original_keys(client, bucket: str, prefix: str, start_after: Optional[str]) -> Iterator[str]:
+    '''Ключи оригиналов по порядку: без производных (…@name.ext) и служебных префиксов'''
+    params = {'Bucket': bucket, 'Prefix': prefix}
+    if start_after:
+        params['StartAfter'] = start_after
+    while True:
+        page = client.list_objects_v2(**params)
+        for item in page.get('Contents', []):
+            key = item['Key']
+            name = key.rsplit('/', 1)[-1]
+            if '@' in name or key.startswith(SKIP_PREFIXES) or not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            yield key
+        if not page.get('IsTruncated'):
+            return
+        params['ContinuationToken'] = page['NextContinuationToken']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--start-after')
+    parser.add_argument('--limit', type=int, default=0, help='0 — без ограничения')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    upload = load_function('upload-image')
+    if not upload.derivative_specs():
+        raise SystemExit('Pillow не установлен или UPLOAD_DERIVATIVES пуст')
+    if upload.storage_backend() is None:
+        raise SystemExit('Хранилище не настроено: нужны ключи AWS или UPLOAD_STORAGE=local с UPLOAD_LOCAL_DIR')
+    client = upload.s3_client()
+    print(f'хранилище: {upload.storage_backend()}')
+
+    processed = failed = 0
+    last_key = args.start_after
+    for key in original_keys(client, upload.S3_BUCKET, args.prefix, args.start_after):
+        if args.dry_run:
+            print(key)
+        else:
+            try:
+                derivatives = upload.generate_derivatives(client, key)
+                print(f'{key}: {", ".join(derivatives) or "нет"}')
+            except Exception as e:
+                failed += 1
+                print(f'{key}: ошибка {e}')
+        processed += 1
+        last_key = key
+        if args.limit and processed >= args.limit:
+            break
+
+    print(f'обработано {processed}, ошибок {failed}; продолжить: --start-after {last_key or ""}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Заполнение индекса перцептивных хешей (image_hashes) для изображений, уже лежащих в таблицах каталога.
+URL собираются из category_images, gallery_items, crosses, flowers и products (image_url и gallery_urls),
+уже проиндексированные пропускаются, остальные скачиваются и хешируются в пуле потоков
+(декодирование и resize в Pillow отпускают GIL). В конце — пары почти-дубликатов с таблицами, где они встречаются.
+Запуск: DATABASE_URL=postgresql://... python tools/backfill_image_hashes.py --workers 8 [--max-distance 6]
+"""
+import argparse
+import os
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Optional, Set, Tuple
+
+from harness import load_function
+
+SCHEMA = 't_p78642605_single_page_website_'
+SOURCES: Tuple[Tuple[str, str], ...] = (
+    ('category_images', 'SELECT image_url FROM category_images'),
+    ('gallery_items', "SELECT url FROM gallery_items WHERE type = 'image'"),
+    ('crosses', f'SELECT image_url FROM {SCHEMA}.crosses'),
+    ('flowers', f'SELECT image_url FROM {SCHEMA}.flowers'),
+    ('products', 'SELECT image_url FROM products'),
+    ('products.gallery_urls', 'SELECT unnest(gallery_urls) FROM products'),
+)
+FETCH_TIMEOUT = 15
+COMMIT_EVERY = 50
+
+
+def fetch_and_hash(upload, url: str) -> Tuple[str, Optional[Dict[str, Any]], Optional[str]]:
+    try:
+        with urllib.request.urlopen(url, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(upload.MAX_UPLOAD_BYTES + 1)
+        if len(data) > upload.MAX_UPLOAD_BYTES:
+            return url, None, 'слишком большой файл'
+        return url, upload.perceptual_hashes(data), None
+    except Exception as e:
+        return url, None, str(e)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--max-distance', type=int, default=None)
+    parser.add_argument('--report', type=int, default=50, help='сколько пар почти-дубликатов вывести')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL не задан')
+
+    upload = load_function('upload-image')
+    if not upload.hash_index_available():
+        raise SystemExit('Нужны Pillow и psycopg2')
+    max_distance = upload.NEAR_DUPLICATE_DISTANCE if args.max_distance is None else args.max_distance
+    conn = upload.get_db_connection()
+    cur = conn.cursor()
+
+    sources: Dict[str, Set[str]] = {}
+    for label, sql in SOURCES:
+        cur.execute(sql)
+        for (url,) in cur.fetchall():
+            if url and url.startswith(('http://', 'https://')):
+                sources.setdefault(url, set()).add(label)
+    cur.execute('SELECT url FROM image_hashes')
+    indexed = {url for (url,) in cur.fetchall()}
+    pending = [url for url in sources if url not in indexed]
+    print(f'изображений в таблицах {len(sources)}, уже в индексе {len(sources) - len(pending)}, '
+          f'к обработке {len(pending)}')
+
+    done = failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        for future in as_completed([pool.submit(fetch_and_hash, upload, url) for url in pending]):
+            url, hashes, error = future.result()
+            if hashes is None:
+                failed += 1
+                print(f'  {url}: {error}')
+                continue
+            upload.store_hashes(cur, url, hashes)
+            done += 1
+            if done % COMMIT_EVERY == 0:
+                conn.commit()
+                print(f'  проиндексировано {done}')
+    conn.commit()
+    print(f'проиндексировано {done}, ошибок {failed}')
+
+    pairs = upload.near_duplicate_pairs(cur, max_distance, args.report)
+    print(f'пары почти-дубликатов (dHash <= {max_distance}):')
+    for pair in pairs:
+        where = ' | '.join(','.join(sorted(sources.get(url, {'—'}))) for url in pair['urls'])
+        print(f'  d={pair["distance"]:>2} p={pair["phash_distance"]}  {pair["urls"][0]}  {pair["urls"][1]}  [{where}]')
+    upload.release_db_connection(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Пропускная способность режимов process-image: каждый режим из BLEND_MODES с параметрами
+по умолчанию — отдельно функция режима по полосам и весь конвейер render() с PNG.
+Запуск: python tools/bench_blend_modes.py --size 1200 --repeat 5
+"""
+import argparse
+import io
+import time
+from typing import Callable, List
+
+from PIL import Image
+
+from bench_screen_mode import sample_pixels
+from harness import load_function, percentile
+
+
+def timings(run: Callable[[], object], repeat: int) -> List[float]:
+    run()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    module = load_function('process-image')
+    pixels = sample_pixels(args.size)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, 'RGBA').save(buffer, format='PNG')
+    source = buffer.getvalue()
+    megapixels = args.size * args.size / 1e6
+    strips = [pixels[top:top + module.TILE_ROWS] for top in range(0, args.size, module.TILE_ROWS)]
+
+    print(f'{"режим":<14}{"режим, мс":>11}{"Мпикс/с":>10}{"render, мс":>12}{"Мпикс/с":>10}')
+    for name in sorted(module.BLEND_MODES):
+        mode, params = module.parse_mode({'mode': name})
+        blend = timings(lambda: [module.apply_mode(strip, mode, params) for strip in strips], args.repeat)
+        render = timings(lambda: module.render(source, None, mode, params), args.repeat)
+        blend_ms, render_ms = percentile(blend, 50), percentile(render, 50)
+        print(f'{name:<14}{blend_ms:>11.1f}{megapixels / blend_ms * 1000:>10.1f}'
+              f'{render_ms:>12.1f}{megapixels / render_ms * 1000:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
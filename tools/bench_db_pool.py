@@ -0,0 +1,46 @@
+"""
+Бенчмарк пула соединений: задержка GET /products с пулом и с подключением на каждый запрос.
+Запуск: DATABASE_URL=postgresql://... python tools/bench_db_pool.py --requests 300
+"""
+import argparse
+import os
+import time
+from typing import Any, Dict, List
+
+from harness import load_function, percentile
+
+
+def run(module, requests: int, pool_size: int) -> List[float]:
+    '''Серия вызовов handler с заданным размером пула, задержки в мс'''
+    module.DB_POOL_SIZE = pool_size
+    while module._db_pool:
+        module._discard_db_connection(module._db_pool.pop()[0])
+    event: Dict[str, Any] = {'httpMethod': 'GET', 'path': '/', 'queryStringParameters': {}}
+    module.handler(event, None)
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = module.handler(event, None)
+        samples.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"GET /products вернул {response['statusCode']}: {response['body']}")
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL не задан')
+
+    products = load_function('products')
+    print(f'{"режим":<24}{"p50, мс":>10}{"p99, мс":>10}')
+    for label, pool_size in (('connect на запрос', 0), ('пул соединений', 2)):
+        samples = run(products, args.requests, pool_size)
+        print(f'{label:<24}{percentile(samples, 50):>10.2f}{percentile(samples, 99):>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
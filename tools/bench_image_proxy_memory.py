@@ -0,0 +1,108 @@
+"""
+Проверка пиковой памяти image-proxy: локальный HTTP-сервер отдаёт 50 МБ, handler запускается
+в отдельном процессе, прирост ru_maxrss сравнивается с допустимым. Отдельно проверяются отказ
+по Content-Length и обрыв потока без Content-Length при превышении IMAGE_FETCH_MAX_BYTES.
+Запуск: python tools/bench_image_proxy_memory.py --size-mb 50
+Код выхода 1, если прирост памяти или статус ответа не совпали с ожидаемыми.
+"""
+import argparse
+import http.server
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Any, Dict, Tuple
+
+from harness import load_function
+
+MB = 1024 * 1024
+# body — строка base64 (4/3 от исходника); ещё столько же держат её куски до склейки
+MAX_RSS_RATIO = 3.0
+RSS_SLACK_MB = 16
+
+
+class SourceHandler(http.server.BaseHTTPRequestHandler):
+    '''/sized — с Content-Length, /chunked — без него, до закрытия соединения'''
+
+    size = 0
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        if self.path.startswith('/sized'):
+            self.send_header('Content-Length', str(self.size))
+        self.end_headers()
+        chunk = b'\xff' * MB
+        sent = 0
+        try:
+            while sent < self.size:
+                piece = chunk[:self.size - sent]
+                self.wfile.write(piece)
+                sent += len(piece)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def child(url: str) -> None:
+    '''Вызов handler в чистом процессе: печатает статус, длину body и ru_maxrss до и после, КБ'''
+    module = load_function('image-proxy')
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    response = module.handler({'httpMethod': 'GET', 'queryStringParameters': {'url': url}}, None)
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'status': response['statusCode'], 'body': len(response['body']),
+                      'before': before, 'after': after}))
+
+
+def run(url: str, env: Dict[str, str]) -> Dict[str, Any]:
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--child', url],
+                                     env={**os.environ, **env}, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=50)
+    parser.add_argument('--child')
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    size = args.size_mb * MB
+    SourceHandler.size = size
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SourceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = {'IMAGE_CACHE_DIR': cache_dir, 'IMAGE_CACHE_BACKEND': 'local'}
+        limit_mb = size / MB * MAX_RSS_RATIO + RSS_SLACK_MB
+        cases: Tuple[Tuple[str, str, Dict[str, str], int, float], ...] = (
+            ('50 МБ, miss', f'{base}/sized', {'IMAGE_FETCH_MAX_BYTES': str(size + MB)}, 200, limit_mb),
+            ('50 МБ, из кэша', f'{base}/sized', {'IMAGE_FETCH_MAX_BYTES': str(size + MB)}, 200, limit_mb),
+            ('Content-Length > лимита', f'{base}/sized?big', {'IMAGE_FETCH_MAX_BYTES': str(size // 2)}, 413,
+             RSS_SLACK_MB),
+            ('поток > лимита', f'{base}/chunked', {'IMAGE_FETCH_MAX_BYTES': str(size // 2)}, 413, RSS_SLACK_MB),
+        )
+        print(f'{"случай":<26}{"статус":>8}{"прирост RSS, МБ":>18}{"лимит, МБ":>12}')
+        for label, url, extra, expected_status, max_growth_mb in cases:
+            result = run(url, {**env, **extra})
+            growth_mb = (result['after'] - result['before']) / 1024
+            ok = result['status'] == expected_status and growth_mb <= max_growth_mb
+            failures += not ok
+            print(f'{label:<26}{result["status"]:>8}{growth_mb:>18.1f}{max_growth_mb:>12.0f}'
+                  f'{"" if ok else "  FAIL"}')
+    server.shutdown()
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Бенчмарк сериализации ответов: 10k строк товаров (Decimal, datetime, массивы) через
+json.dumps(default=str), dumps() на stdlib и dumps() на orjson, если он установлен.
+Проверяет, что оба бэкенда dumps() дают одинаковые байты.
+Запуск: python tools/bench_json.py --rows 10000 --repeat 5
+"""
+import argparse
+import datetime
+import json
+import time
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from harness import load_function, percentile
+
+
+def product_rows(count: int) -> List[Dict[str, Any]]:
+    '''Строки в том виде, в каком их отдаёт RealDictCursor для SELECT p.*'''
+    created = datetime.datetime(2024, 5, 1, 12, 30, 15, 123456)
+    return [
+        {
+            'id': i,
+            'category_id': i % 12,
+            'name': f'Памятник из гранита №{i}',
+            'slug': f'pamyatnik-{i}',
+            'description': 'Чёрный гранит, полировка с пяти сторон, гравировка портрета',
+            'price': Decimal('15900.00') + i,
+            'old_price': Decimal('18900.00') if i % 3 else None,
+            'is_price_from': bool(i % 2),
+            'image_url': f'https://cdn.poehali.dev/files/{i:08x}.jpg',
+            'gallery_urls': [f'https://cdn.poehali.dev/files/{i:08x}-{n}.jpg' for n in range(3)],
+            'in_stock': True,
+            'is_featured': i % 10 == 0,
+            'display_order': 999,
+            'material': 'Гранит',
+            'size': '100x50x5',
+            'sku': f'SKU-{i}',
+            'polish': 'пятисторонняя',
+            'metadata': {'weight': 120, 'color': 'black'},
+            'created_at': created + datetime.timedelta(minutes=i),
+            'updated_at': created.date(),
+            'category_name': 'Вертикальные',
+            'category_slug': 'vertical',
+        }
+        for i in range(count)
+    ]
+
+
+def timings(encode: Callable[[Any], Any], data: Any, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(data)
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    products = load_function('products')
+    rows = product_rows(args.rows)
+    fast = products.orjson
+
+    def backend(lib: Any) -> Callable[[Any], str]:
+        def encode(data: Any) -> str:
+            products.orjson = lib
+            return products.dumps(data)
+        return encode
+
+    cases = [
+        ('json.dumps(default=str)', lambda data: json.dumps(data, default=str)),
+        ('dumps, stdlib', backend(None)),
+    ]
+    if fast is not None:
+        if backend(fast)(rows) != backend(None)(rows):
+            raise SystemExit('orjson и stdlib дают разный JSON')
+        cases.append(('dumps, orjson', backend(fast)))
+    else:
+        print('orjson не установлен: сравниваются только stdlib-варианты')
+
+    print(f'{"сериализация":<26}{"p50, мс":>10}{"макс, мс":>10}{"размер, КБ":>12}')
+    for label, encode in cases:
+        samples = timings(encode, rows, args.repeat)
+        size = len(encode(rows).encode('utf-8')) / 1024
+        print(f'{label:<26}{percentile(samples, 50):>10.1f}{max(samples):>10.1f}{size:>12.0f}')
+    products.orjson = fast
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Бенчмарк prepared statements: время планирования и выполнения списка товаров и товара по slug
+для SQL-текста со значениями внутри (как было) и для EXECUTE подготовленного запроса.
+Запуск: DATABASE_URL=postgresql://... python tools/bench_prepared.py --requests 300
+"""
+import argparse
+import json
+import os
+import time
+from typing import Any, Callable, List, Tuple
+
+from harness import load_function, percentile
+
+LITERAL_LIST = """
+    SELECT p.*, c.name as category_name, c.slug as category_slug
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    WHERE 1=1 AND p.is_featured = true
+    ORDER BY p.display_order, p.created_at DESC LIMIT {limit}
+"""
+LITERAL_SLUG = """
+    SELECT p.*, c.name as category_name, c.slug as category_slug
+    FROM products p
+    LEFT JOIN categories c ON p.category_id = c.id
+    WHERE p.slug = '{slug}'
+"""
+
+
+def explain(cursor, sql: str, args: Tuple[Any, ...] = ()) -> Tuple[float, float]:
+    '''Planning Time и Execution Time из EXPLAIN ANALYZE, мс'''
+    cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql, args or None)
+    plan = cursor.fetchone()[0]
+    plan = plan[0] if isinstance(plan, list) else json.loads(plan)[0]
+    return plan['Planning Time'], plan['Execution Time']
+
+
+def measure(requests: int, run: Callable[[int], Tuple[float, float]]) -> Tuple[List[float], List[float]]:
+    planning, total = [], []
+    for i in range(requests):
+        started = time.perf_counter()
+        plan_ms, _ = run(i)
+        total.append((time.perf_counter() - started) * 1000)
+        planning.append(plan_ms)
+    return planning, total
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL не задан')
+
+    products = load_function('products')
+    conn = products.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT slug FROM products ORDER BY id LIMIT 1')
+    row = cursor.fetchone()
+    slug = row[0] if row else 'missing'
+
+    for name in ('product_list', 'product_by_slug'):
+        sql = products.PREPARED_STATEMENTS[name].replace('{columns}', products.PRODUCT_ALL_COLUMNS)
+        cursor.execute(f'PREPARE {name} AS {sql}')
+
+    # Разные значения на каждой итерации: у литерального SQL каждый раз новый текст
+    cases = (
+        ('список, SQL с литералами', lambda i: explain(cursor, LITERAL_LIST.format(limit=100 + i % 50))),
+        ('список, EXECUTE', lambda i: explain(
+            cursor, 'EXECUTE product_list (%s, %s, %s, %s, %s)', (None, None, False, True, 100 + i % 50))),
+        ('по slug, SQL с литералами', lambda i: explain(cursor, LITERAL_SLUG.format(slug=slug))),
+        ('по slug, EXECUTE', lambda i: explain(cursor, 'EXECUTE product_by_slug (%s)', (slug,))),
+    )
+    print(f'{"запрос":<30}{"план p50, мс":>14}{"план p99, мс":>14}{"всего p50, мс":>15}')
+    for label, run in cases:
+        planning, total = measure(args.requests, run)
+        print(f'{label:<30}{percentile(planning, 50):>14.3f}{percentile(planning, 99):>14.3f}'
+              f'{percentile(total, 50):>15.2f}')
+
+    # Запросы подготовлены мимо учёта модуля, поэтому соединение в пул не возвращается
+    products._discard_db_connection(conn)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Бенчмарк режима "Экран" в process-image: прежний путь через float32 и screen_blend на uint8-таблицах.
+Сравнивает время, пик памяти (tracemalloc учитывает буферы numpy) и расхождение результатов
+на RGBA-картинке 1200 px — это максимальный размер после thumbnail в функции.
+Запуск: python tools/bench_screen_mode.py --size 1200 --repeat 10
+Код выхода 1, если uint8-путь не быстрее, не экономнее по памяти или расходится больше чем на 3 уровня.
+"""
+import argparse
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from harness import load_function, percentile
+
+MAX_DEVIATION = 3
+
+
+def float_blend(pixels: np.ndarray) -> np.ndarray:
+    '''Прежняя реализация из process-image (до таблиц), для сравнения'''
+    img_array = np.array(pixels, dtype=np.float32) / 255.0
+    r, g, b = img_array[:, :, 0], img_array[:, :, 1], img_array[:, :, 2]
+    luminance = 0.299 * r + 0.587 * g + 0.114 * b
+    screen_r = 1 - (1 - r) * 0.5
+    screen_g = 1 - (1 - g) * 0.5
+    screen_b = 1 - (1 - b) * 0.5
+    new_a = np.power(luminance, 0.7)
+    result = np.stack([screen_r, screen_g, screen_b, new_a], axis=2)
+    return (result * 255).astype(np.uint8)
+
+
+def sample_pixels(size: int) -> np.ndarray:
+    '''Градиент с шумом: весь диапазон яркостей, как у фото креста на чёрном фоне'''
+    rng = np.random.default_rng(7)
+    ramp = np.linspace(0, 255, size, dtype=np.float32)
+    base = (ramp[None, :] + ramp[:, None]) / 2
+    noise = rng.normal(0, 24, (size, size, 3)).astype(np.float32)
+    rgb = np.clip(base[:, :, None] + noise, 0, 255).astype(np.uint8)
+    return np.dstack([rgb, np.full((size, size), 255, np.uint8)])
+
+
+def measure(blend: Callable[[np.ndarray], np.ndarray], pixels: np.ndarray, repeat: int) -> Tuple[List[float], float]:
+    '''Время вызовов в мс и пик выделенной памяти сверх входа в МБ'''
+    blend(pixels)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        blend(pixels)
+        samples.append((time.perf_counter() - started) * 1000)
+    tracemalloc.start()
+    blend(pixels)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return samples, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1200)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    module = load_function('process-image')
+    pixels = sample_pixels(args.size)
+    deviation = int(np.abs(module.screen_blend(pixels).astype(np.int16) - float_blend(pixels)).max())
+
+    results = {}
+    print(f'{"реализация":<16}{"p50, мс":>10}{"макс, мс":>10}{"пик памяти, МБ":>17}')
+    for label, blend in (('float32', float_blend), ('uint8 + LUT', module.screen_blend)):
+        samples, peak_mb = measure(blend, pixels, args.repeat)
+        results[label] = (percentile(samples, 50), peak_mb)
+        print(f'{label:<16}{percentile(samples, 50):>10.1f}{max(samples):>10.1f}{peak_mb:>17.1f}')
+    (float_ms, float_mb), (lut_ms, lut_mb) = results['float32'], results['uint8 + LUT']
+    print(f'ускорение ×{float_ms / lut_ms:.1f}, память ×{float_mb / lut_mb:.1f}, '
+          f'макс. расхождение {deviation} уровня')
+
+    if lut_ms >= float_ms or lut_mb >= float_mb or deviation > MAX_DEVIATION:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Вынос встроенных base64-картинок (data:image/...;base64,...) из таблиц каталога в хранилище upload-image.
+Строки читаются серверным курсором пачками, каждая data URL загружается через store_upload (ключ —
+SHA-256 содержимого, повторы не дублируются), строка переписывается на URL в транзакции пачки вместе
+со счётчиком catalog_versions. Уже переписанные строки под фильтр не попадают, поэтому прерванный
+запуск продолжается повторным; строку, изменённую админкой после чтения (другой xmin), скрипт не трогает.
+Запуск: DATABASE_URL=postgresql://... AWS_ACCESS_KEY_ID=... AWS_SECRET_ACCESS_KEY=... \\
+        python tools/extract_inline_images.py --batch-size 50 [--tables products,crosses] [--dry-run]
+После запуска место в таблицах освобождает VACUUM (FULL) — скрипт его не выполняет.
+Строки переписываются только на URL бакета (нужны ключи AWS): локальное хранилище upload-image лежит на машине
+оператора, и развёрнутая функция по таким URL ничего не отдаст. --allow-local — если UPLOAD_LOCAL_DIR
+смонтирован и у функции, которая отдаёт файлы.
+"""
+import argparse
+import base64
+import binascii
+import hashlib
+import os
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from harness import load_function
+
+SCHEMA = 't_p78642605_single_page_website_'
+# (таблица в SQL, счётчик catalog_versions, колонка, вид значения); имена — как в функциях, которые их читают
+COLUMNS: Tuple[Tuple[str, Optional[str], str, str], ...] = (
+    (f'{SCHEMA}.monuments', 'monuments', 'image_url', 'text'),
+    (f'{SCHEMA}.crosses', 'crosses', 'image_url', 'text'),
+    (f'{SCHEMA}.flowers', 'flowers', 'image_url', 'text'),
+    ('products', 'products', 'image_url', 'text'),
+    ('products', 'products', 'gallery_urls', 'array'),
+    ('category_images', 'category_images', 'image_url', 'text'),
+    ('gallery_items', 'gallery_items', 'url', 'text'),
+    ('monument_designs', None, 'monument_image', 'text'),
+    ('monument_designs', None, 'elements', 'json'),
+)
+# Запрос выполняется без параметров, поэтому % в LIKE не экранируется
+FILTERS = {
+    'text': "{column} LIKE 'data:%'",
+    'array': "EXISTS (SELECT 1 FROM unnest({column}) AS item WHERE item LIKE 'data:%')",
+    'json': "{column}::text LIKE '%\"data:%'",
+}
+DATA_URL_PATTERN = re.compile(r'^data:(image/[a-z0-9.+-]+);base64,(.*)$', re.S | re.I)
+
+
+def decode_data_url(value: str) -> Optional[Tuple[str, bytes]]:
+    '''MIME-тип и байты из data URL; None — не data URL или битый base64'''
+    match = DATA_URL_PATTERN.match(value.strip())
+    if not match:
+        return None
+    try:
+        return match.group(1).lower(), base64.b64decode(re.sub(r'\s+', '', match.group(2)), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class Extractor:
+    '''Загрузка найденных data URL и счёт вынесенных байт'''
+
+    def __init__(self, upload, dry_run: bool, derivatives: bool):
+        self.upload = upload
+        self.client = None if dry_run else upload.s3_client()
+        self.derivatives = derivatives
+        self.stats: Dict[str, int] = {'images': 0, 'duplicates': 0, 'unsupported': 0, 'bytes_moved': 0}
+
+    def replace(self, value: Any) -> Any:
+        '''URL в хранилище вместо data URL; остальные значения и неподдерживаемые форматы без изменений'''
+        if not isinstance(value, str) or not value.lstrip().startswith('data:'):
+            return value
+        decoded = decode_data_url(value)
+        sniffed = self.upload.sniff_image(decoded[1][:16]) if decoded else None
+        if sniffed is None:
+            # svg+xml, bmp и прочее, что upload-image не принимает, остаётся как есть
+            self.stats['unsupported'] += 1
+            return value
+        data = decoded[1]
+        extension = 'jpg' if sniffed == 'jpeg' else sniffed
+        self.stats['images'] += 1
+        self.stats['bytes_moved'] += len(value.encode('utf-8'))
+        if self.client is None:
+            return self.upload.public_url(self.upload.content_key(hashlib.sha256(data).hexdigest(), extension))
+        key, duplicate = self.upload.store_upload(self.client, data, extension)
+        self.stats['duplicates'] += duplicate
+        if self.derivatives:
+            self.upload.safe_derivatives(self.client, key, data)
+        return self.upload.public_url(key)
+
+    def rewrite(self, value: Any, kind: str) -> Any:
+        if kind == 'array':
+            return [self.replace(item) for item in value] if value else value
+        if kind == 'json':
+            return walk_json(value, self.replace)
+        return self.replace(value)
+
+
+def walk_json(value: Any, replace: Callable[[Any], Any]) -> Any:
+    if isinstance(value, dict):
+        return {key: walk_json(item, replace) for key, item in value.items()}
+    if isinstance(value, list):
+        return [walk_json(item, replace) for item in value]
+    return replace(value)
+
+
+def bump_catalog_version(cur, table: str) -> None:
+    cur.execute(
+        """
+        INSERT INTO catalog_versions (table_name) VALUES (%s)
+        ON CONFLICT (table_name) DO UPDATE SET version = catalog_versions.version + 1, updated_at = NOW()
+        """,
+        (table,)
+    )
+
+
+def extract_column(read_conn, write_conn, extractor: Extractor, spec: Tuple[str, Optional[str], str, str],
+                   batch_size: int, limit: int, dry_run: bool) -> Dict[str, int]:
+    '''Один проход по колонке: серверный курсор на чтение, запись и commit по пачкам'''
+    from psycopg2.extras import Json
+
+    table, version_name, column, kind = spec
+    counts = {'rows': 0, 'rewritten': 0, 'conflicts': 0}
+    where = FILTERS[kind].format(column=column)
+    # Именованный курсор держит выборку на сервере: в памяти не больше одной пачки многомегабайтных строк
+    with read_conn.cursor(name=f'extract_{table.rsplit(".", 1)[-1]}_{column}') as reader:
+        reader.itersize = batch_size
+        reader.execute(f'SELECT id, xmin::text, {column} FROM {table} WHERE {where} ORDER BY id')
+        while not limit or counts['rewritten'] < limit:
+            rows = reader.fetchmany(batch_size)
+            if not rows:
+                break
+            updates: List[Tuple[Any, int, str]] = []
+            for row_id, xmin, value in rows:
+                counts['rows'] += 1
+                rewritten = extractor.rewrite(value, kind)
+                if rewritten != value:
+                    updates.append((Json(rewritten) if kind == 'json' else rewritten, row_id, xmin))
+            if dry_run or not updates:
+                counts['rewritten'] += len(updates)
+                continue
+            with write_conn.cursor() as writer:
+                for new_value, row_id, xmin in updates:
+                    writer.execute(
+                        f'UPDATE {table} SET {column} = %s WHERE id = %s AND xmin::text = %s',
+                        (new_value, row_id, xmin)
+                    )
+                    counts['rewritten'] += writer.rowcount
+                    counts['conflicts'] += 1 - writer.rowcount
+                if version_name:
+                    bump_catalog_version(writer, version_name)
+            write_conn.commit()
+            print(f'  {table}.{column}: до id={rows[-1][0]} переписано {counts["rewritten"]}')
+    read_conn.commit()
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--tables', default='', help='через запятую; по умолчанию все из COLUMNS')
+    parser.add_argument('--limit', type=int, default=0, help='строк на колонку за запуск, 0 — без ограничения')
+    parser.add_argument('--derivatives', action='store_true', help='сразу строить превью upload-image')
+    parser.add_argument('--dry-run', action='store_true', help='только посчитать, без загрузки и UPDATE')
+    parser.add_argument('--allow-local', action='store_true',
+                        help='разрешить UPLOAD_STORAGE=local: каталог должен быть общим с развёрнутой upload-image')
+    args = parser.parse_args()
+
+    if not os.environ.get('DATABASE_URL'):
+        raise SystemExit('DATABASE_URL не задан')
+    import psycopg2
+
+    upload = load_function('upload-image')
+    backend = upload.storage_backend()
+    if not args.dry_run and backend != 's3' and not (backend == 'local' and args.allow_local):
+        # data URL в строке — единственная копия картинки: переписывать её на недоступное функции хранилище нельзя
+        raise SystemExit(f'хранилище {backend or "не настроено"}: нужны AWS_ACCESS_KEY_ID и AWS_SECRET_ACCESS_KEY '
+                         f'(или UPLOAD_STORAGE=local с общим UPLOAD_LOCAL_DIR и --allow-local)')
+    extractor = Extractor(upload, args.dry_run, args.derivatives)
+    wanted = {name.strip() for name in args.tables.split(',') if name.strip()}
+    specs = [spec for spec in COLUMNS if not wanted or spec[0].rsplit('.', 1)[-1] in wanted]
+
+    read_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    read_conn.set_session(readonly=True)
+    write_conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    print(f'хранилище: {backend}{", dry run" if args.dry_run else ""}')
+    print(f'{"колонка":<40}{"строк":>8}{"переписано":>12}{"конфликтов":>12}')
+    try:
+        for spec in specs:
+            counts = extract_column(read_conn, write_conn, extractor, spec, args.batch_size, args.limit, args.dry_run)
+            label = f'{spec[0].rsplit(".", 1)[-1]}.{spec[2]}'
+            print(f'{label:<40}{counts["rows"]:>8}{counts["rewritten"]:>12}{counts["conflicts"]:>12}')
+    finally:
+        read_conn.close()
+        write_conn.close()
+    stats = extractor.stats
+    print(f'картинок {stats["images"]} (повторов {stats["duplicates"]}), '
+          f'неподдерживаемых {stats["unsupported"]}, вынесено из строк {stats["bytes_moved"] / 1024 / 1024:.1f} МБ')
+
+
+if __name__ == '__main__':
+    main()
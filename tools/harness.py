@@ -0,0 +1,526 @@
+"""
+Локальный прогон backend-функций: импортирует backend/<name>/index.py:handler в процессе,
+поднимает PostgreSQL из db_migrations/V*.sql и подменяет Telegram, SMTP и S3 локальными заглушками.
+
+Проверка фикстур tests.json:
+    python tools/harness.py
+Нагрузочный режим (throughput и p50/p95/p99 по каждому эндпоинту):
+    python tools/harness.py --load 200 --json report.json
+    python tools/harness.py --load 200 --baseline report.json --max-regression 0.25
+
+Без DATABASE_URL харнесс сам запускает временный кластер через initdb/pg_ctl
+(ищет их в PG_BIN или PATH); postgres не запускается от root.
+"""
+import argparse
+import base64
+import contextlib
+import datetime
+import email.message
+import email.parser
+import email.policy
+import glob
+import importlib.util
+import io
+import json
+import os
+import shutil
+import smtplib
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import urllib.response
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'db_migrations')
+DB_SCHEMA = 't_p78642605_single_page_website_'
+
+LOCAL_ENV = {
+    'JWT_SECRET': 'local-jwt-secret',
+    'TELEGRAM_NEW_BOT_TOKEN': 'local-bot-token',
+    'TELEGRAM_NEW_CHAT_ID': '-1000000000000',
+    'SMTP_HOST': 'smtp.local',
+    'SMTP_PORT': '465',
+    'SMTP_USER': 'robot@local',
+    'SMTP_PASSWORD': 'local',
+    'EMAIL_TO': 'owner@local',
+    'AWS_ACCESS_KEY_ID': 'local-access-key',
+    'AWS_SECRET_ACCESS_KEY': 'local-secret-key',
+}
+
+
+def load_function(name: str):
+    '''Импорт backend/<name>/index.py как отдельного модуля (каталоги с дефисом не импортируются обычным import)'''
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f'backend_{name.replace("-", "_")}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ---------------------------------------------------------------------------
+# PostgreSQL
+
+class LocalPostgres:
+    '''Временный кластер PostgreSQL с применёнными миграциями'''
+
+    def __init__(self, database_url: Optional[str] = None):
+        self.database_url = database_url
+        self.data_dir: Optional[str] = None
+        self.pg_bin = os.environ.get('PG_BIN', '')
+
+    def _tool(self, name: str) -> str:
+        path = os.path.join(self.pg_bin, name) if self.pg_bin else shutil.which(name)
+        if not path or not os.path.exists(path):
+            raise SystemExit(f'{name} не найден: задайте DATABASE_URL или PG_BIN')
+        return path
+
+    def __enter__(self) -> 'LocalPostgres':
+        if self.database_url:
+            return self
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        self.data_dir = tempfile.mkdtemp(prefix='harness-pg-')
+        subprocess.run(
+            [self._tool('initdb'), '-D', self.data_dir, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8', '--no-locale'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        subprocess.run(
+            [self._tool('pg_ctl'), '-D', self.data_dir, '-w', '-l', os.path.join(self.data_dir, 'server.log'),
+             '-o', f'-p {port} -k {self.data_dir} -c fsync=off', 'start'],
+            check=True, stdout=subprocess.DEVNULL
+        )
+        self.database_url = f'postgresql://postgres@127.0.0.1:{port}/postgres'
+        self.migrate()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.data_dir:
+            subprocess.run([self._tool('pg_ctl'), '-D', self.data_dir, '-m', 'immediate', 'stop'],
+                           stdout=subprocess.DEVNULL)
+            shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def migrate(self) -> None:
+        '''Схема проекта и все V*.sql по порядку; упавшая миграция не останавливает остальные'''
+        import psycopg2
+
+        conn = psycopg2.connect(self.database_url)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute(f'CREATE SCHEMA IF NOT EXISTS {DB_SCHEMA}')
+        cur.execute(f'ALTER DATABASE postgres SET search_path = {DB_SCHEMA}, public')
+        cur.execute(f'SET search_path = {DB_SCHEMA}, public')
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, 'V*.sql'))):
+            with open(path, encoding='utf-8') as f:
+                sql = f.read()
+            try:
+                cur.execute('BEGIN')
+                cur.execute(sql)
+                cur.execute('COMMIT')
+            except psycopg2.Error as e:
+                cur.execute('ROLLBACK')
+                print(f'  ! {os.path.basename(path)}: {str(e).strip().splitlines()[0]}')
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Заглушки внешних сервисов
+
+class LocalS3:
+    '''In-memory замена boto3 S3-клиента; объекты отдаются через заглушку CDN,
+    presigned POST принимает заглушка bucket.local (как MinIO за адресом из generate_presigned_post)'''
+
+    objects: Dict[Tuple[str, str], Tuple[bytes, str]] = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, ContentType: str = 'binary/octet-stream', **kwargs):
+        data = Body.read() if hasattr(Body, 'read') else bytes(Body)
+        self.objects[(Bucket, Key)] = (data, ContentType)
+        return {'ETag': f'"{hash(data) & 0xffffffff:08x}"'}
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, **kwargs):
+        data, content_type = self._get(Bucket, Key)
+        if Range:
+            start, _, end = Range.replace('bytes=', '').partition('-')
+            data = data[int(start):int(end) + 1 if end else None]
+        return {'Body': io.BytesIO(data), 'ContentType': content_type, 'ContentLength': len(data)}
+
+    def head_object(self, Bucket: str, Key: str, **kwargs):
+        data, content_type = self._get(Bucket, Key)
+        return {'ContentType': content_type, 'ContentLength': len(data)}
+
+    def copy_object(self, Bucket: str, Key: str, CopySource: Dict[str, str], **kwargs):
+        data, content_type = self._get(CopySource['Bucket'], CopySource['Key'])
+        self.objects[(Bucket, Key)] = (data, kwargs.get('ContentType', content_type))
+        return {'CopyObjectResult': {'ETag': f'"{hash(data) & 0xffffffff:08x}"'}}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs):
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = '', **kwargs):
+        now = datetime.datetime.now(datetime.timezone.utc)
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        return {'Contents': [{'Key': key, 'LastModified': now} for key in keys], 'IsTruncated': False}
+
+    def generate_presigned_post(self, Bucket: str, Key: str, Fields: Optional[Dict[str, str]] = None,
+                                Conditions: Optional[List[Any]] = None, ExpiresIn: int = 3600) -> Dict[str, Any]:
+        # Политика не подписывается: заглушка бакета только проверяет по ней условия
+        policy = json.dumps({'conditions': [*(Conditions or []), {'key': Key}]})
+        return {'url': f'https://bucket.local/{Bucket}',
+                'fields': {**(Fields or {}), 'key': Key, 'policy': base64.b64encode(policy.encode()).decode()}}
+
+    def _get(self, bucket: str, key: str) -> Tuple[bytes, str]:
+        if (bucket, key) not in self.objects:
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': key}}, 'GetObject')
+        return self.objects[(bucket, key)]
+
+
+class LocalSMTP:
+    '''Замена smtplib.SMTP / SMTP_SSL, письма складываются в outbox'''
+
+    outbox: List[Dict[str, Any]] = []
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def ehlo(self, *args):
+        return 250, b'ok'
+
+    def starttls(self, *args, **kwargs):
+        return 220, b'ok'
+
+    def login(self, *args):
+        return 235, b'ok'
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        self.outbox.append({'from': from_addr, 'to': to_addrs, 'size': len(msg)})
+        return {}
+
+    def send_message(self, msg, *args, **kwargs):
+        return self.sendmail(msg['From'], msg['To'], msg.as_bytes())
+
+    def quit(self):
+        return 221, b'bye'
+
+
+def placeholder_image() -> Tuple[bytes, str]:
+    '''Тестовая картинка для заглушки CDN (градиент 256×256, если есть Pillow)'''
+    try:
+        from PIL import Image
+        import numpy as np
+        ramp = np.linspace(0, 255, 256, dtype=np.uint8)
+        pixels = np.dstack([np.tile(ramp, (256, 1)), np.tile(ramp[:, None], (1, 256)),
+                            np.full((256, 256), 128, np.uint8)])
+        buffer = io.BytesIO()
+        Image.fromarray(pixels, 'RGB').save(buffer, format='PNG')
+        return buffer.getvalue(), 'image/png'
+    except ImportError:
+        return bytes.fromhex(
+            '89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+            '1f15c4890000000d49444154789c63f8cf00000301010018dd8db00000000049454e44ae426082'
+        ), 'image/png'
+
+
+def fake_http(method: str, url: str, data: Optional[bytes] = None,
+              headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    '''Ответы локальных заглушек Telegram, CDN и presigned POST в бакет; прочие хосты недоступны'''
+    parsed = urllib.parse.urlparse(url)
+    if parsed.hostname == 'bucket.local' and method == 'POST':
+        return bucket_post(parsed.path.lstrip('/'), data or b'', headers or {})
+    if parsed.hostname == 'api.telegram.org':
+        payload = {'ok': True, 'result': {'message_id': int(time.time() * 1000) % 10 ** 9}}
+        return 200, {'Content-Type': 'application/json'}, json.dumps(payload).encode()
+    if parsed.hostname and parsed.hostname.endswith('poehali.dev') and method == 'GET':
+        key = parsed.path.rsplit('/', 1)[-1]
+        for (bucket, stored_key), (body, content_type) in LocalS3.objects.items():
+            if stored_key == key or parsed.path.endswith('/' + stored_key):
+                return 200, {'Content-Type': content_type, 'Content-Length': str(len(body))}, body
+        body, content_type = placeholder_image()
+        return 200, {'Content-Type': content_type, 'Content-Length': str(len(body))}, body
+    raise urllib.error.URLError(f'network disabled in harness: {url}')
+
+
+def bucket_post(bucket: str, data: bytes, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+    '''multipart/form-data по presigned POST: поля формы сверяются с условиями политики, как в S3'''
+    content_type = {k.lower(): v for k, v in headers.items()}.get('content-type', '')
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + data)
+    form: Dict[str, bytes] = {}
+    for part in message.iter_parts():
+        form[part.get_param('name', header='content-disposition')] = part.get_payload(decode=True) or b''
+    fields = {name: value.decode('utf-8', 'replace') for name, value in form.items() if name != 'file'}
+    body = form.get('file')
+    if body is None or 'policy' not in fields:
+        return 400, {'Content-Type': 'application/xml'}, b'<Error><Code>InvalidArgument</Code></Error>'
+    for condition in json.loads(base64.b64decode(fields['policy']))['conditions']:
+        if isinstance(condition, dict):
+            if any(fields.get(name) != value for name, value in condition.items()):
+                return 403, {'Content-Type': 'application/xml'}, b'<Error><Code>AccessDenied</Code></Error>'
+        elif condition[0] == 'content-length-range' and not condition[1] <= len(body) <= condition[2]:
+            return 400, {'Content-Type': 'application/xml'}, b'<Error><Code>EntityTooLarge</Code></Error>'
+    LocalS3.objects[(bucket, fields['key'])] = (body, fields.get('Content-Type', 'binary/octet-stream'))
+    return 204, {}, b''
+
+
+def install_stand_ins() -> None:
+    '''Подмена внешних сервисов на время прогона'''
+    for key, value in LOCAL_ENV.items():
+        os.environ.setdefault(key, value)
+
+    def urlopen(req, data=None, timeout=None, **kwargs):
+        url = req.full_url if isinstance(req, urllib.request.Request) else req
+        method = req.get_method() if isinstance(req, urllib.request.Request) else ('POST' if data else 'GET')
+        request_headers = dict(req.header_items()) if isinstance(req, urllib.request.Request) else {}
+        status, headers, body = fake_http(method, url, data if data is not None else getattr(req, 'data', None),
+                                          request_headers)
+        message = email.message.Message()
+        for name, value in headers.items():
+            message[name] = value
+        return urllib.response.addinfourl(io.BytesIO(body), message, url, status)
+
+    urllib.request.urlopen = urlopen
+    smtplib.SMTP = LocalSMTP
+    smtplib.SMTP_SSL = LocalSMTP
+
+    try:
+        import requests
+
+        def request(method, url, **kwargs):
+            try:
+                status, headers, body = fake_http(method.upper(), url, kwargs.get('data'), kwargs.get('headers'))
+            except urllib.error.URLError as e:
+                raise requests.exceptions.ConnectionError(str(e.reason))
+            response = requests.models.Response()
+            response.status_code = status
+            response.headers.update(headers)
+            response._content = body
+            response.url = url
+            return response
+
+        requests.api.request = request
+    except ImportError:
+        pass
+
+    try:
+        import boto3
+        boto3.client = lambda *args, **kwargs: LocalS3()
+    except ImportError:
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Фикстуры
+
+class Context:
+    def __init__(self, function_name: str):
+        self.request_id = 'harness'
+        self.function_name = function_name
+
+
+def build_event(fixture: Dict[str, Any]) -> Dict[str, Any]:
+    '''Событие API Gateway из записи tests.json'''
+    raw_path = fixture.get('path', '/')
+    parsed = urllib.parse.urlsplit(raw_path)
+    params = dict(urllib.parse.parse_qsl(parsed.query))
+    params.update(fixture.get('queryStringParameters') or {})
+    body = fixture.get('body')
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    return {
+        'httpMethod': fixture.get('method', 'GET'),
+        'path': parsed.path or '/',
+        'queryStringParameters': params,
+        'headers': dict(fixture.get('headers') or {}),
+        'body': body,
+        'isBase64Encoded': False,
+    }
+
+
+TYPE_NAMES = {'string': str, 'number': (int, float), 'boolean': bool, 'array': list, 'object': dict}
+
+
+def body_matches(expected: Any, actual: Any, matcher: str) -> bool:
+    if matcher == 'type':
+        return type(expected) is type(actual)
+    if isinstance(expected, str) and expected in TYPE_NAMES:
+        return isinstance(actual, TYPE_NAMES[expected])
+    if matcher == 'partial' and isinstance(expected, dict):
+        return isinstance(actual, dict) and all(
+            key in actual and body_matches(value, actual[key], matcher) for key, value in expected.items()
+        )
+    return expected == actual
+
+
+def check(fixture: Dict[str, Any], response: Dict[str, Any]) -> Optional[str]:
+    '''None если ответ совпал с фикстурой, иначе описание расхождения'''
+    status = response.get('statusCode')
+    if status != fixture.get('expectedStatus', 200):
+        return f"status {status}, ожидался {fixture.get('expectedStatus', 200)}: {str(response.get('body'))[:200]}"
+    if 'expectedBody' not in fixture:
+        return None
+    try:
+        actual = json.loads(response.get('body') or 'null')
+    except ValueError:
+        return 'тело ответа не JSON'
+    if not body_matches(fixture['expectedBody'], actual, fixture.get('bodyMatcher', 'exact')):
+        return f"тело не совпало: {str(response.get('body'))[:200]}"
+    return None
+
+
+def discover(only: List[str]) -> List[Tuple[str, List[Dict[str, Any]]]]:
+    '''Все функции с index.py, в том числе без tests.json: каждая хотя бы импортируется'''
+    suites = []
+    for path in sorted(glob.glob(os.path.join(BACKEND_DIR, '*', 'index.py'))):
+        name = os.path.basename(os.path.dirname(path))
+        if only and name not in only:
+            continue
+        fixtures_path = os.path.join(os.path.dirname(path), 'tests.json')
+        fixtures = []
+        if os.path.exists(fixtures_path):
+            with open(fixtures_path, encoding='utf-8') as f:
+                fixtures = json.load(f).get('tests', [])
+        suites.append((name, fixtures))
+    return suites
+
+
+VERBOSE = False
+
+
+def call(module, name: str, fixture: Dict[str, Any]) -> Dict[str, Any]:
+    '''Вызов handler; отладочный вывод функции глушится без --verbose'''
+    if VERBOSE:
+        return module.handler(build_event(fixture), Context(name))
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        return module.handler(build_event(fixture), Context(name))
+
+
+def replay(suites) -> Tuple[int, int]:
+    passed = failed = 0
+    for name, fixtures in suites:
+        # Сломанный импорт (NameError, синтаксис, нет зависимости) — отдельный провал, а не падение прогона
+        try:
+            module = load_function(name)
+        except Exception as e:
+            print(f'FAIL {name}: импорт — {type(e).__name__}: {e}')
+            failed += 1
+            continue
+        for fixture in fixtures:
+            try:
+                problem = check(fixture, call(module, name, fixture))
+            except Exception as e:
+                problem = f'{type(e).__name__}: {e}'
+            mark = 'ok  ' if problem is None else 'FAIL'
+            print(f"{mark} {name}: {fixture.get('name')}" + (f' — {problem}' if problem else ''))
+            passed, failed = (passed + 1, failed) if problem is None else (passed, failed + 1)
+    return passed, failed
+
+
+def load(suites, iterations: int) -> Dict[str, Dict[str, float]]:
+    '''Повторяет каждую фикстуру iterations раз на тёплом модуле'''
+    report = {}
+    print(f'\n{"эндпоинт":<60}{"req/s":>9}{"p50":>9}{"p95":>9}{"p99":>9}  (мс)')
+    for name, fixtures in suites:
+        try:
+            module = load_function(name)
+        except Exception:
+            continue
+        for fixture in fixtures:
+            key = f"{name}: {fixture.get('name')}"
+            try:
+                problem = check(fixture, call(module, name, fixture))
+            except Exception as e:
+                problem = f'{type(e).__name__}: {e}'
+            if problem:
+                print(f'{key[:59]:<60} пропущен: фикстура не проходит')
+                continue
+            samples = []
+            started = time.perf_counter()
+            for _ in range(iterations):
+                t0 = time.perf_counter()
+                call(module, name, fixture)
+                samples.append((time.perf_counter() - t0) * 1000)
+            elapsed = time.perf_counter() - started
+            stats = {
+                'rps': iterations / elapsed if elapsed else 0.0,
+                'p50': percentile(samples, 50),
+                'p95': percentile(samples, 95),
+                'p99': percentile(samples, 99),
+            }
+            report[key] = stats
+            print(f"{key[:59]:<60}{stats['rps']:>9.1f}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['p99']:>9.2f}")
+    return report
+
+
+def compare(report: Dict[str, Dict[str, float]], baseline_path: str, max_regression: float) -> int:
+    '''Число эндпоинтов, у которых p95 вырос больше допустимого относительно baseline'''
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = 0
+    for key, stats in report.items():
+        before = baseline.get(key)
+        if not before or not before.get('p95'):
+            continue
+        growth = stats['p95'] / before['p95'] - 1
+        if growth > max_regression:
+            regressions += 1
+            print(f"REGRESSION {key}: p95 {before['p95']:.2f} → {stats['p95']:.2f} мс (+{growth:.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Локальный прогон tests.json и нагрузочный режим')
+    parser.add_argument('functions', nargs='*', help='имена функций из backend/ (по умолчанию все)')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--load', type=int, default=0, metavar='N', help='повторов каждой фикстуры')
+    parser.add_argument('--json', metavar='PATH', help='сохранить отчёт нагрузки')
+    parser.add_argument('--baseline', metavar='PATH', help='сравнить с сохранённым отчётом')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    parser.add_argument('--verbose', action='store_true', help='показывать вывод функций')
+    args = parser.parse_args()
+
+    global VERBOSE
+    VERBOSE = args.verbose
+    sys.dont_write_bytecode = True
+    install_stand_ins()
+    with LocalPostgres(args.database_url) as pg:
+        os.environ['DATABASE_URL'] = pg.database_url
+        suites = discover(args.functions)
+        passed, failed = replay(suites)
+        print(f'\n{passed} passed, {failed} failed')
+
+        exit_code = 1 if failed else 0
+        if args.load:
+            report = load(suites, args.load)
+            if args.json:
+                with open(args.json, 'w', encoding='utf-8') as f:
+                    json.dump(report, f, ensure_ascii=False, indent=2)
+            if args.baseline and compare(report, args.baseline, args.max_regression):
+                exit_code = 1
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()